@@ -0,0 +1,136 @@
+"""Time read classification (get_reads + filter_reads) on a synthetic deletion
+with increasing numbers of supporting reads. With O(1) read-evidence lookups the
+time per supporting read should stay roughly constant as the locus gets deeper"""
+import os, sys
+sys.dont_write_bytecode = True
+import shutil
+import tempfile
+import time
+from optparse import OptionParser, Values
+
+import pysam
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from svSupport.getReads import get_reads
+from svSupport.filterReads import filter_reads
+from svSupport.regionReads import RegionReads
+from svSupport.readEvidence import ReadEvidence
+
+chrom = '3L'
+bp1 = 1000000
+bp2 = 1010000
+read_length = 100
+
+
+def make_read(name, flag, start, cigar, mate_start):
+    read = pysam.AlignedSegment()
+    read.query_name = name
+    read.flag = flag
+    read.reference_id = 0
+    read.reference_start = start
+    read.mapping_quality = 60
+    read.cigartuples = cigar
+    read.next_reference_id = 0
+    read.next_reference_start = mate_start
+    read.template_length = mate_start - start if start < mate_start else start - mate_start
+    read.query_sequence = 'A' * read_length
+    read.query_qualities = pysam.qualitystring_to_array('I' * read_length)
+    return read
+
+
+def synthetic_deletion(out_dir, n):
+    """Write a bam with `n` discordant pairs and n/5 split reads at each breakpoint of
+       a deletion at 3L:bp1-bp2, plus n/5 pairs spanning each breakpoint (opposing)"""
+    header = {'HD': {'VN': '1.5', 'SO': 'coordinate'},
+              'SQ': [{'SN': chrom, 'LN': 28110227}]}
+    reads = []
+    for k in range(n):
+        start = bp1 - 350 + (k % 250)
+        mate_start = bp2 + 50 + (k // 250) % 250
+        reads.append(make_read('disc_%s' % k, 97, start, [(0, 100)], mate_start))
+        reads.append(make_read('disc_%s' % k, 145, mate_start, [(0, 100)], start))
+
+    for k in range(n // 5):
+        mate_start = bp1 - 400 - k
+        reads.append(make_read('split1_%s' % k, 147, bp1 - 60, [(0, 60), (4, 40)], mate_start))
+        reads.append(make_read('split1_%s' % k, 99, mate_start, [(0, 100)], bp1 - 60))
+        mate_start = bp2 + 300 + k
+        reads.append(make_read('split2_%s' % k, 83, bp2 - 1, [(4, 40), (0, 60)], mate_start))
+        reads.append(make_read('split2_%s' % k, 163, mate_start, [(0, 100)], bp2 - 1))
+        for bp in bp1, bp2:
+            start = bp - 50 - (k % 40)
+            name = 'span_%s_%s' % (bp, k)
+            reads.append(make_read(name, 99, start, [(0, 100)], start + 200 + k))
+            reads.append(make_read(name, 147, start + 200 + k, [(0, 100)], start))
+
+    reads.sort(key=lambda r: r.reference_start)
+    bam = os.path.join(out_dir, 'synthetic.bam')
+    with pysam.AlignmentFile(bam, 'wb', header=header) as out:
+        for read in reads:
+            out.write(read)
+    pysam.index(bam)
+    return bam
+
+
+def classify(bam, out_dir):
+    options = Values({'out_dir': out_dir, 'debug': False, 'slop': 500, 'chromfile': None,
+                      'counts_only': False, 'sample_bams': False, 'writers': {}})
+    regions = RegionReads(pysam.AlignmentFile(bam), [(chrom, bp1 - 1000, bp1 + 1000), (chrom, bp2 - 1000, bp2 + 1000)])
+    supporting, opposing = ReadEvidence(), ReadEvidence()
+
+    start = time.time()
+    bp1_reads = get_reads(regions, 'bp1', chrom, chrom, bp1, bp2, options, [], [chrom], supporting, opposing)
+    bp2_reads = get_reads(regions, 'bp2', chrom, chrom, bp2, bp1, options, [], [chrom], supporting, opposing)
+    get_reads_time = time.time() - start
+
+    read_tags = dict(bp1_reads[-1])
+    read_tags.update(bp2_reads[-1])
+
+    start = time.time()
+    clean_bam, supporting, disc_support, split_support = filter_reads(regions, bp1, bp2, chrom, chrom, 'DEL', options, supporting, opposing, 'r_bp1', 'bp2_r', read_tags)
+    filter_reads_time = time.time() - start
+
+    return get_reads_time, filter_reads_time, len(disc_support), len(split_support), len(opposing)
+
+
+def get_args():
+    parser = OptionParser()
+    parser.add_option("-n",
+                      "--max_reads",
+                      dest="max_reads",
+                      action="store",
+                      type="int",
+                      help="Largest number of discordant pairs to simulate [Default: 5000]")
+    parser.add_option("-s",
+                      "--steps",
+                      dest="steps",
+                      action="store",
+                      type="int",
+                      help="Number of doublings to time up to max_reads [Default: 4]")
+    parser.set_defaults(max_reads=5000, steps=4)
+    return parser.parse_args()
+
+
+def main():
+    options, args = get_args()
+    out_dir = tempfile.mkdtemp()
+    stdout = sys.stdout
+    print("reads\tdisc\tsplit\topposing\tget_reads_s\tfilter_reads_s\tget_reads_us_per_read\tfilter_reads_us_per_read")
+    try:
+        for step in reversed(range(options.steps)):
+            n = options.max_reads // 2 ** step
+            bam = synthetic_deletion(out_dir, n)
+            sys.stdout = open(os.devnull, 'w')
+            try:
+                get_reads_time, filter_reads_time, disc, split, oppose = classify(bam, out_dir)
+            finally:
+                sys.stdout.close()
+                sys.stdout = stdout
+            print("%s\t%s\t%s\t%s\t%.3f\t%.3f\t%.1f\t%.1f" % (n, disc, split, oppose, get_reads_time, filter_reads_time,
+                                                            1e6 * get_reads_time / n, 1e6 * filter_reads_time / n))
+    finally:
+        shutil.rmtree(out_dir)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,174 @@
+"""Benchmark how quickly svSupport starts up for a single variant, as run by tools that call it
+once per locus. Each measurement is taken in a fresh interpreter:
+  python      - starting python and exiting, for reference
+  import      - importing the command line module (svSupport/svSupport.py)
+  first_fetch - importing it, parsing the arguments of a single variant run and fetching the
+                first read of the variant from its bam
+  cli         - running svSupport.py on the variant from start to finish
+The modules loaded by the import are checked too, as the single variant path shouldn't load
+pandas. Results can be saved as a baseline, and later runs compared against it"""
+import os, sys
+sys.dont_write_bytecode = True
+import json
+import shutil
+import subprocess
+import tempfile
+import time
+from optparse import OptionParser
+
+repo = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+package = os.path.join(repo, 'svSupport')
+
+bam = os.path.join(repo, 'data', 'R3_del.bam')
+region = 'X:3135326-3139096'
+args = ['-i', bam, '-l', region, '-f', '-s', '500', '--chromosomes', os.path.join(repo, 'chrom_lengths.txt'),
+        '--non_native_chromosomes', os.path.join(repo, 'non_native_chroms.txt')]
+
+# Modules that single variant runs shouldn't need
+batch_modules = ['pandas', 'numpy', 'parseConfig']
+
+measures = ['python', 'import', 'first_fetch', 'cli']
+
+import_code = '''
+import sys, time, json
+start = time.time()
+sys.path.insert(0, %r)
+import svSupport
+took = time.time() - start
+json.dump({'seconds': took, 'modules': sorted(sys.modules)}, sys.stdout)
+'''
+
+first_fetch_code = '''
+import sys, time, json
+start = time.time()
+sys.path.insert(0, %r)
+import svSupport
+from getArgs import get_args
+from bamPool import open_bam
+from worker import getCooridinates
+options, _ = get_args(%r)
+chrom1, bp1, chrom2, bp2 = getCooridinates(options.region)
+read = next(open_bam(options.in_file).fetch(chrom1, bp1, bp2))
+json.dump({'seconds': time.time() - start}, sys.stdout)
+'''
+
+
+def run_python(code):
+    """Run code in a new interpreter, returning the json it writes to stdout"""
+    return json.loads(subprocess.check_output([sys.executable, '-c', code]))
+
+
+def time_python():
+    start = time.time()
+    subprocess.check_call([sys.executable, '-c', 'pass'])
+    return time.time() - start
+
+
+def time_cli():
+    out_dir = tempfile.mkdtemp()
+    try:
+        with open(os.devnull, 'w') as devnull:
+            start = time.time()
+            subprocess.check_call([sys.executable, os.path.join(package, 'svSupport.py')] + args + ['-o', out_dir],
+                                  stdout=devnull, stderr=devnull)
+            return time.time() - start
+    finally:
+        shutil.rmtree(out_dir)
+
+
+def benchmark(repeats):
+    """Take each measurement `repeats` times, keeping the fastest"""
+    timings = dict((measure, []) for measure in measures)
+    modules = []
+    for i in range(repeats):
+        timings['python'].append(time_python())
+        imported = run_python(import_code % package)
+        timings['import'].append(imported['seconds'])
+        modules = imported['modules']
+        timings['first_fetch'].append(run_python(first_fetch_code % (package, args + ['-o', tempfile.gettempdir()]))['seconds'])
+        timings['cli'].append(time_cli())
+
+    results = dict((measure, {'wall': min(times)}) for measure, times in timings.items())
+    results['batch_modules'] = [module for module in batch_modules if module in modules]
+    return results
+
+
+def report(results, baseline, options):
+    """Print the timings, and compare them to the baseline if there is one.
+       Returns the number of regressions found"""
+    regressions = 0
+    print("measure\twall_ms\tbaseline_ms\tchange")
+    for measure in measures:
+        timing = results[measure]
+        base = baseline.get(measure)
+        line = [measure, "%.1f" % (1000 * timing['wall'])]
+        if base:
+            change = (timing['wall'] - base['wall']) / base['wall'] if base['wall'] else 0
+            line += ["%.1f" % (1000 * base['wall']), "%+.0f%%" % (100 * change)]
+            if change > options.tolerance and timing['wall'] - base['wall'] > options.min_time:
+                line.append('REGRESSION')
+                regressions += 1
+        print('\t'.join(map(str, line)))
+
+    if results['batch_modules']:
+        print("Importing svSupport.py loaded %s" % ', '.join(results['batch_modules']))
+        regressions += 1
+    return regressions
+
+
+def get_options():
+    parser = OptionParser()
+    parser.add_option("-r",
+                      "--repeats",
+                      dest="repeats",
+                      action="store",
+                      type="int",
+                      help="Number of times to take each measurement. The fastest is kept [Default: 5]")
+    parser.add_option("--save",
+                      dest="save",
+                      action="store",
+                      help="Save the results as a baseline to FILE",
+                      metavar="FILE")
+    parser.add_option("--compare",
+                      dest="compare",
+                      action="store",
+                      help="Compare the results to the baseline saved in FILE, and exit with status 1 " +
+                           "if start up got slower",
+                      metavar="FILE")
+    parser.add_option("--tolerance",
+                      dest="tolerance",
+                      action="store",
+                      type="float",
+                      help="Fractional slow down counted as a regression [Default: 0.2]")
+    parser.add_option("--min_time",
+                      dest="min_time",
+                      action="store",
+                      type="float",
+                      help="Ignore slow downs of less than this many seconds [Default: 0.01]")
+    parser.set_defaults(repeats=5, tolerance=0.2, min_time=0.01)
+    return parser.parse_args()
+
+
+def main():
+    options, args = get_options()
+
+    baseline = {}
+    if options.compare:
+        with open(options.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+
+    results = benchmark(options.repeats)
+    regressions = report(results, baseline, options)
+
+    if options.save:
+        with open(options.save, 'w') as out:
+            json.dump(results, out, indent=1, sort_keys=True)
+        print("Saved results to %s" % options.save)
+
+    if regressions:
+        print("%s regressions compared to %s" % (regressions, options.compare))
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,216 @@
+"""Benchmark svSupport end to end on the bams bundled in data/.
+Each case runs `worker` in its own process, reporting the time taken and reads fetched by
+each stage (get_regions, find_breakpoints, get_reads, filter_reads, merge_bams, rmDups,
+get_depth) as recorded in its metrics, and the peak RSS of the process. Results can be saved
+as a baseline, and later runs compared against it to flag regressions.
+Stages take milliseconds, so a single run is noisy: each stage's time is the median over the
+repeats, and a slow down only counts as a regression if it is more than --tolerance of the
+baseline and more than --min_time seconds"""
+import os, sys
+sys.dont_write_bytecode = True
+import json
+import shutil
+import tempfile
+import time
+from optparse import OptionParser
+
+repo = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, repo)
+sys.path.insert(0, os.path.join(repo, 'svSupport'))
+
+from worker import worker
+from getArgs import get_args
+
+common = ['-s', '500', '--chromosomes', os.path.join(repo, 'chrom_lengths.txt'),
+          '--non_native_chromosomes', os.path.join(repo, 'non_native_chroms.txt')]
+
+cases = [
+    ('R3_del', ['-i', 'data/R3_del.bam', '-l', 'X:3135326-3139096', '-f']),
+    ('R27_fim_1', ['-i', 'data/R27_fim.bam', '-l', 'X:17286052-17293197', '-f']),
+    ('R27_fim_2', ['-i', 'data/R27_fim.bam', '-l', 'X:17294628-17311472', '-f']),
+    ('del_region', ['-i', 'data/del_region.bam', '-l', '3R:24856498-24856996', '-f']),
+    ('R3_del_cnv', ['-i', 'data/R3_del.bam', '-n', 'data/R59_N_del.bam', '-l', 'X:3135326-3139096', '--sex', 'XY']),
+]
+
+stages = ['get_regions', 'find_breakpoints', 'get_reads', 'filter_reads', 'merge_bams', 'rmDups', 'get_depth']
+
+
+def run_case(name, args):
+    """Run worker over one case, returning the time taken and reads fetched by each stage"""
+    os.chdir(repo)
+    out_dir = tempfile.mkdtemp()
+    options, _ = get_args(args + common + ['-o', out_dir])
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        start = time.time()
+        worker(options)
+        total = time.time() - start
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+        shutil.rmtree(out_dir)
+
+    timings = {}
+    for stage, metrics in options.metrics.stages.items():
+        timings[stage] = {'wall': metrics['seconds'], 'reads': metrics['reads_fetched'], 'calls': metrics['calls']}
+    timings['total'] = {'wall': total, 'reads': None, 'calls': 1}
+    return timings
+
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+def run_in_child(fn, *args):
+    """Run fn(*args) in a forked process, so that it starts cold and its peak RSS can be measured.
+       Returns the (json serialisable) result and the peak RSS of the process in kb"""
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_end)
+        status = 0
+        try:
+            result = fn(*args)
+        except Exception as err:
+            result = {'error': repr(err)}
+            status = 1
+        with os.fdopen(write_end, 'w') as out:
+            json.dump(result, out)
+        os._exit(status)
+
+    os.close(write_end)
+    with os.fdopen(read_end) as results:
+        result = json.load(results)
+    pid, status, rusage = os.wait4(pid, 0)
+    if isinstance(result, dict) and 'error' in result:
+        raise RuntimeError("%s failed: %s" % (fn.__name__, result['error']))
+    return result, rusage.ru_maxrss
+
+
+def benchmark(repeats, selected):
+    """Run each case `repeats` times, keeping the median time for each stage"""
+    results = {}
+    for name, args in cases:
+        if selected and name not in selected:
+            continue
+        walls = {}
+        stage_timings = {}
+        peak_rss = 0
+        for i in range(repeats):
+            timings, rss = run_in_child(run_case, name, args)
+            peak_rss = max(peak_rss, rss)
+            for stage, timing in timings.items():
+                walls.setdefault(stage, []).append(timing['wall'])
+                stage_timings[stage] = timing
+        for stage, timing in stage_timings.items():
+            timing['wall'] = median(walls[stage])
+            timing['reads_per_s'] = timing['reads'] / timing['wall'] if timing['reads'] and timing['wall'] else None
+        results[name] = {'stages': stage_timings, 'peak_rss_kb': peak_rss}
+    return results
+
+
+def report(results, baseline, options):
+    """Print the timings of each case, and compare them to the baseline if there is one.
+       Returns the number of regressions found"""
+    regressions = 0
+    print("case\tstage\tcalls\twall_ms\treads\treads_per_s\tbaseline_ms\tchange")
+    for name, _ in cases:
+        if name not in results:
+            continue
+        case = results[name]
+        base_case = baseline.get(name, {})
+        for stage in stages + ['total']:
+            if stage not in case['stages']:
+                continue
+            timing = case['stages'][stage]
+            base = base_case.get('stages', {}).get(stage)
+            line = [name, stage, timing['calls'], "%.1f" % (1000 * timing['wall']), timing['reads'] or '-',
+                    "%.0f" % timing['reads_per_s'] if timing['reads_per_s'] else '-']
+            if base:
+                change = (timing['wall'] - base['wall']) / base['wall'] if base['wall'] else 0
+                line += ["%.1f" % (1000 * base['wall']), "%+.0f%%" % (100 * change)]
+                if change > options.tolerance and timing['wall'] - base['wall'] > options.min_time:
+                    line.append('REGRESSION')
+                    regressions += 1
+            print('\t'.join(map(str, line)))
+
+        # Peak RSS (in kb) goes in the wall time column
+        rss_line = [name, 'peak_rss_kb', '-', case['peak_rss_kb'], '-', '-']
+        if 'peak_rss_kb' in base_case:
+            change = (case['peak_rss_kb'] - base_case['peak_rss_kb']) / float(base_case['peak_rss_kb'])
+            rss_line += [base_case['peak_rss_kb'], "%+.0f%%" % (100 * change)]
+            if change > options.tolerance:
+                rss_line.append('REGRESSION')
+                regressions += 1
+        print('\t'.join(map(str, rss_line)))
+
+    return regressions
+
+
+def get_options():
+    parser = OptionParser()
+    parser.add_option("-r",
+                      "--repeats",
+                      dest="repeats",
+                      action="store",
+                      type="int",
+                      help="Number of times to run each case. The median time of each stage is kept [Default: 5]")
+    parser.add_option("--case",
+                      dest="cases",
+                      action="append",
+                      help="Only run this case (can be given more than once). One of: " +
+                           ', '.join(name for name, _ in cases))
+    parser.add_option("--save",
+                      dest="save",
+                      action="store",
+                      help="Save the results as a baseline to FILE",
+                      metavar="FILE")
+    parser.add_option("--compare",
+                      dest="compare",
+                      action="store",
+                      help="Compare the results to the baseline saved in FILE, and exit with status 1 " +
+                           "if any stage got slower",
+                      metavar="FILE")
+    parser.add_option("--tolerance",
+                      dest="tolerance",
+                      action="store",
+                      type="float",
+                      help="Fractional slow down (or RSS increase) counted as a regression [Default: 0.25]")
+    parser.add_option("--min_time",
+                      dest="min_time",
+                      action="store",
+                      type="float",
+                      help="Ignore slow downs of less than this many seconds. Stages are timed in milliseconds, " +
+                           "so anything much lower than this is noise [Default: 0.05]")
+    parser.set_defaults(repeats=5, tolerance=0.25, min_time=0.05)
+    return parser.parse_args()
+
+
+def main():
+    options, args = get_options()
+
+    baseline = {}
+    if options.compare:
+        with open(options.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+
+    results = benchmark(options.repeats, options.cases)
+    regressions = report(results, baseline, options)
+
+    if options.save:
+        with open(options.save, 'w') as out:
+            json.dump(results, out, indent=1, sort_keys=True)
+        print("Saved results to %s" % options.save)
+
+    if regressions:
+        print("%s regressions compared to %s" % (regressions, options.compare))
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+"""Run svSupport over simulated bams of increasing depth (see simulate_bam.py), recording the
+runtime and peak RSS of `worker` for each event, and the split and discordant support it finds
+next to the simulated truth. Results are written to 'depth_sweep.txt' in the output directory,
+and plotted to 'depth_sweep.pdf' if matplotlib is installed"""
+import os, sys
+sys.dont_write_bytecode = True
+import shutil
+import tempfile
+import time
+from optparse import OptionParser
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+repo = os.path.join(script_dir, '..')
+sys.path.insert(0, os.path.join(repo, 'svSupport'))
+
+from simulate_bam import simulate, add_options
+from benchmark import run_in_child
+from getArgs import get_args
+from worker import worker
+
+columns = ['depth', 'event', 'type', 'position', 'af', 'split_reads', 'found_split_reads',
+           'disc_reads', 'found_disc_reads', 'found_af', 'wall_s', 'peak_rss_kb']
+
+
+def run_worker(bam, region, slop):
+    """Run worker on one simulated event, returning its result and wall time"""
+    out_dir = tempfile.mkdtemp()
+    options, _ = get_args(['-i', bam, '-l', region, '-s', str(slop), '-o', out_dir, '-f',
+                           '--chromosomes', bam + '.chroms.txt',
+                           '--non_native_chromosomes', os.path.join(repo, 'non_native_chroms.txt')])
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        start = time.time()
+        bp1, bp2, old_af, af, sv_type, configuration, notes, split_support, disc_support = worker(options)
+        wall = time.time() - start
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+        shutil.rmtree(out_dir)
+    return {'af': af, 'split': split_support, 'disc': disc_support, 'wall': wall}
+
+
+def sweep(options):
+    rows = []
+    slop = int(options.insert_mean + 5 * options.insert_sd)
+    sim_dir = tempfile.mkdtemp()
+    try:
+        for depth in options.depths:
+            options.depth = depth
+            bam = os.path.join(sim_dir, 'sim_%sx.bam' % depth)
+            truth, rss = run_in_child(simulate, bam, options)
+            for event, sv_type, chrom1, bp1, chrom2, bp2, region, af, split, disc in truth:
+                result, rss = run_in_child(run_worker, bam, region, slop)
+                row = [depth, event, sv_type, region, af, split, result['split'], disc, result['disc'],
+                       result['af'], "%.3f" % result['wall'], rss]
+                print('\t'.join(map(str, row)))
+                rows.append(row)
+            os.remove(bam)
+    finally:
+        shutil.rmtree(sim_dir)
+    return rows
+
+
+def plot(rows, out_file):
+    try:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print("matplotlib isn't installed. Not plotting results")
+        return
+
+    fig, (time_ax, rss_ax) = plt.subplots(1, 2, figsize=(10, 4))
+    for sv_type in sorted(set(row[2] for row in rows)):
+        points = [row for row in rows if row[2] == sv_type]
+        depths = [row[0] for row in points]
+        time_ax.plot(depths, [float(row[10]) for row in points], marker='o', label=sv_type)
+        rss_ax.plot(depths, [row[11] / 1024.0 for row in points], marker='o', label=sv_type)
+
+    time_ax.set_xlabel('Depth')
+    time_ax.set_ylabel('worker runtime (s)')
+    rss_ax.set_xlabel('Depth')
+    rss_ax.set_ylabel('Peak RSS (Mb)')
+    time_ax.legend()
+    fig.tight_layout()
+    fig.savefig(out_file)
+    print("Plotted results to %s" % out_file)
+
+
+def get_options():
+    parser = add_options(OptionParser())
+    parser.add_option("--depths",
+                      dest="depths",
+                      action="store",
+                      help="Comma separated depths to simulate [Default: 30,60,120,250,500]")
+    parser.add_option("-o",
+                      "--out_dir",
+                      dest="out_dir",
+                      action="store",
+                      help="Directory to write results to [Default: depth_sweep]")
+    parser.add_option("--no_plot",
+                      dest="no_plot",
+                      action="store_true",
+                      help="Don't plot the results")
+    parser.set_defaults(depths='30,60,120,250,500', out_dir='depth_sweep')
+    options, args = parser.parse_args()
+    options.depths = [int(depth) for depth in options.depths.split(',')]
+    return options, args
+
+
+def main():
+    options, args = get_options()
+    if not os.path.isdir(options.out_dir):
+        os.makedirs(options.out_dir)
+
+    print('\t'.join(columns))
+    rows = sweep(options)
+
+    out_file = os.path.join(options.out_dir, 'depth_sweep.txt')
+    with open(out_file, 'w') as out:
+        out.write('\t'.join(columns) + '\n')
+        for row in rows:
+            out.write('\t'.join(map(str, row)) + '\n')
+    print("Wrote results to %s" % out_file)
+
+    if not options.no_plot:
+        plot(rows, os.path.join(options.out_dir, 'depth_sweep.pdf'))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
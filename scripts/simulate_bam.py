@@ -0,0 +1,361 @@
+"""Simulate a coordinate sorted, indexed bam of paired end reads around structural variants
+with known support. Reads are drawn from the reference allele and from the derivative allele
+of each event (at the event's allele frequency), so the number of split reads and discordant
+pairs supporting each event is known exactly, and written to '<bam>.truth.txt'.
+
+Events are given as TYPE:chrom1:bp1:chrom2:bp2[:af], with TYPE one of DEL, TANDUP, BND
+(an inversion type 3to3 junction) or TRA. Breakpoints are the 1-based positions svSupport
+expects, e.g. for a DEL bp1 is the last base kept before the deletion and bp2 the first base after it"""
+import os, sys
+sys.dont_write_bytecode = True
+import random
+from collections import namedtuple
+from optparse import OptionParser
+
+import pysam
+
+Junction = namedtuple('Junction', ['chrom_a', 'pos_a', 'strand_a', 'chrom_b', 'pos_b', 'strand_b'])
+Alignment = namedtuple('Alignment', ['chrom', 'start', 'cigar', 'is_reverse', 'is_supplementary', 'side'])
+
+default_events = ['DEL:sim1:200000:sim1:210000',
+                  'TANDUP:sim1:400000:sim1:405000',
+                  'BND:sim1:600000:sim1:650000',
+                  'TRA:sim1:800000:sim2:300000']
+
+
+def parse_event(event, af):
+    parts = event.split(':')
+    sv_type, chrom1, bp1, chrom2, bp2 = parts[:5]
+    if len(parts) > 5:
+        af = float(parts[5])
+    return sv_type, chrom1, int(bp1), chrom2, int(bp2), af
+
+
+def event_junction(sv_type, chrom1, bp1, chrom2, bp2):
+    """The junction joining the reference on the derivative allele. Derivative position -1
+       is pos_a on side a, and derivative position 0 is pos_b on side b (0-based), with the
+       reference running away from the junction on the given strand"""
+    if sv_type in ['DEL', 'TRA']:
+        return Junction(chrom1, bp1 - 1, '+', chrom2, bp2 - 1, '+')
+    elif sv_type == 'TANDUP':
+        return Junction(chrom1, bp2 - 1, '+', chrom1, bp1 - 1, '+')
+    elif sv_type == 'BND':
+        return Junction(chrom1, bp1 - 1, '+', chrom2, bp2 - 1, '-')
+    raise ValueError("Unknown event type '%s'" % sv_type)
+
+
+def ref_pos(junction, side, x):
+    """Reference position of derivative position x, on either side of the junction"""
+    if side == 'a':
+        if junction.strand_a == '+':
+            return junction.pos_a + x + 1
+        return junction.pos_a - x - 1
+    if junction.strand_b == '+':
+        return junction.pos_b + x
+    return junction.pos_b - x
+
+
+def align_piece(junction, side, ps, pe, s, e, reverse, clip_op=4, supplementary=False):
+    """Alignment of derivative positions ps-pe of a read covering s-e, with the rest of the read clipped"""
+    if side == 'a':
+        chrom, strand = junction.chrom_a, junction.strand_a
+    else:
+        chrom, strand = junction.chrom_b, junction.strand_b
+
+    clips = (ps - s, e - pe)
+    if strand == '+':
+        start = ref_pos(junction, side, ps)
+    else:
+        start = ref_pos(junction, side, pe - 1)
+        clips = clips[::-1]
+        reverse = not reverse
+
+    cigar = [(0, pe - ps)]
+    if clips[0]:
+        cigar.insert(0, (clip_op, clips[0]))
+    if clips[1]:
+        cigar.append((clip_op, clips[1]))
+
+    return Alignment(chrom, start, cigar, reverse, supplementary, side)
+
+
+def place_read(junction, s, e, reverse, min_clip, min_supplementary):
+    """Align a read covering derivative positions s-e. Returns the primary alignment,
+       any supplementary alignment, and whether the read is split across the junction
+       (at least min_clip bases on either side)"""
+    side = None
+    if e <= 0:
+        side = 'a'
+    elif s >= 0:
+        side = 'b'
+    elif min(-s, e) < min_clip:
+        # Too few bases on one side to clip, so the read is aligned through the junction
+        side = 'a' if -s >= e else 'b'
+    if side:
+        return align_piece(junction, side, s, e, s, e, reverse), None, False
+
+    left = align_piece(junction, 'a', s, 0, s, e, reverse)
+    right = align_piece(junction, 'b', 0, e, s, e, reverse)
+    if -s >= e:
+        primary, other, other_span = left, (0, e, 'b'), e
+    else:
+        primary, other, other_span = right, (s, 0, 'a'), -s
+
+    supplementary = None
+    if other_span >= min_supplementary:
+        ps, pe, side = other
+        supplementary = align_piece(junction, side, ps, pe, s, e, reverse, clip_op=5, supplementary=True)
+
+    return primary, supplementary, True
+
+
+def reference_alignment(chrom, start, length, reverse):
+    return Alignment(chrom, start, [(0, length)], reverse, False, None)
+
+
+def alignment_end(alignment):
+    return alignment.start + sum(length for op, length in alignment.cigar if op == 0)
+
+
+def sa_tag(alignment):
+    cigar = ''.join('%s%s' % (length, 'MIDNSHP=X'[op]) for op, length in alignment.cigar)
+    return '%s,%s,%s,%s,60,0;' % (alignment.chrom, alignment.start + 1, '-' if alignment.is_reverse else '+', cigar)
+
+
+class Simulator(object):
+    """Collect simulated read pairs, then write them out as a sorted, indexed bam"""
+
+    def __init__(self, chroms, options):
+        self.chroms = chroms
+        self.tids = dict((chrom, tid) for tid, (chrom, length) in enumerate(chroms))
+        self.options = options
+        self.reads = []
+        self.pairs = 0
+
+    def fragment_length(self):
+        length = int(random.gauss(self.options.insert_mean, self.options.insert_sd))
+        return max(length, self.options.read_length)
+
+    def add_pair(self, first, second):
+        """Add a pair of reads. Each read is a (primary, supplementary) pair of alignments,
+           with the first read forward and the second reverse on the allele they came from"""
+        name = 'sim_%s' % self.pairs
+        self.pairs += 1
+        if random.random() < 0.5:
+            read1, read2 = first, second
+        else:
+            read1, read2 = second, first
+
+        a, b = read1[0], read2[0]
+        tlen = 0
+        if a.chrom == b.chrom:
+            tlen = max(alignment_end(a), alignment_end(b)) - min(a.start, b.start)
+        forward, reverse = (a, b) if not a.is_reverse else (b, a)
+        proper = a.chrom == b.chrom and forward.is_reverse != reverse.is_reverse and forward.start <= reverse.start \
+            and tlen <= self.options.insert_mean + 5 * self.options.insert_sd
+
+        # The leftmost read has a positive template length
+        tlens = (tlen, -tlen) if a.start <= b.start else (-tlen, tlen)
+
+        for (primary, supplementary), mate, flag, read_tlen in (read1, b, 0x40, tlens[0]), (read2, a, 0x80, tlens[1]):
+            for alignment in primary, supplementary:
+                if alignment is None:
+                    continue
+                other = supplementary if alignment is primary else primary
+                self.reads.append(self.make_read(name, alignment, mate, flag, proper, read_tlen, other))
+
+    def make_read(self, name, alignment, mate, flag, proper, tlen, other):
+        read = pysam.AlignedSegment()
+        read.query_name = name
+        flag |= 0x1
+        if proper:
+            flag |= 0x2
+        if alignment.is_reverse:
+            flag |= 0x10
+        if mate.is_reverse:
+            flag |= 0x20
+        if alignment.is_supplementary:
+            flag |= 0x800
+        read.flag = flag
+        read.reference_id = self.tids[alignment.chrom]
+        read.reference_start = alignment.start
+        read.mapping_quality = 60
+        read.cigartuples = alignment.cigar
+        read.next_reference_id = self.tids[mate.chrom]
+        read.next_reference_start = mate.start
+        read.template_length = tlen
+        length = sum(length for op, length in alignment.cigar if op in (0, 4))
+        read.query_sequence = 'A' * length
+        read.query_qualities = pysam.qualitystring_to_array('I' * length)
+        if other is not None:
+            read.set_tag('SA', sa_tag(other))
+        return read
+
+    def reference_fragments(self, chrom, start, end, keep):
+        """Fragments from the reference allele within chrom:start-end, each kept with probability `keep`"""
+        rl = self.options.read_length
+        n = int(self.options.depth * (end - start) / (2.0 * rl))
+        for i in range(n):
+            length = self.fragment_length()
+            pos = random.randint(start, end - length)
+            if random.random() >= keep:
+                continue
+            self.add_pair((reference_alignment(chrom, pos, rl, False), None),
+                          (reference_alignment(chrom, pos + length - rl, rl, True), None))
+
+    def derivative_fragments(self, junction, af):
+        """Fragments from the derivative allele within `flank` bps of the junction.
+           Returns the number of split reads and discordant pairs supporting the junction"""
+        rl = self.options.read_length
+        flank = self.options.flank
+        n = int(self.options.depth * af * 2 * flank / (2.0 * rl))
+        split = disc = 0
+        for i in range(n):
+            length = self.fragment_length()
+            s = random.randint(-flank, flank - length)
+            first = place_read(junction, s, s + rl, False, self.options.min_clip, self.options.min_supplementary)
+            second = place_read(junction, s + length - rl, s + length, True, self.options.min_clip, self.options.min_supplementary)
+            self.add_pair(first[:2], second[:2])
+
+            split += first[2] + second[2]
+            if not first[2] and not second[2] and first[0].side != second[0].side:
+                disc += 1
+        return split, disc
+
+    def write(self, out_bam):
+        header = {'HD': {'VN': '1.5', 'SO': 'coordinate'},
+                  'SQ': [{'SN': chrom, 'LN': length} for chrom, length in self.chroms]}
+        self.reads.sort(key=lambda read: (read.reference_id, read.reference_start, read.is_reverse))
+        with pysam.AlignmentFile(out_bam, 'wb', header=header) as out:
+            for read in self.reads:
+                out.write(read)
+        pysam.index(out_bam)
+
+
+def simulate(out_bam, options):
+    """Write the simulated bam, its chromosome lengths and the truth table.
+       Returns the truth table rows"""
+    random.seed(options.seed)
+    chroms = [('sim%s' % (i + 1), options.chrom_length) for i in range(options.chroms)]
+    simulator = Simulator(chroms, options)
+
+    events = [parse_event(event, options.af) for event in options.events or default_events]
+
+    windows = []
+    for sv_type, chrom1, bp1, chrom2, bp2, af in events:
+        for chrom, bp in (chrom1, bp1), (chrom2, bp2):
+            windows.append((chrom, max(0, bp - options.flank), min(options.chrom_length, bp + options.flank), af))
+
+    for chrom, start, end, af in windows:
+        simulator.reference_fragments(chrom, start, end, 1 - af)
+
+    truth = []
+    for i, (sv_type, chrom1, bp1, chrom2, bp2, af) in enumerate(events):
+        split, disc = simulator.derivative_fragments(event_junction(sv_type, chrom1, bp1, chrom2, bp2), af)
+        if chrom1 == chrom2:
+            region = '%s:%s-%s' % (chrom1, bp1, bp2)
+        else:
+            region = '%s:%s-%s:%s' % (chrom1, bp1, chrom2, bp2)
+        truth.append([i + 1, sv_type, chrom1, bp1, chrom2, bp2, region, af, split, disc])
+
+    simulator.write(out_bam)
+
+    with open(out_bam + '.chroms.txt', 'w') as chrom_file:
+        for chrom, length in chroms:
+            chrom_file.write('%s\t%s\n' % (chrom, length))
+
+    with open(out_bam + '.truth.txt', 'w') as truth_file:
+        truth_file.write('\t'.join(['event', 'type', 'chromosome1', 'bp1', 'chromosome2', 'bp2', 'position', 'af', 'split_reads', 'disc_reads']) + '\n')
+        for row in truth:
+            truth_file.write('\t'.join(map(str, row)) + '\n')
+
+    print("Wrote %s reads from %s pairs to %s" % (len(simulator.reads), simulator.pairs, out_bam))
+    return truth
+
+
+def add_options(parser):
+    parser.add_option("-d",
+                      "--depth",
+                      dest="depth",
+                      action="store",
+                      type="float",
+                      help="Read depth [Default: 30]")
+    parser.add_option("-r",
+                      "--read_length",
+                      dest="read_length",
+                      action="store",
+                      type="int",
+                      help="Read length [Default: 100]")
+    parser.add_option("--insert_mean",
+                      dest="insert_mean",
+                      action="store",
+                      type="float",
+                      help="Mean fragment length [Default: 300]")
+    parser.add_option("--insert_sd",
+                      dest="insert_sd",
+                      action="store",
+                      type="float",
+                      help="Standard deviation of fragment length [Default: 30]")
+    parser.add_option("-e",
+                      "--event",
+                      dest="events",
+                      action="append",
+                      help="Event to inject, as TYPE:chrom1:bp1:chrom2:bp2[:af] (can be given more than once) " +
+                           "[Default: %s]" % ' '.join(default_events))
+    parser.add_option("--af",
+                      dest="af",
+                      action="store",
+                      type="float",
+                      help="Allele frequency of events that don't give one [Default: 0.5]")
+    parser.add_option("--flank",
+                      dest="flank",
+                      action="store",
+                      type="int",
+                      help="Simulate reads within this many bps of each breakpoint [Default: 5000]")
+    parser.add_option("--chroms",
+                      dest="chroms",
+                      action="store",
+                      type="int",
+                      help="Number of chromosomes (named sim1, sim2, ...) [Default: 2]")
+    parser.add_option("--chrom_length",
+                      dest="chrom_length",
+                      action="store",
+                      type="int",
+                      help="Length of each chromosome [Default: 1000000]")
+    parser.add_option("--min_clip",
+                      dest="min_clip",
+                      action="store",
+                      type="int",
+                      help="Reads crossing a junction are only split if they have at least this many " +
+                           "bps on both sides [Default: 10]")
+    parser.add_option("--min_supplementary",
+                      dest="min_supplementary",
+                      action="store",
+                      type="int",
+                      help="Minimum length of the clipped part of a split read given a supplementary " +
+                           "alignment [Default: 20]")
+    parser.add_option("--seed",
+                      dest="seed",
+                      action="store",
+                      type="int",
+                      help="Random seed [Default: 1]")
+    parser.set_defaults(depth=30, read_length=100, insert_mean=300, insert_sd=30, af=0.5, flank=5000,
+                        chroms=2, chrom_length=1000000, min_clip=10, min_supplementary=20, seed=1)
+    return parser
+
+
+def get_args():
+    parser = add_options(OptionParser(usage="%prog [options] out.bam"))
+    options, args = parser.parse_args()
+    if len(args) != 1:
+        parser.error("Give the bam file to write")
+    return options, args
+
+
+def main():
+    options, args = get_args()
+    simulate(args[0], options)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
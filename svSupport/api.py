@@ -0,0 +1,127 @@
+"""Run svSupport from python, without going through the command line:
+
+    from svSupport.api import evaluate_variant
+    result = evaluate_variant('tumour.bam', 'X:3135326-3139096', purity=0.8, find_bps=True,
+                              chromfile='chrom_lengths.txt', nn_chroms='non_native_chroms.txt')
+    print(result.allele_frequency, result.split_reads, result.disc_reads)
+
+Nothing is printed, and no bams are written, unless asked for"""
+import os
+import sys
+import shutil
+import tempfile
+from collections import namedtuple
+from contextlib import contextmanager
+
+from worker import worker
+from getArgs import get_args
+from utils import make_dirs
+from runVariants import set_bam_stats, run_variants
+
+# Fields of the tuple returned by worker, in order. For CNVs (run with a normal bam)
+# configuration holds the read depth ratio, and split_reads and disc_reads are None
+result_fields = ['bp1', 'bp2', 'unadjusted_af', 'allele_frequency', 'type', 'configuration', 'notes',
+                 'split_reads', 'disc_reads']
+
+# The result of one variant, with the evidence its allele frequency was worked out
+# from (see worker.score_evidence) and the time spent in each stage
+VariantResult = namedtuple('VariantResult', result_fields + ['evidence', 'metrics'])
+
+
+def bam_path(bam):
+    """Path of a bam given either as a path or an open pysam.AlignmentFile. svSupport reads
+       open bams through its own handles, so the position of the one passed in isn't changed"""
+    if bam is None or isinstance(bam, basestring):
+        return bam
+    return bam.filename
+
+
+@contextmanager
+def silenced(quiet=True):
+    """Send anything printed (to stdout or stderr) to /dev/null while quiet is set"""
+    if not quiet:
+        yield
+        return
+    stdout, stderr = sys.stdout, sys.stderr
+    with open(os.devnull, 'w') as devnull:
+        sys.stdout = sys.stderr = devnull
+        try:
+            yield
+        finally:
+            sys.stdout, sys.stderr = stdout, stderr
+
+
+def variant_options(bam, region, **options):
+    """Options for one variant, starting from the command line defaults. Raises TypeError
+       for anything that isn't an svSupport option, and ValueError for sample_bams, which
+       only config runs support"""
+    variant, _ = get_args(['-i', bam_path(bam), '-l', region])
+    for option, value in options.items():
+        if not hasattr(variant, option):
+            raise TypeError("Unknown option '%s'" % option)
+        if option == 'sample_bams' and value:
+            raise ValueError("sample_bams can only be used for config runs")
+        if option == 'normal_bam':
+            value = bam_path(value)
+        setattr(variant, option, value)
+    return variant
+
+
+def evaluate_variant(bam, region, purity=1, sex=None, normal_bam=None, out_dir=None, quiet=True, **options):
+    """Work out the support for (and allele frequency of) a single variant.
+       bam (and normal_bam, for CNVs) can be paths or open pysam.AlignmentFiles. Any other
+       option of the command line can be given by its name, e.g. find_bps, slop or chromfile.
+       The variant's bams are written to out_dir if one is given. Otherwise it's run in counts
+       only mode, without writing any. Returns a VariantResult"""
+    options.setdefault('counts_only', not out_dir)
+    variant = variant_options(bam, region, purity=purity, sex=sex, normal_bam=normal_bam, **options)
+    with bam_dir(out_dir, variant.counts_only) as bams, silenced(quiet):
+        if bams:
+            variant.out_dir = bams
+        result = worker(variant)
+    return VariantResult(*result, evidence=variant.evidence, metrics=variant.metrics.as_dict())
+
+
+def evaluate_batch(variants, jobs=1, out_dir=None, quiet=True, **options):
+    """Work out the support for a list of variants, each given as a dict of the arguments of
+       evaluate_variant (at least bam and region). Options given here are used for every variant
+       that doesn't set its own. As for config files, bam statistics are worked out once per bam,
+       variants with overlapping windows share their reads, and `jobs` processes are used if
+       jobs > 1. Bams are written to out_dir if one is given, as for evaluate_variant.
+       Returns a VariantResult for each variant, in the same order"""
+    options.setdefault('counts_only', not out_dir)
+    counts_only = all(variant.get('counts_only', options['counts_only']) for variant in variants)
+    with bam_dir(out_dir, counts_only) as batch_dir, silenced(quiet):
+        jobs_options = []
+        for i, variant in enumerate(variants):
+            variant = dict(options, **variant)
+            if batch_dir:
+                variant['out_dir'] = batch_dir
+            jobs_options.append((i, variant_options(variant.pop('bam'), variant.pop('region'), **variant)))
+
+        if not jobs_options:
+            return []
+        set_bam_stats(jobs_options)
+        results = run_variants(jobs_options, jobs)
+
+    return [VariantResult(*result, evidence=evidence, metrics=metrics)
+            for i, variant, result, metrics, evidence in results]
+
+
+@contextmanager
+def bam_dir(out_dir, counts_only=False):
+    """out_dir (created if needed), or a temporary directory removed once finished with.
+       Nothing is written in counts only mode, so without an out_dir no directory is made
+       and None is given (leaving the default out_dir of the options unused)"""
+    if out_dir:
+        make_dirs(out_dir)
+        yield out_dir
+        return
+    if counts_only:
+        yield None
+        return
+    tmp = tempfile.mkdtemp()
+    try:
+        yield tmp
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
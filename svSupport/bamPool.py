@@ -0,0 +1,34 @@
+import os
+import threading
+import pysam
+
+_handles = {}
+_threads = 1
+
+
+def set_threads(threads):
+    """Set the number of decompression threads given to bams opened from now on"""
+    global _threads
+    _threads = max(1, int(threads or 1))
+
+
+def open_bam(bam_file):
+    """Return an open pysam.AlignmentFile for a (coordinate sorted, indexed) bam, reusing
+       the handle (and its loaded index) across variants. Handles are kept per process and
+       thread, so forked workers never share the file offset of a handle opened by their parent"""
+    key = (os.path.abspath(bam_file), os.getpid(), threading.current_thread().ident)
+    bam = _handles.get(key)
+    if bam is None or not bam.is_open:
+        bam = pysam.AlignmentFile(bam_file, "rb", threads=_threads)
+        _handles[key] = bam
+    return bam
+
+
+def close_bams():
+    """Close every handle opened by this process"""
+    pid = os.getpid()
+    for key in _handles.keys():
+        if key[1] == pid:
+            _handles.pop(key).close()
+        else:
+            del _handles[key]
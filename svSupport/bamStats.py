@@ -0,0 +1,121 @@
+from __future__ import division
+import os
+import json
+import math
+import pysam
+from bamPool import open_bam
+
+_bam_stats = {}
+
+
+def get_bam_stats(bam_file, persist=False):
+    """Return the (cached) BamStats for a bam file. Stats are shared by every variant
+       run on the same bam in this process, and reused for as long as the bam is unchanged"""
+    stats = BamStats(bam_file, persist)
+    if stats.key not in _bam_stats:
+        _bam_stats[stats.key] = stats
+    elif persist:
+        _bam_stats[stats.key].persist = True
+    return _bam_stats[stats.key]
+
+
+def filterfn(read):
+    """"Filter reads to ensure only properly paired, high quality reads are counted"""
+    return (read.is_proper_pair and read.is_paired and read.tlen > 0 and not read.is_supplementary and not read.is_duplicate and not read.is_unmapped and not read.mate_is_unmapped)
+
+
+class BamStats(object):
+    """Whole-bam statistics: insert size mean and SD, read length and mapped reads per chromosome.
+       Each statistic is worked out the first time it's asked for. If persist is set, statistics are
+       saved to a '.svstats.json' sidecar next to the bam, which later runs load instead of reading the bam.
+       Sidecars are only read if persist is set, and are ignored if the bam has changed since"""
+
+    def __init__(self, bam_file, persist=False):
+        self.bam_file = bam_file
+        self.persist = persist
+        bam_stat = os.stat(bam_file)
+        self.key = (os.path.abspath(bam_file), bam_stat.st_mtime, bam_stat.st_size)
+        self.sidecar = bam_file + '.svstats.json'
+        self.stats = None
+
+    def _load(self):
+        self.stats = {}
+        if not self.persist or not os.path.isfile(self.sidecar):
+            return
+        try:
+            with open(self.sidecar) as sidecar:
+                stats = json.load(sidecar)
+        except (IOError, ValueError):
+            return
+        if stats.get('key') == list(self.key):
+            self.stats = stats
+
+    def _save(self):
+        if not self.persist:
+            return
+        self.stats['key'] = list(self.key)
+        tmp = self.sidecar + '.tmp'
+        try:
+            with open(tmp, 'w') as sidecar:
+                json.dump(self.stats, sidecar, indent=1, sort_keys=True)
+            os.rename(tmp, self.sidecar)
+        except (IOError, OSError) as err:
+            print("Can't write bam statistics to %s: %s" % (self.sidecar, err))
+
+    def _get(self, name, compute):
+        if self.stats is None:
+            self._load()
+        if name not in self.stats:
+            self.stats[name] = compute()
+            self._save()
+        return self.stats[name]
+
+    def sample(self, samplesize=None):
+        """Insert size mean and SD, and mean read length, of the first `samplesize` properly paired reads.
+           If no samplesize is given, any sample already taken is used (or the first 10000 reads)"""
+        if self.stats is None:
+            self._load()
+        sample = self.stats.get('sample')
+        if sample is None or samplesize and sample['size'] != samplesize:
+            self.stats['sample'] = sample = self._sample(samplesize or 10000)
+            self._save()
+        return sample
+
+    def _sample(self, samplesize):
+        tlens = []
+        read_lengths = []
+        bam = open_bam(self.bam_file)
+        bam.reset()
+        for read in bam:
+            if filterfn(read):
+                tlens.append(read.tlen)
+                read_lengths.append(read.infer_read_length())
+                if len(tlens) == samplesize:
+                    break
+
+        sample = {'size': samplesize, 'n': len(tlens), 'mean': None, 'sd': None, 'read_length': None}
+        if len(tlens) > 1:
+            mean = float(sum(tlens)) / len(tlens)
+            sample['mean'] = mean
+            sample['sd'] = math.sqrt(float(sum([(x - mean) ** 2 for x in tlens])) / (len(tlens) - 1))
+            sample['read_length'] = sum(read_lengths) / len(read_lengths)
+        return sample
+
+    def read_length(self):
+        return self.sample()['read_length']
+
+    def mapped_reads(self):
+        """Number of mapped reads on each chromosome (from the bam index)"""
+        return self._get('mapped', self._mapped_reads)
+
+    def _mapped_reads(self):
+        lines = pysam.idxstats(self.bam_file)
+
+        if type(lines) is str:
+            lines = lines.strip().split('\n')
+
+        mapped = {}
+        for line in lines:
+            chrom, len, chrom_mapped, unmapped = line.split('\t')
+            mapped[chrom] = int(chrom_mapped)
+        return mapped
@@ -0,0 +1,64 @@
+"""
+#------------------------
+# CIGAR operations (as used in pysam cigartuples)
+#------------------------
+
+o 0 M  alignment match       o 4 S  soft clip
+o 1 I  insertion             o 5 H  hard clip
+o 2 D  deletion              o 7 =  sequence match
+o 3 N  skipped region        o 8 X  sequence mismatch
+
+"""
+
+from collections import namedtuple
+
+CLIP_OPS = (4, 5)
+REFERENCE_OPS = (0, 2, 3, 7, 8)
+
+CigarClass = namedtuple('CigarClass', ['left_clip', 'right_clip', 'double_clipped', 'aligned_span'])
+
+UNALIGNED = CigarClass(0, 0, False, 0)
+
+_classified = {}
+
+
+def classify_cigar(read):
+    """Summarise the clipping of a read from its cigartuples:
+       left_clip      : number of bases soft or hard clipped at the start of the read
+       right_clip     : number of bases soft or hard clipped at the end of the read
+       double_clipped : clipped at both ends
+       aligned_span   : number of reference bases covered by the alignment
+       Reads sharing a CIGAR share a classification, so each distinct CIGAR is only worked out once"""
+    cigar = read.cigarstring
+    if cigar is None:
+        return UNALIGNED
+
+    try:
+        return _classified[cigar]
+    except KeyError:
+        pass
+
+    cigartuples = read.cigartuples
+
+    left_clip = 0
+    for op, length in cigartuples:
+        if op not in CLIP_OPS:
+            break
+        left_clip += length
+
+    right_clip = 0
+    if left_clip < sum(length for op, length in cigartuples):
+        for op, length in reversed(cigartuples):
+            if op not in CLIP_OPS:
+                break
+            right_clip += length
+
+    aligned_span = sum(length for op, length in cigartuples if op in REFERENCE_OPS)
+
+    classified = CigarClass(left_clip, right_clip, bool(left_clip and right_clip), aligned_span)
+
+    if len(_classified) > 100000:
+        _classified.clear()
+    _classified[cigar] = classified
+
+    return classified
@@ -1,6 +1,13 @@
 from __future__ import division
-import pysam
+import os
+from optparse import Values
 from getReads import filterContamination
+from bamStats import get_bam_stats
+from bamPool import open_bam
+from cigarOps import CLIP_OPS
+
+_depth_pools = {}
+
 
 def get_depth(bam_in, normal, chrom, bp1, bp2, chroms, notes, options, chrom_dict):
     """Get the number of mapped reads in both t and n bams accross all chroms
@@ -11,11 +18,18 @@ def get_depth(bam_in, normal, chrom, bp1, bp2, chroms, notes, options, chrom_dic
     else:
         chromosomes = [chrom]
 
-    t_reads_by_chrom, tumour_mapped = count_reads(bam_in, chromosomes)
-    t_read_count, t_contamination_count, read_length = region_depth(bam_in, chrom, bp1, bp2, options)
+    # With --depth_jobs, the region is counted in both bams (split into chunks if it's
+    # large) by other processes while the total mapped reads are looked up
+    t_chunks = start_region_depth(bam_in, chrom, bp1, bp2, options)
+    n_chunks = start_region_depth(normal, chrom, bp1, bp2, options)
+
+    t_reads_by_chrom, tumour_mapped = count_reads(bam_in, chromosomes, options.stats_cache)
+    n_reads_by_chrom, normal_mapped = count_reads(normal, chromosomes, options.stats_cache)
 
-    n_reads_by_chrom, normal_mapped = count_reads(normal, chromosomes)
-    n_read_count, n_contamination_count, read_length = region_depth(normal, chrom, bp1, bp2, options)
+    t_read_count, t_contamination_count, read_length = finish_region_depth(t_chunks, bam_in, chrom, bp1, bp2, options)
+    n_read_count, n_contamination_count, read_length = finish_region_depth(n_chunks, normal, chrom, bp1, bp2, options)
+    options.metrics.add('get_depth', fetch_calls=len(t_chunks) + len(n_chunks),
+                        reads_fetched=t_read_count + t_contamination_count + n_read_count + n_contamination_count)
 
     av_depth = n_reads_by_chrom[chrom]*read_length/int(chrom_dict[chrom])
 
@@ -54,24 +68,17 @@ def get_depth(bam_in, normal, chrom, bp1, bp2, chroms, notes, options, chrom_dic
     return n_corr, t_corr, adj_ratio, notes
 
 
-def count_reads(bamfile, chromosomes):
+def count_reads(bamfile, chromosomes, persist=False):
     """Count the total number of mapped reads in a BAM file, filtering
     for chromosomes in `chromosomes`
     """
-
-    lines = pysam.idxstats(bamfile)
-
-    if type(lines) is str:
-        lines = lines.strip().split('\n')
-
     total_mapped = 0
     total_mapped_chrom = {}
 
-    for line in lines:
-        chrom, len, mapped, unmapped = line.split('\t')
+    for chrom, mapped in get_bam_stats(bamfile, persist).mapped_reads().items():
         if chrom in chromosomes:
-            total_mapped_chrom[chrom] = int(mapped)
-            total_mapped += int(mapped)
+            total_mapped_chrom[chrom] = mapped
+            total_mapped += mapped
 
     print("Total number of mapped reads on chroms %s %s: %s") % (chromosomes, bamfile, total_mapped)
     return total_mapped_chrom, total_mapped
@@ -79,31 +86,97 @@ def count_reads(bamfile, chromosomes):
 
 def region_depth(bamfile, chrom, bp1, bp2, options):
     """Count the total number of mapped reads in a genomic region"""
-
-    samfile = pysam.Samfile(bamfile, "rb")
+    return finish_region_depth(start_region_depth(bamfile, chrom, bp1, bp2, options), bamfile, chrom, bp1, bp2, options)
+
+
+def depth_pool(jobs):
+    """Process pool used for counting region depth, kept for every CNV run by this process"""
+    key = (os.getpid(), jobs)
+    if key not in _depth_pools:
+        # Imported here so that runs counting depth in one process don't load multiprocessing
+        from multiprocessing import Pool
+        _depth_pools[key] = Pool(jobs)
+    return _depth_pools[key]
+
+
+def use_depth_pool(options):
+    """Whether to count depth in other processes. Only done for --depth_jobs > 1, and not from
+       the workers of a --jobs pool: they're daemons, which can't start processes of their own"""
+    if not options.depth_jobs or options.depth_jobs < 2:
+        return False
+    from multiprocessing import current_process
+    return not current_process().daemon
+
+
+def split_region(bp1, bp2, chunk_size):
+    """Split bp1-bp2 into consecutive chunks of (at most) chunk_size bps"""
+    if not chunk_size or bp2 - bp1 <= chunk_size:
+        return [(bp1, bp2)]
+    return [(start, min(start + chunk_size, bp2)) for start in range(bp1, bp2, chunk_size)]
+
+
+def start_region_depth(bamfile, chrom, bp1, bp2, options):
+    """Start counting the reads in each chunk of the region on the depth pool. Returns the
+       pending chunk counts, or the count of the whole region if the pool isn't used"""
+    # Only what filterContamination looks at is sent to the pool
+    chunk_options = Values({'debug': options.debug})
+    if use_depth_pool(options):
+        pool = depth_pool(options.depth_jobs)
+        return [pool.apply_async(chunk_depth, (bamfile, chrom, start, end, bp1, chunk_options))
+                for start, end in split_region(bp1, bp2, options.depth_chunk)]
+    return [chunk_depth(bamfile, chrom, bp1, bp2, bp1, chunk_options)]
+
+
+def finish_region_depth(chunks, bamfile, chrom, bp1, bp2, options):
+    """Add up the chunk counts from start_region_depth. The read length is the
+       average length of the first 100 reads counted in the region"""
     count = 0
     contamination_count = 0
-    read_lengths = 0
+    read_lengths = []
+
+    for chunk in chunks:
+        if hasattr(chunk, 'get'):
+            chunk = chunk.get()
+        chunk_count, chunk_contamination_count, chunk_read_lengths = chunk
+        count += chunk_count
+        contamination_count += chunk_contamination_count
+        read_lengths.extend(chunk_read_lengths[:100 - len(read_lengths)])
+
+    if read_lengths:
+        av_read_length = sum(read_lengths)/len(read_lengths)
+    else:
+        av_read_length = get_bam_stats(bamfile, options.stats_cache).read_length()
+    print("Reads in %s:%s-%s: %s") % (chrom, bp1, bp2, count)
+    return count, contamination_count, av_read_length
+
 
-    check_read_length = 0
+def chunk_depth(bamfile, chrom, start, end, bp1, options):
+    """Count the mapped reads in one chunk of the region starting at bp1. Reads overlapping
+       two chunks are counted in the chunk they start in (or the first chunk, if they start before bp1).
+       Only the flag, mapq and CIGAR ends of each read are looked at: filterContamination
+       is only needed for reads that are clipped at both ends"""
+
+    samfile = open_bam(bamfile)
+    count = 0
+    contamination_count = 0
+    read_lengths = []
 
-    for read in samfile.fetch(chrom, bp1, bp2):
-        if read.is_unmapped:
+    for read in samfile.fetch(chrom, start, end):
+        if start > bp1 and read.reference_start < start:
             continue
-        elif read.mapq < 3:
+        if read.flag & 4 or read.mapping_quality < 3:
             continue
 
-        conaminated_read, contaminated_at_bp = filterContamination(read, bp1, options)
-        if conaminated_read:
-            contamination_count += 1
-            continue
+        cigar = read.cigartuples
+        if cigar and cigar[0][0] in CLIP_OPS and cigar[-1][0] in CLIP_OPS:
+            conaminated_read, contaminated_at_bp = filterContamination(read, bp1, options)
+            if conaminated_read:
+                contamination_count += 1
+                continue
 
-        if check_read_length < 100:
-            read_lengths += read.infer_read_length()
-            check_read_length += 1
+        if len(read_lengths) < 100:
+            read_lengths.append(read.infer_read_length())
 
         count += 1
 
-    av_read_length = read_lengths/check_read_length
-    print("Reads in %s:%s-%s: %s") % (chrom, bp1, bp2, count)
-    return count, contamination_count, av_read_length
+    return count, contamination_count, read_lengths
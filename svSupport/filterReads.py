@@ -1,4 +1,5 @@
 import pysam
+from merge_bams import unsorted_header, bam_writer
 from collections import defaultdict
 from trackReads import TrackReads
 from getReads import filterContamination, leftClipped, rightClipped
@@ -9,13 +10,16 @@ def filter_reads(bp_regions, bp1, bp2, c1, c2, sv_type, options, supporting, opp
     clean_reads = os.path.join(options.out_dir, 'clean_disc.bam')
     disc_support = defaultdict(int)
     split_support = defaultdict(int)
-    regions = pysam.Samfile(bp_regions, "rb")
+    regions = bp_regions
 
-    seen_read = defaultdict(int)
+    seen_read = set()
     duplicates = defaultdict(int)
-    supplementary_clipped = []
+    supplementary_clipped = set()
 
-    with pysam.AlignmentFile(clean_reads, "wb", template=regions) as cleaned:
+    regions.pair_mates()
+
+    # Mates are written next to their reads, so the bam is marked unsorted
+    with bam_writer(clean_reads, unsorted_header(regions.header), options) as cleaned:
         for read in regions.fetch():
 
             if read.is_supplementary:
@@ -25,10 +29,11 @@ def filter_reads(bp_regions, bp1, bp2, c1, c2, sv_type, options, supporting, opp
 
             if read_key in seen_read:
                 continue
-            seen_read[read_key] += 1
+            seen_read.add(read_key)
 
             read_is_clipped = False
             clipped_supporting = False
+            mate = get_mate(read, regions)
 
             # TODO Probably better to do this later, and remove contaminated read & mate from supporting_reads
             contaminated_bp1, dummy = filterContamination(read, bp1, options)
@@ -42,7 +47,6 @@ def filter_reads(bp_regions, bp1, bp2, c1, c2, sv_type, options, supporting, opp
                     supporting = supporting_remove(read, supporting, options, 'read name found in opposing reads')
                     continue
                 if 'clipped' in tag:
-                    mate = get_mate(read, regions)
                     read_is_clipped = True
                     read.set_tag('SV', tag, value_type='Z')
                     if clipped_support(read, bp1, 'bp1', bp1_sig, options):
@@ -62,8 +66,6 @@ def filter_reads(bp_regions, bp1, bp2, c1, c2, sv_type, options, supporting, opp
             elif read.is_proper_pair and not read_is_clipped and not read.query_name in supplementary_clipped:
                 supporting = supporting_remove(read, supporting, options, 'not discordant or clipped')
                 continue
-            else:
-                mate = get_mate(read, regions)
 
             # This should be handled earlier (using tags)
             if read.query_name in opposing:
@@ -222,30 +224,25 @@ def clipped_support(read, bp, bp_number, bp_sig, options):
     return False
 
 
-def get_mate(read, samfile):
-    pointer = samfile.tell() # pointer to the current position in the BAM file
+def get_mate(read, regions):
     try:
-        mate = samfile.mate(read)
+        mate = regions.mate(read)
     except ValueError:
         return None
-    finally:
-        samfile.seek(pointer) # Return the BAM file to the position of read1 in the pair
     return mate
 
 
 def supporting_remove(read, su, options, reason):
     if read.query_name in su:
-        su = set(su)
         su.remove(read.query_name)
         if options.debug: print("[!] Removing read: %s : %s" % (read.query_name, reason))
 
-    return list(su)
+    return su
 
 
 def supporting_add(read, su, options, reason):
-    su = list(su)
     if read.query_name not in su:
-        su.append(read.query_name)
+        su.add(read, reason)
         if options.debug: print("[o] Adding new supporting read: %s : %s" % (read.query_name, reason))
 
     return su
\ No newline at end of file
@@ -1,10 +1,11 @@
-import pysam
 from getReads import getClipped
 from collections import defaultdict
 from trackReads import TrackReads
 
 def find_breakpoints(regions, chrom, chrom2, bp, bp_number, options, cn):
-    samfile = pysam.Samfile(regions, "rb")
+    """Find the position within window_size of bp supported by the most split reads.
+       The window is fetched once, and each read is counted at the position it is clipped at"""
+    samfile = regions
     bp_guess = {}
     sv_type_guess = {}
     read_tags = defaultdict(list)
@@ -16,37 +17,41 @@ def find_breakpoints(regions, chrom, chrom2, bp, bp_number, options, cn):
 
     print("Looking for reads +/- %s bps surrounding %s") % (window_size, bp_number)
 
-    for i in range(bp - window_size, bp + window_size):
-        split_reads = 0
-        readSig = defaultdict(int)
-        duplicates = defaultdict(int)
+    split_reads = defaultdict(int)
+    readSig = {}
+    duplicates = defaultdict(int)
 
-        for read in samfile.fetch(chrom, i - 5, i + 5):
-            # TODO - can probably get rid of this?
-            if not read.infer_read_length():
-                """This is a problem - and will skip over reads with no mapped mate (which also have no cigar)"""
-                continue
-            # TODO - can probably get rid of this?
-            # duplicates, is_dup = dupObj.check_for_standard_dup()
-            #
-            # if is_dup:
-            #     continue
-            # duplicates, is_dup = dupObj.check_for_disc_dup()
-            #
-            dupObj = TrackReads(read, read, chrom, chrom2, duplicates)
-            duplicates, is_dup = dupObj.check_for_clipped_dup_no_mate()
-            if is_dup:
-                continue
+    # Reads clipped at i overlap i +/- 5, so this includes every read that would be fetched for each position
+    for read in samfile.fetch(chrom, bp - window_size - 5, bp + window_size + 5):
+        # TODO - can probably get rid of this?
+        if not read.infer_read_length():
+            """This is a problem - and will skip over reads with no mapped mate (which also have no cigar)"""
+            continue
+
+        # Duplicates share a start and end, so are seen alongside each other at every position
+        dupObj = TrackReads(read, read, chrom, chrom2, duplicates)
+        duplicates, is_dup = dupObj.check_for_clipped_dup_no_mate()
+        if is_dup:
+            continue
 
-            if read.is_reverse:
-                direction = 'r'
-            else:
-                direction = 'f'
+        if read.is_reverse:
+            direction = 'r'
+        else:
+            direction = 'f'
 
-            read, readSig, split_reads, bpID, read_tags = getClipped(read, i, direction, bp_number, readSig, split_reads, options, read_tags)
+        clipped_at = [read.reference_end]
+        if read.reference_start + 1 != read.reference_end:
+            clipped_at.append(read.reference_start + 1)
 
-        bp_guess[i] = split_reads
-        sv_type_guess[i] = readSig
+        for i in clipped_at:
+            if i is None or not bp - window_size <= i < bp + window_size:
+                continue
+            sig = readSig.setdefault(i, defaultdict(int))
+            read, sig, split_reads[i], bpID, read_tags = getClipped(read, i, direction, bp_number, sig, split_reads[i], options, read_tags)
+
+    for i in range(bp - window_size, bp + window_size):
+        bp_guess[i] = split_reads[i]
+        sv_type_guess[i] = readSig.get(i, defaultdict(int))
 
     # t_g = max(sv_type_guess, key=sv_type_guess.get)
     bp_g = max(bp_guess, key=bp_guess.get)
@@ -1,7 +1,7 @@
 from optparse import OptionParser
 
 
-def get_args():
+def get_args(args=None):
     parser = OptionParser()
 
     parser.add_option("-i",
@@ -55,6 +55,19 @@ def get_args():
                       help="Explicitly set the distance from breakpoints " +
                            "to consider as informative for SV")
 
+    parser.add_option("--distant_mates",
+                      dest="distant_mates",
+                      action="store_true",
+                      help="Look up mates falling outside the breakpoint windows " +
+                           "in the input bam when filtering reads [Default: False]")
+
+    parser.add_option("--stats_cache",
+                      dest="stats_cache",
+                      action="store_true",
+                      help="Save whole-bam statistics (insert size, read length, " +
+                           "mapped reads) to a '.svstats.json' file next to each bam " +
+                           "and reuse them in later runs [Default: False]")
+
     parser.add_option("-l",
                       "--loci",
                       dest="region",
@@ -93,6 +106,99 @@ def get_args():
                       action="store",
                       help="Config file for batch processing ")
 
+    parser.add_option("-j",
+                      "--jobs",
+                      dest="jobs",
+                      action="store",
+                      type="int",
+                      help="Number of variants to process in parallel " +
+                           "when running with --config [Default: 1]")
+
+    parser.add_option("--resume",
+                      dest="resume",
+                      action="store_true",
+                      help="When running with --config, save the result of each variant " +
+                           "as it finishes, and reuse those saved by an earlier --resume run " +
+                           "into the same out_dir that didn't finish, if their bams and options " +
+                           "haven't changed. Saved results are removed once the run finishes " +
+                           "[Default: False]")
+
+    parser.add_option("--rescore",
+                      dest="rescore",
+                      action="store_true",
+                      help="When running with --config, work out allele frequencies again from " +
+                           "the evidence table of an earlier run (e.g. after changing purity or sex) " +
+                           "without reading any bams [Default: False]")
+
+    parser.add_option("--stream_out",
+                      dest="stream_out",
+                      action="store_true",
+                      help="When running with --config, write each variant to the output " +
+                           "file as soon as it finishes. The file is sorted once all have " +
+                           "finished [Default: False]")
+
+    parser.add_option("--counts_only",
+                      dest="counts_only",
+                      action="store_true",
+                      help="Only count the reads supporting and opposing each variant, without " +
+                           "writing any bams [Default: False]")
+
+    parser.add_option("--sample_bams",
+                      dest="sample_bams",
+                      action="store_true",
+                      help="When running with --config, add the supporting and opposing reads of " +
+                           "each variant to one bam per sample as it finishes (tagging each read " +
+                           "with the variant's ID in 'VI'), and sort them once at the end, instead " +
+                           "of writing bams for each variant [Default: False]")
+
+    parser.add_option("--serve",
+                      dest="serve",
+                      action="store_true",
+                      help="Keep running and answer variant queries, one json object per line, " +
+                           "read from stdin (or --socket). Each query gives the options for one " +
+                           "variant, e.g. {\"bam\": \"tumour.bam\", \"region\": \"X:100-200\", " +
+                           "\"purity\": 0.8} [Default: False]")
+
+    parser.add_option("--socket",
+                      dest="socket",
+                      action="store",
+                      help="With --serve, answer queries sent to this unix socket instead of stdin",
+                      metavar="FILE")
+
+    parser.add_option("--threads",
+                      dest="threads",
+                      action="store",
+                      type="int",
+                      help="Number of threads used to decompress each " +
+                           "input bam [Default: 1]")
+
+    parser.add_option("--sort_threads",
+                      dest="sort_threads",
+                      action="store",
+                      type="int",
+                      help="Number of threads used by samtools sort [Default: 1]")
+
+    parser.add_option("--sort_memory",
+                      dest="sort_memory",
+                      action="store",
+                      help="Memory per thread used by samtools sort, e.g. 768M " +
+                           "[Default: samtools' default]")
+
+    parser.add_option("--depth_jobs",
+                      dest="depth_jobs",
+                      action="store",
+                      type="int",
+                      help="Number of processes used to count reads in CNV regions. " +
+                           "Tumour and normal bams (and the chunks of --depth_chunk) are counted " +
+                           "at the same time. Not used by the processes of --jobs [Default: 1]")
+
+    parser.add_option("--depth_chunk",
+                      dest="depth_chunk",
+                      action="store",
+                      type="int",
+                      help="With --depth_jobs, split CNV regions longer than this many bps " +
+                           "into chunks counted in parallel [Default: don't split]")
+
     parser.add_option("-v",
                       "--variants",
                       dest="variants_out",
@@ -107,12 +213,19 @@ def get_args():
 
     parser.set_defaults(out_dir='out',
                         purity=1,
+                        jobs=1,
+                        threads=1,
+                        sort_threads=1,
+                        depth_jobs=1,
                         chromfile='chrom_lengths.txt',
                         nn_chroms='non_native_chroms.txt')
 
-    options, args = parser.parse_args()
+    options, args = parser.parse_args(args)
+
+    if options.sample_bams and not options.config:
+        parser.error("--sample_bams can only be used with --config")
 
-    if (options.in_file is None or options.region is None) and not options.test and not options.config:
+    if (options.in_file is None or options.region is None) and not options.test and not options.config and not options.serve:
         parser.print_help()
         print
 
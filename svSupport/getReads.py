@@ -1,7 +1,9 @@
 import pysam
 from collections import defaultdict
 from trackReads import TrackReads
-import re, os
+from cigarOps import classify_cigar
+from merge_bams import bam_writer
+import os
 
 
 def get_reads(bp_regions, bp_number, chrom, chrom2, bp, bp2, options, seen_reads, chroms, supporting, opposing):
@@ -21,14 +23,14 @@ def get_reads(bp_regions, bp_number, chrom, chrom2, bp, bp2, options, seen_reads
     disc_out = os.path.join(options.out_dir, bp_number + "_" + svID + "_disc_reads" + ".bam")
     opposing_reads = os.path.join(options.out_dir, bp_number + "_" + svID + "_opposing" + ".bam")
 
-    samfile = pysam.Samfile(bp_regions, "rb")
+    samfile = bp_regions
     printmate = defaultdict(int)
     bp_sig = defaultdict(int)
     contaminated_reads = 0
     read_tags = defaultdict(list)
     if options.debug: print(" * Looking for reads supporting %s" % bp_number)
 
-    with pysam.AlignmentFile(clipped_out, "wb", template=samfile) as clipped_reads, pysam.AlignmentFile(disc_out, "wb", template=samfile) as disc_reads, pysam.AlignmentFile(opposing_reads, "wb", template=samfile) as op_reads:
+    with bam_writer(clipped_out, samfile.header, options) as clipped_reads, bam_writer(disc_out, samfile.header, options) as disc_reads, bam_writer(opposing_reads, samfile.header, options) as op_reads:
         split_reads = 0
         te_tagged = defaultdict(int)
         alien_integrant = defaultdict(int)
@@ -59,7 +61,7 @@ def get_reads(bp_regions, bp_number, chrom, chrom2, bp, bp2, options, seen_reads
 
             if bpID:
                 clipped_reads.write(read)
-                supporting.append(read.query_name)
+                supporting.add(read, bpID)
                 # seen_reads.append(readtracker)
 
             if options.chromfile:
@@ -70,14 +72,14 @@ def get_reads(bp_regions, bp_number, chrom, chrom2, bp, bp2, options, seen_reads
 
             if bpID:
                 disc_reads.write(read)
-                supporting.append(read.query_name)
+                supporting.add(read, bpID)
                 # seen_reads.append(readtracker)
 
-            if not bpID and not read.query_name in supporting:
+            if not bpID and read.query_name not in supporting:
                 read, bpID, printmate = getOpposing(read, bp, bp_number, chrom2, printmate)
                 if bpID:
                     op_reads.write(read)
-                    opposing.append(read.query_name)
+                    opposing.add(read, bpID)
 
             try:
                 read.get_tag('SV')
@@ -85,10 +87,6 @@ def get_reads(bp_regions, bp_number, chrom, chrom2, bp, bp2, options, seen_reads
             except KeyError:
                 pass
 
-    pysam.index(clipped_out)
-    pysam.index(disc_out)
-    pysam.index(opposing_reads)
-
     return clipped_out, disc_out, opposing_reads, alien_integrant, te_tagged, bp_sig, seen_reads, supporting, opposing, contaminated_reads, read_tags
 
 
@@ -104,14 +102,15 @@ def get_mate(read, samfile):
 
 
 def filterContamination(read, bp, options):
-    """If a read is soft clipped > 3bps at both ends it's probably contamination.
-       don't include in either sv or opposing reads. Note the number of reads with this sig around breakpoint"""
+    """If a read is clipped at both ends it's probably contamination.
+       don't include in either sv or opposing reads. Note the number of reads clipped >= 5 bps
+       at both ends around breakpoint"""
     skip_contaminated = False
     contaminated = False
-    if re.findall(r'(\d+)[S|H]\d+M(\d+)[S|H]', read.cigarstring):
-        sc_5, sc_3 = re.findall(r'(\d+)[S|H]\d+M(\d+)[S|H]', read.cigarstring)[0]
+    cigar = classify_cigar(read)
+    if cigar.double_clipped:
         skip_contaminated = True
-        if sc_5 >= 5 and sc_3 >= 5:
+        if cigar.left_clip >= 5 and cigar.right_clip >= 5:
             if options.debug: print("Skipping double-clippped read %s" % (read.query_name))
             if abs(read.reference_start - bp) < 100:
                 contaminated = True
@@ -223,8 +222,9 @@ def getClipped(read, bp, direction, bp_number, bp_sig, split_reads, options, rea
        bp_r : =====[x]<----
        """
     bpID = None
+    cigar = classify_cigar(read)
 
-    if re.findall(r'(\d+)[S|H]', read.cigarstring):
+    if cigar.left_clip or cigar.right_clip:
         # if right-clipped
         if bp == read.reference_end:
             bpID = rightClipped(read, direction, bp_number, options)
@@ -244,7 +244,7 @@ def getClipped(read, bp, direction, bp_number, bp_sig, split_reads, options, rea
 
 def rightClipped(read, direction, bp_number, options):
     """Looks for reads that are clipped to the right of breakpoint"""
-    if re.findall(r".*?M(\d+)[S|H]", read.cigarstring):
+    if classify_cigar(read).right_clip:
         if options.debug:
             if direction == 'f':
                 print("---> read clipped to right: %s --[-> %s") % (read.cigarstring, read.query_name)
@@ -256,7 +256,7 @@ def rightClipped(read, direction, bp_number, options):
 
 def leftClipped(read, direction, bp_number, options):
     """Looks for reads that are clipped to the left of breakpoint"""
-    if re.findall(r'(\d+)[S|H].*?M', read.cigarstring):
+    if classify_cigar(read).left_clip:
         if options.debug:
             if direction == 'f':
                 print("---> read clipped to left: %s -]--> %s") % (read.cigarstring, read.query_name)
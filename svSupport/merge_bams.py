@@ -1,52 +1,323 @@
 import pysam
 import os
+import copy
 import ntpath
+import shutil
+import heapq
 
 
-def merge_bams(out_file, out_dir, bams):
+_sort_threads = 1
+_sort_memory = None
+
+
+def set_sort_options(threads=1, memory=None):
+    """Set the threads and memory per thread (e.g. '768M') used by samtools sort"""
+    global _sort_threads, _sort_memory
+    _sort_threads = max(1, int(threads or 1))
+    _sort_memory = memory
+
+
+def merge_bams(out_file, out_dir, bams, index=True, sort_inputs=False):
+    """Merge bams into one coordinate sorted bam named '<out_file stem>.s.bam', removing the inputs.
+       Only inputs whose headers don't say they are coordinate sorted are sorted first (or all of
+       them, if sort_inputs is set). The merged bam is indexed if index is set"""
+    head, file_name = ntpath.split(out_file)
+    sorted_bam = os.path.join(out_dir, os.path.splitext(file_name)[0] + ".s" + ".bam")
+
+    presorted = [not sort_inputs and is_sorted(bam_file) for bam_file in bams]
+
+    if len(bams) == 1:
+        # Nothing to merge: the input only needs renaming (or sorting)
+        if presorted[0]:
+            os.rename(bams[0], sorted_bam)
+            if os.path.isfile(bams[0] + ".bai"):
+                os.remove(bams[0] + ".bai")
+            if index:
+                index_bam(sorted_bam)
+        else:
+            sort_bam(out_dir, bams[0], index=index, out_file=sorted_bam, presorted=False)
+            rm_bams(bams)
+        return sorted_bam
+
     s_bams = []
-    for bam_file in bams:
-        sorted_bam = sort_bam(out_dir, bam_file)
-        s_bams.append(sorted_bam)
+    for bam_file, bam_sorted in zip(bams, presorted):
+        if bam_sorted:
+            s_bams.append(bam_file)
+        else:
+            s_bams.append(sort_bam(out_dir, bam_file, index=False, presorted=False))
 
-    rm_bams(bams)
+    try:
+        merge_sorted(sorted_bam, s_bams, rm_dups=False, index=index)
+    except ValueError as err:
+        # e.g. the inputs list their references in different orders, which samtools can reconcile
+        print("Can't merge in one pass: %s" % err)
+        samtools_merge(sorted_bam, out_dir, s_bams, index=index)
+    rm_bams(set(bams + s_bams))
+
+    return sorted_bam
+
+
+def samtools_merge(out_file, out_dir, bams, index=True):
+    """Merge bams with samtools merge (which maps each input's references by name), then sort the result"""
+    unsorted_bam = os.path.join(out_dir, os.path.splitext(ntpath.basename(out_file))[0] + ".unsorted.bam")
+    pysam.merge('-f', unsorted_bam, *bams)
+    sort_bam(out_dir, unsorted_bam, index=index, out_file=out_file, presorted=False)
+    rm_bams([unsorted_bam])
+    return out_file
 
-    in_files = ', '.join(s_bams)
-    print("Merging bam files %s into '%s'") % (in_files, out_file)
-    merge_parameters = ['-f', out_file] + s_bams
-    pysam.merge(*merge_parameters)
 
-    sorted_bam = sort_bam(out_dir, out_file)
+def merge_sorted(out_file, bams, rm_dups=True, index=True):
+    """Merge coordinate sorted bams into one bam in a single streaming pass, in the same order
+       samtools merge would give. If rm_dups is set, reads marked as duplicates, and reads with the
+       same name and start as one already written (as rmDups does), are skipped.
+       Reads are moved to the merged header's references by name, so the inputs' @SQ lines can differ.
+       Raises ValueError (and writes nothing) if any input isn't coordinate sorted, or if the inputs
+       list their references in different orders"""
+    samfiles = [pysam.AlignmentFile(bam, "rb") for bam in bams]
     try:
-        os.remove(out_file)
-    except OSError:
-        print("2 Couldn't remove %s" % out_file)
-        pass
+        for bam, samfile in zip(bams, samfiles):
+            if sort_order(samfile.header) != 'coordinate':
+                raise ValueError("%s is not coordinate sorted" % bam)
 
-    rm_bams(s_bams)
+        header, remap = merge_headers(samfiles, bams)
+        print("Merging bam files %s into '%s'") % (', '.join(bams), out_file)
+        merged = heapq.merge(*[sorted_reads(bam, samfile, i, header if remap[i] else None)
+                               for i, (bam, samfile) in enumerate(zip(bams, samfiles))])
+        reads = (read for key, file_index, n, read in merged)
+        if rm_dups:
+            reads = rm_position_dups(reads)
+        try:
+            with pysam.AlignmentFile(out_file, "wb", header=header) as out:
+                for read in reads:
+                    out.write(read)
+        except ValueError:
+            rm_bams([out_file])
+            raise
+    finally:
+        for samfile in samfiles:
+            samfile.close()
+
+    if index:
+        index_bam(out_file)
+    return out_file
+
+
+def sorted_reads(bam, samfile, file_index, header=None):
+    """Yield (sort key, file_index, n, read) for each read in a coordinate sorted bam, checking
+       that it really is sorted. Reads with the same key are kept in the order of the files they
+       came from, and then the order they are in the file. If a (merged) header is given, reads
+       are moved to its references, by name, first"""
+    last_key = None
+    for n, read in enumerate(samfile.fetch(until_eof=True)):
+        if header is not None:
+            read = pysam.AlignedSegment.from_dict(read.to_dict(), header)
+        key = sort_key(read)
+        if last_key is not None and key < last_key:
+            raise ValueError("%s is not coordinate sorted at %s:%s" % (bam, read.reference_name, read.reference_start))
+        last_key = key
+        yield key, file_index, n, read
+
+
+def dup_key(read):
+    """Reads with the same name starting at the same position (reference and start) are counted
+       as duplicates, here and by regionReads.rm_dups. Mates that start at the same position on
+       different references are both kept"""
+    return read.reference_id, read.reference_start, read.query_name
+
+
+def rm_position_dups(reads):
+    """Skip reads marked as duplicate, or with the same dup_key as a read already seen.
+       As reads come in coordinate order, only the names seen at the current position are kept"""
+    position = None
+    seen_reads = set()
+    for read in reads:
+        key = dup_key(read)
+        if key[:2] != position:
+            position = key[:2]
+            seen_reads.clear()
+
+        if read.query_name in seen_reads:
+            continue
+        seen_reads.add(read.query_name)
+
+        if read.is_duplicate:
+            continue
+        yield read
+
+
+def merge_headers(samfiles, bams):
+    """Header of the first bam, with any other references, read groups and programs from the rest
+       (references are added after the first bam's, as samtools merge does). Returns the header and,
+       for each bam, whether its reads have to be moved to the merged header's reference IDs.
+       Raises ValueError if the bams give a reference different lengths, or list them in different orders"""
+    if all(str(samfile.header) == str(samfiles[0].header) for samfile in samfiles[1:]):
+        return samfiles[0].header, [False] * len(samfiles)
+
+    header = samfiles[0].header.to_dict()
+    tids = dict((line['SN'], tid) for tid, line in enumerate(header.get('SQ', [])))
+    lengths = dict((line['SN'], line['LN']) for line in header.get('SQ', []))
+    remap = [False]
+    for bam, samfile in zip(bams[1:], samfiles[1:]):
+        tid_map = []
+        for name, length in zip(samfile.references, samfile.lengths):
+            if name not in tids:
+                tids[name] = len(tids)
+                lengths[name] = length
+                header.setdefault('SQ', []).append({'SN': name, 'LN': length})
+            elif lengths[name] != length:
+                raise ValueError("%s gives %s a length of %s, not %s" % (bam, name, length, lengths[name]))
+            tid_map.append(tids[name])
+        if tid_map != sorted(tid_map):
+            raise ValueError("%s lists its references in a different order to %s" % (bam, bams[0]))
+        remap.append(tid_map != range(len(tid_map)))
+
+        for tag in 'RG', 'PG':
+            ids = set(line.get('ID') for line in header.get(tag, []))
+            for line in samfile.header.to_dict().get(tag, []):
+                if line.get('ID') not in ids:
+                    header.setdefault(tag, []).append(line)
+                    ids.add(line.get('ID'))
+    return pysam.AlignmentHeader.from_dict(header), remap
+
+
+def sort_key(read):
+    """Order reads as samtools sort does: by reference, position, then strand"""
+    tid = read.reference_id
+    if tid < 0:
+        tid = float('inf')
+    return tid, read.reference_start, read.is_reverse
 
-    return sorted_bam
 
+def sort_bam(out_dir, bam, index=True, out_file=None, presorted=None):
+    """Sort a bam to out_file (by default '<bam stem>.s.bam' in out_dir). A bam that is already
+       coordinate sorted (going by its header, unless presorted is given) is copied instead"""
+    if out_file is None:
+        head, file_name = ntpath.split(bam)
+        file_name = os.path.splitext(file_name)[0]
+        out_file = os.path.join(out_dir, file_name + ".s" + ".bam")
 
-def sort_bam(out_dir, bam):
-    head, file_name = ntpath.split(bam)
-    file_name = os.path.splitext(file_name)[0]
-    sorted_bam = os.path.join(out_dir, file_name + ".s" + ".bam")
+    if presorted is None:
+        presorted = is_sorted(bam)
 
     try:
-        pysam.sort("-o", sorted_bam, bam)
-        index_bam(sorted_bam)
-    except:
-        print("Can't sort %s" % bam)
+        if presorted:
+            shutil.copyfile(bam, out_file)
+        else:
+            sort_parameters = []
+            if _sort_threads > 1:
+                sort_parameters += ['-@', str(_sort_threads - 1)]
+            if _sort_memory:
+                sort_parameters += ['-m', _sort_memory]
+            pysam.sort(*(sort_parameters + ['-o', out_file, bam]))
+        if index:
+            index_bam(out_file)
+    except (pysam.SamtoolsError, IOError) as err:
+        print("Can't sort %s: %s" % (bam, err))
 
-    return(sorted_bam)
+    return(out_file)
+
+
+def is_sorted(bam):
+    """Whether a bam's header says it is coordinate sorted"""
+    try:
+        with pysam.AlignmentFile(bam, "rb") as samfile:
+            return sort_order(samfile.header) == 'coordinate'
+    except (IOError, ValueError):
+        return False
+
+
+def sort_order(header):
+    """The SO field of a header's @HD line (read from the header text, which is much quicker
+       than converting the header to a dict)"""
+    first_line = str(header).split('\n', 1)[0]
+    if first_line.startswith('@HD'):
+        for field in first_line.split('\t')[1:]:
+            if field.startswith('SO:'):
+                return field[3:]
+
+
+def unsorted_header(header):
+    """A copy of a header (AlignmentHeader or dict) marked as unsorted, for bams whose
+       reads won't be written in coordinate order"""
+    if not isinstance(header, dict):
+        header = header.to_dict()
+    header = dict(header)
+    header['HD'] = dict(header.get('HD', {'VN': '1.0'}), SO='unsorted')
+    return header
 
 
 def index_bam(bam):
     try:
         pysam.index(bam)
-    except:
-        print("Can't index %s" % bam)
+    except pysam.SamtoolsError as err:
+        print("Can't index %s: %s" % (bam, err))
+
+
+class NullBam(object):
+    """Stands in for a bam opened for writing when only counts are wanted. Reads written to it are dropped"""
+    written = 0
+
+    def write(self, read):
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+class CountingBam(NullBam):
+    """A bam opened for writing that counts the reads written to it"""
+
+    def __init__(self, out_file, header):
+        self.bam = pysam.AlignmentFile(out_file, "wb", header=header)
+        self.written = 0
+
+    def write(self, read):
+        self.written += 1
+        return self.bam.write(read)
+
+    def close(self):
+        self.bam.close()
+
+
+class ReadList(NullBam):
+    """Stands in for a bam opened for writing, keeping a copy of each read written to it in memory"""
+
+    def __init__(self):
+        self.reads = []
+
+    @property
+    def written(self):
+        return len(self.reads)
+
+    def write(self, read):
+        self.reads.append(copy.copy(read))
+
+
+def bam_writer(out_file, header, options):
+    """Open out_file to write reads to, keeping the writer in options.writers[out_file] so that the
+       reads written can be counted without reading the bam again (see reads_written). In counts
+       only mode the reads are dropped, and when writing sample bams they're kept in memory until
+       the variant is done"""
+    if options.counts_only:
+        writer = NullBam()
+    elif options.sample_bams:
+        writer = ReadList()
+    else:
+        writer = CountingBam(out_file, header)
+    options.writers[out_file] = writer
+    return writer
+
+
+def reads_written(bams, options):
+    """Number of reads written to bams through bam_writer"""
+    return sum(options.writers[bam].written for bam in bams if bam in options.writers)
 
 
 def rm_bams(bams):
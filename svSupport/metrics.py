@@ -0,0 +1,36 @@
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+counters = ['seconds', 'calls', 'fetch_calls', 'reads_fetched', 'reads_written']
+
+
+class Metrics(object):
+    """Time taken, and reads fetched and written, by each stage of a variant's run"""
+
+    def __init__(self):
+        self.stages = OrderedDict()
+
+    def add(self, stage, **counts):
+        record = self.stages.setdefault(stage, OrderedDict((counter, 0) for counter in counters))
+        for counter, n in counts.items():
+            record[counter] += n
+        return record
+
+    @contextmanager
+    def stage(self, stage, regions=None):
+        """Time a stage. If `regions` (a RegionReads) is given, fetches made from it during the stage are counted"""
+        if regions is not None:
+            fetch_calls, reads_fetched = regions.fetch_calls, regions.reads_fetched
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add(stage, seconds=time.time() - start, calls=1)
+            if regions is not None:
+                self.add(stage, fetch_calls=regions.fetch_calls - fetch_calls, reads_fetched=regions.reads_fetched - reads_fetched)
+
+    def as_dict(self):
+        return OrderedDict([('seconds', sum(record['seconds'] for record in self.stages.values())),
+                            ('stages', self.stages)])
+
@@ -1,94 +1,256 @@
 import os, re
+import copy
+import json
 import pandas as pd
-from worker import worker
-from merge_bams import merge_bams
+from multiprocessing.pool import ThreadPool
+from worker import score_evidence
+from merge_bams import merge_bams, merge_sorted, rm_bams
 from worker import rmDups
+from bamPool import close_bams
+from metrics import Metrics
+from runVariants import set_bam_stats, run_variants
+from resultCache import ResultCache
+from sampleBams import set_sample_dir, close_writers, sort_sample_bam
+from collections import OrderedDict
 import ntpath
 
 
 def parse_config(options):
     print("\nExtracting arguments from config file: %s" % options.config)
     base_name = ntpath.basename(options.config)
+    sample = base_name.split('_')[0]
 
     if not options.variants_out:
-        sample = base_name.split('_')[0]
-        outfile = sample + '_svSupport.txt'
-        options.variants_out = outfile
+        options.variants_out = sample + '_svSupport.txt'
+    outfile = options.variants_out
 
     df = pd.read_csv(options.config, delimiter="\t")
     df = df.where((pd.notnull(df)), None)
+    for column in 'notes', 'status':
+        df[column] = ['' if value == '-' else value for value in df[column]]
+    rows = df.to_dict('index')
 
+    variants = []
     for i in df.index:
-        options.in_file = df.loc[i, 'bam']
-        options.purity = float(df.loc[i, 'tumour_purity'])
-        options.normal_bam = df.loc[i, 'normal_bam']
-        options.guess = df.loc[i, 'guess']
-        options.sex = df.loc[i, 'sex']
-        options.sv_type = df.loc[i, 'type']
-
-        if df.loc[i, 'notes'] == '-': df.loc[i, 'notes'] = ''
-        if df.loc[i, 'status'] == '-': df.loc[i, 'status'] = ''
-
-        genotype = df.loc[i, 'genotype']
-        if genotype != 'somatic_tumour': continue
-
-        if df.loc[i, 'chromosome1'] != df.loc[i, 'chromosome2']:
-            options.region = str(df.loc[i, 'chromosome1']) + ":" + str(df.loc[i, 'bp1']) + "-" + str(df.loc[i, 'chromosome2']) + ":" + str(df.loc[i, 'bp2'])
+        row = rows[i]
+        if row['genotype'] != 'somatic_tumour': continue
+
+        variant = copy.copy(options)
+        variant.in_file = row['bam']
+        variant.purity = float(row['tumour_purity'])
+        variant.normal_bam = row['normal_bam']
+        variant.guess = row['guess']
+        variant.sex = row['sex']
+        variant.sv_type = row['type']
+
+        if row['chromosome1'] != row['chromosome2']:
+            variant.region = str(row['chromosome1']) + ":" + str(row['bp1']) + "-" + str(row['chromosome2']) + ":" + str(row['bp2'])
         else:
-            options.region = df.loc[i, 'position']
+            variant.region = row['position']
 
         # TODO this can be cleaned up now (seeing as we're not marking vars prior to svSupport
-        if options.guess and df.loc[i, 'status'] != 'F':
-            options.find_bps = True
+        if variant.guess and row['status'] != 'F':
+            variant.find_bps = True
+
+        variants.append((i, variant))
+
+    out_columns = [column for column in df.columns if column not in dropped_columns]
+    stream = None
+    if options.stream_out:
+        stream = open(outfile, 'w')
+        stream.write('\t'.join(out_columns) + '\n')
+        stream.flush()
+
+    updates = {}
+
+    def collect(i, variant, result, metrics, evidence):
+        updates[i] = variant_update(rows[i], variant, result)
+        if stream is not None:
+            row = dict(rows[i], **updates[i])
+            stream.write('\t'.join('' if row[column] is None else str(row[column]) for column in out_columns) + '\n')
+            stream.flush()
+
+    evidence_file = os.path.splitext(outfile)[0] + '_evidence.txt'
+    cache = None
+    try:
+        if options.rescore:
+            results = rescore_variants(variants, load_evidence_table(evidence_file), collect)
+        else:
+            set_bam_stats(variants)
+
+            cache = ResultCache(os.path.join(options.out_dir, 'variant_cache'))
+            resume = options.resume
+            if options.sample_bams:
+                set_sample_dir(options.out_dir)
+                if resume:
+                    # The evidence of variants run before isn't in this run's sample bams
+                    print("Can't resume when writing sample bams. Running every variant again")
+                    resume = False
+
+            # Results (and the bams they link to) are only kept for runs that can be resumed
+            if not resume:
+                cache.clear()
+                cache = None
+
+            results = run_variants(variants, options.jobs, cache, resume, collect)
+            close_writers()
+            close_bams()
+            write_evidence_table(results, rows, evidence_file)
+    finally:
+        if stream is not None:
+            stream.close()
+
+    variant_metrics = []
+    for i, variant, result, metrics, evidence in results:
+        metrics['row'] = int(i)
+        metrics['event'] = str(rows[i]['event'])
+        metrics['region'] = variant.region
+        variant_metrics.append(metrics)
+
+    # Fill in each updated column in one go
+    for column in updated_columns:
+        values = df[column].tolist()
+        for n, i in enumerate(df.index):
+            if i in updates and column in updates[i]:
+                values[n] = updates[i][column]
+        df[column] = values
+
+    # Re-scoring leaves the bams (and metrics) of the run that counted the evidence alone
+    if not options.rescore:
+        merge_metrics = Metrics()
+        with merge_metrics.stage('mergeAll'):
+            mergeAll(options, sample)
+        # Every variant is finished and merged, so there's nothing left to resume
+        if cache is not None:
+            cache.clear()
+        merge_metrics = merge_metrics.as_dict()
+        merge_metrics['event'] = 'mergeAll'
+        variant_metrics.append(merge_metrics)
+
+    df = df.drop(dropped_columns, axis=1)
+    df = df.sort_values(['chromosome1', 'bp1', 'chromosome2', 'bp2'])
+    df.to_csv(outfile, sep="\t", index=False)
 
-        bp1, bp2, old_af, af, sv_type, configuration, notes, split_support, disc_support = worker(options)
+    if not options.rescore:
+        write_metrics(variant_metrics, os.path.splitext(outfile)[0] + '_metrics.jsonl')
 
-        if options.normal_bam:
-            df.loc[i, 'configuration'] = sv_type
-            sv_type = df.loc[i, 'type']
-        else:
-             df.loc[i, 'configuration'] = configuration
 
-        notes = mark_low_FC(notes, options.sex, df.loc[i, 'log2(cnv)'], sv_type, df.loc[i, 'chromosome1'], split_support)
+# Config columns that aren't written to the output, and the columns filled in for each variant
+dropped_columns = ['bam', 'normal_bam', 'tumour_purity', 'guess', 'sample', 'sex']
+updated_columns = ['configuration', 'notes', 'status', 'type', 'split_reads', 'disc_reads', 'allele_frequency', 'bp1', 'bp2', 'position']
 
-        oaf = '='.join(map(str, ["unadj_af", old_af]))
-        osv = '='.join(map(str, ["svtype", options.sv_type]))
-        nlist = filter(None, notes)
-        nlist.insert(0, oaf)
-        nlist.insert(0, osv)
-        print(nlist)
-        nstring = '; '.join(nlist)
-        if df.loc[i, 'notes']:
-            df.loc[i, 'notes'] = nstring + "; " + df.loc[i, 'notes']
-        else: df.loc[i, 'notes'] = nstring
 
-        df.loc[i, 'status'] = mark_filters(notes)
-        df.loc[i, 'type'] = sv_type
+def variant_update(row, variant, result):
+    """The output columns of a config row that change once its variant has been scored"""
+    bp1, bp2, old_af, af, sv_type, configuration, notes, split_support, disc_support = result
+    update = {}
 
-        if split_support is not None: df.loc[i, 'split_reads'] = split_support
-        if disc_support is not None: df.loc[i, 'disc_reads'] = disc_support
+    if variant.normal_bam:
+        update['configuration'] = sv_type
+        sv_type = row['type']
+    else:
+        update['configuration'] = configuration
 
-        # TODO - this adds a new col for unadjusted af 2.7.20. Need to fix downstream. Might be better to just add to notes...
+    notes = mark_low_FC(notes, variant.sex, row['log2(cnv)'], sv_type, row['chromosome1'], split_support)
 
-        # df.loc[i, 'original_allele_frequency'] = old_af
-        df.loc[i, 'allele_frequency'] = af
-        df.loc[i, 'bp1'] = bp1
-        df.loc[i, 'bp2'] = bp2
+    oaf = '='.join(map(str, ["unadj_af", old_af]))
+    osv = '='.join(map(str, ["svtype", variant.sv_type]))
+    nlist = filter(None, notes)
+    nlist.insert(0, oaf)
+    nlist.insert(0, osv)
+    print(nlist)
+    nstring = '; '.join(nlist)
+    if row['notes']:
+        update['notes'] = nstring + "; " + row['notes']
+    else: update['notes'] = nstring
 
+    update['status'] = mark_filters(notes)
+    update['type'] = sv_type
 
-        if df.loc[i, 'chromosome1'] != df.loc[i, 'chromosome2']:
-            df.loc[i, 'position'] = str(df.loc[i, 'chromosome1']) + ":" + str(bp1) + " " + str(df.loc[i, 'chromosome2']) + ":" + str(bp2)
-        else:
-            df.loc[i, 'position'] = str(df.loc[i, 'chromosome1']) + ":" + str(bp1) + "-" + str(bp2)
+    if split_support is not None: update['split_reads'] = split_support
+    if disc_support is not None: update['disc_reads'] = disc_support
 
-        if af == 0:
-            df.loc[i, 'status'] = 'F'
+    # TODO - this adds a new col for unadjusted af 2.7.20. Need to fix downstream. Might be better to just add to notes...
 
-    mergeAll(options, sample)
+    # update['original_allele_frequency'] = old_af
+    update['allele_frequency'] = af
+    update['bp1'] = bp1
+    update['bp2'] = bp2
 
-    df = df.drop(['bam', 'normal_bam', 'tumour_purity', 'guess', 'sample', 'sex'], axis=1)
-    df = df.sort_values(['chromosome1', 'bp1', 'chromosome2', 'bp2'])
-    df.to_csv(outfile, sep="\t", index=False)
+    if row['chromosome1'] != row['chromosome2']:
+        update['position'] = str(row['chromosome1']) + ":" + str(bp1) + " " + str(row['chromosome2']) + ":" + str(bp2)
+    else:
+        update['position'] = str(row['chromosome1']) + ":" + str(bp1) + "-" + str(bp2)
+
+    if af == 0:
+        update['status'] = 'F'
+
+    return update
+
+
+def read_notes(value):
+    return [str(note) for note in json.loads(value)]
+
+
+# Columns of the evidence table, and how to read each back
+evidence_columns = [('row', int), ('event', str), ('region', str), ('bam', str), ('normal_bam', str), ('kind', str),
+                    ('chrom', str), ('bp1', int), ('bp2', int), ('support', int), ('oppose', int),
+                    ('split_reads', int), ('disc_reads', int), ('normal_reads', int), ('tumour_reads', int),
+                    ('sv_type', str), ('configuration', str), ('notes', read_notes)]
+
+
+def write_evidence_table(results, rows, evidence_out):
+    """Write the evidence counted for each variant (see worker.score_evidence), one row per variant,
+       so that the variants can be re-scored with --rescore without reading the bams again"""
+    with open(evidence_out, 'w') as out:
+        out.write('\t'.join(column for column, _ in evidence_columns) + '\n')
+        for i, variant, result, metrics, evidence in results:
+            record = dict(evidence, row=i, event=rows[i]['event'], region=variant.region,
+                          bam=variant.in_file, normal_bam=variant.normal_bam, notes=json.dumps(evidence['notes']))
+            out.write('\t'.join('' if record.get(column) is None else str(record[column]) for column, _ in evidence_columns) + '\n')
+    print("Written evidence for each variant to %s" % evidence_out)
+
+
+def load_evidence_table(evidence_file):
+    """Read an evidence table written by write_evidence_table, keyed by config row"""
+    evidence = {}
+    with open(evidence_file) as table:
+        header = table.readline().rstrip('\n').split('\t')
+        if header != [column for column, _ in evidence_columns]:
+            raise ValueError("%s isn't an evidence table written by this version of svSupport" % evidence_file)
+        for line in table:
+            values = line.rstrip('\n').split('\t')
+            record = OrderedDict((column, read(value) if value else None) for (column, read), value in zip(evidence_columns, values))
+            evidence[record['row']] = record
+    return evidence
+
+
+def rescore_variants(variants, evidence, on_result=None):
+    """Score each variant from its evidence with its (possibly updated) purity and sex,
+       without opening any bams. Returns results in the same form as run_variants"""
+    results = []
+    for i, variant in variants:
+        record = evidence.get(i)
+        if record is None or record['region'] != variant.region or record['bam'] != variant.in_file or \
+                record['normal_bam'] != variant.normal_bam:
+            raise ValueError("No evidence for row %s (%s) from the same bams. Rerun without --rescore" % (i, variant.region))
+
+        metrics = Metrics()
+        with metrics.stage('rescore'):
+            result = score_evidence(record, variant.purity, variant.sex)
+        results.append((i, variant, result, metrics.as_dict(), record))
+        if on_result is not None:
+            on_result(*results[-1])
+    print("Re-scored %s variants" % len(results))
+    return results
+
+
+def write_metrics(variant_metrics, metrics_out):
+    """Write the time taken and reads processed by each stage, one line of json per variant"""
+    with open(metrics_out, 'w') as out:
+        for metrics in variant_metrics:
+            out.write(json.dumps(metrics) + '\n')
+    print("Written metrics for each variant to %s" % metrics_out)
 
 
 def mark_low_FC(notes, sex, fc, sv_type, chrom, split_support):
@@ -131,20 +293,36 @@ def mergeAll(options, sample):
         elif file.endswith("regions.s.bam"):
             reg.append(os.path.join(options.out_dir, file))
 
-    if len(su) > 1:
-        allsup = os.path.join(options.out_dir, sample + '_supporting_dirty.bam')
-        allop = os.path.join(options.out_dir, sample + '_opposing_dirty.bam')
-        allregions = os.path.join(options.out_dir, sample + '_regions_dirty.bam')
-
-        sumerged = merge_bams(allsup, options.out_dir, su)
-        opmerged = merge_bams(allop, options.out_dir, op)
-        remerged = merge_bams(allregions, options.out_dir, reg)
-
-        merged_su_nodups = os.path.join(sample + '_supporting.bam')
-        merged_op_nodups = os.path.join(sample + '_opposing.bam')
-        merged_regs_nodups = os.path.join(sample + '_regions.bam')
-
-        rmDups(sumerged, merged_su_nodups, options.out_dir)
-        rmDups(opmerged, merged_op_nodups, options.out_dir)
-        rmDups(remerged, merged_regs_nodups, options.out_dir)
+    if options.sample_bams:
+        # Each variant's evidence was added to the sample bams as it finished, so they only need sorting
+        for kind in 'supporting', 'opposing':
+            sort_sample_bam(kind, sample + '_' + kind, options.out_dir)
+        if reg:
+            merge_sample_bams(reg, sample + '_regions', options.out_dir)
+
+    elif len(su) > 1:
+        # The three merges are independent, so run them at the same time
+        pool = ThreadPool(3)
+        try:
+            merges = [pool.apply_async(merge_sample_bams, (bams, sample + '_' + kind, options.out_dir))
+                      for bams, kind in [(su, 'supporting'), (op, 'opposing'), (reg, 'regions')]]
+            for merge in merges:
+                merge.get()
+        finally:
+            pool.close()
+            pool.join()
+
+
+def merge_sample_bams(bams, name, out_dir):
+    """Merge the (coordinate sorted) bams of each variant into a single indexed, deduplicated bam.
+       If any of them isn't sorted, fall back to sorting and merging them all"""
+    merged = os.path.join(out_dir, name + '.bam')
+    try:
+        merge_sorted(merged, bams)
+        rm_bams(bams)
+    except ValueError as err:
+        print("Can't merge without sorting: %s" % err)
+        dirty = merge_bams(os.path.join(out_dir, name + '_dirty.bam'), out_dir, bams, index=False, sort_inputs=True)
+        rmDups(dirty, name + '.bam', out_dir)
+    return merged
 
@@ -0,0 +1,35 @@
+class ReadEvidence(object):
+    """Registry of reads supporting (or opposing) a variant, keyed by read name.
+       Each read name maps to the list of evidence recorded for it (e.g. 'r_bp1', 'bp2_opposing'),
+       so membership tests, adds and removes are all O(1)"""
+
+    def __init__(self, reads=None):
+        self.reads = {}
+        if reads:
+            for name, evidence in reads.items():
+                self.reads[name] = list(evidence)
+
+    def __contains__(self, query_name):
+        return query_name in self.reads
+
+    def __len__(self):
+        return len(self.reads)
+
+    def __iter__(self):
+        return iter(self.reads)
+
+    def add(self, read, evidence):
+        self.reads.setdefault(read.query_name, []).append(evidence)
+
+    def remove(self, query_name):
+        del self.reads[query_name]
+
+    def evidence(self, query_name):
+        return self.reads.get(query_name, [])
+
+    def evidence_count(self):
+        """Total number of pieces of evidence recorded (a read can contribute more than one)"""
+        return sum(len(evidence) for evidence in self.reads.values())
+
+    def copy(self):
+        return ReadEvidence(self.reads)
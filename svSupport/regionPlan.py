@@ -0,0 +1,109 @@
+import os
+from bisect import bisect_left
+from collections import defaultdict
+
+from bamPool import open_bam
+from regionReads import read_end
+
+_extracts = {}
+
+
+def plan_regions(jobs):
+    """Group jobs whose windows overlap in the same bam, so that their reads can be fetched once.
+       `jobs` is a list of (key, bam, windows), where windows are (chrom, start, end).
+       Returns a list of (keys, bam, intervals), with the overlapping windows of each group
+       merged into intervals, and groups in the order of their first job"""
+    order = dict((key, n) for n, (key, bam, windows) in enumerate(jobs))
+    parent = dict((key, key) for key in order)
+
+    def find(key):
+        while parent[key] != key:
+            parent[key] = parent[parent[key]]
+            key = parent[key]
+        return key
+
+    by_chrom = defaultdict(list)
+    for key, bam, windows in jobs:
+        for chrom, start, end in windows:
+            by_chrom[(os.path.abspath(bam), chrom)].append((start, end, key))
+
+    intervals = defaultdict(list)
+    for (bam, chrom), windows in by_chrom.items():
+        windows.sort()
+        start, end, first = windows[0]
+        for window_start, window_end, key in windows[1:]:
+            if window_start < end:
+                parent[find(key)] = find(first)
+                end = max(end, window_end)
+            else:
+                intervals[(bam, first)].append((chrom, start, end))
+                start, end, first = window_start, window_end, key
+        intervals[(bam, first)].append((chrom, start, end))
+
+    groups = defaultdict(list)
+    for key in sorted(order, key=order.get):
+        groups[find(key)].append(key)
+
+    bams = dict((key, bam) for key, bam, windows in jobs)
+    plan = []
+    for root in sorted(groups, key=order.get):
+        keys = groups[root]
+        group_intervals = []
+        for key in keys:
+            group_intervals.extend(intervals.get((os.path.abspath(bams[key]), key), []))
+        plan.append((keys, bams[root], sorted(group_intervals)))
+    return plan
+
+
+class RegionExtract(object):
+    """Reads from merged intervals of a bam, fetched once and held in memory so that every variant
+       whose windows fall inside them can be served without going back to the bam. fetch() returns
+       the same reads, in the same order, as fetching the window from the bam would"""
+
+    def __init__(self, bam_file, intervals):
+        self.bam_file = os.path.abspath(bam_file)
+        self.fetch_calls = 0
+        self.reads_fetched = 0
+        self._intervals = defaultdict(list)
+
+        samfile = open_bam(bam_file)
+        for chrom, start, end in intervals:
+            if chrom not in samfile.references:
+                continue
+            end = min(end, samfile.get_reference_length(chrom))
+            reads = list(samfile.fetch(chrom, start, end))
+            max_span = max([read_end(read) - read.reference_start for read in reads] or [0])
+            self._intervals[chrom].append((start, end, reads, [read.reference_start for read in reads], max_span))
+            self.fetch_calls += 1
+            self.reads_fetched += len(reads)
+
+    def _interval(self, chrom, start, end):
+        for interval in self._intervals.get(chrom, []):
+            if interval[0] <= start and end <= interval[1]:
+                return interval
+
+    def covers(self, windows):
+        return all(self._interval(chrom, start, end) for chrom, start, end in windows)
+
+    def fetch(self, chrom, start, end):
+        interval_start, interval_end, reads, starts, max_span = self._interval(chrom, start, end)
+        lo = bisect_left(starts, start - max_span)
+        hi = bisect_left(starts, end)
+        return [read for read in reads[lo:hi] if read_end(read) > start]
+
+
+def use_extract(extract):
+    """Serve windows of extract.bam_file from `extract` (in this process) until it is released"""
+    _extracts[extract.bam_file] = extract
+
+
+def release_extract(extract):
+    if _extracts.get(extract.bam_file) is extract:
+        del _extracts[extract.bam_file]
+
+
+def shared_extract(bam_file, windows):
+    """The extract in use for bam_file, if it holds all of `windows`"""
+    extract = _extracts.get(os.path.abspath(bam_file))
+    if extract is not None and extract.covers(windows):
+        return extract
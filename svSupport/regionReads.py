@@ -0,0 +1,173 @@
+import copy
+from bisect import bisect_left
+import pysam
+
+from merge_bams import index_bam, sort_key, dup_key
+
+
+class RegionReads(object):
+    """Reads from one or more windows of a bam file held in memory as a coordinate-sorted,
+       deduplicated list. Supports the parts of the pysam.AlignmentFile interface used when
+       looking for reads around breakpoints (fetch, mate, header), so the windows only need
+       to be read from the input bam once and never written to disk as intermediate files.
+       If `extract` (a RegionExtract holding the windows) is given, the windows are taken from it
+       rather than fetched from samfile"""
+
+    def __init__(self, samfile, windows, distant_mates=False, extract=None):
+        self.header = samfile.header
+        self.references = samfile.references
+        self.windows = windows
+        self.distant_mates = distant_mates
+        self._source = samfile
+        self._tids = dict((chrom, tid) for tid, chrom in enumerate(samfile.references))
+        self._mates = None
+        self.fetch_calls = 0
+        self.reads_fetched = 0
+        self.shared = extract is not None
+
+        source = extract if extract is not None else samfile
+        reads = []
+        for chrom, start, end in windows:
+            reads.extend(source.fetch(chrom, start, end))
+        # Number of reads read from the input bam (before removing duplicates)
+        self.source_reads = len(reads)
+
+        # Stable sort keeps reads from earlier windows first at the same position
+        reads.sort(key=sort_key)
+        self.reads = rm_dups(reads)
+        self._index = self._build_index()
+
+    def __len__(self):
+        return len(self.reads)
+
+    def _build_index(self):
+        """For each reference, record where its reads sit in self.reads, their start
+           positions and the longest span of any read (how far back an overlapping read can start)"""
+        index = {}
+        for i, read in enumerate(self.reads):
+            tid = read.reference_id
+            if tid not in index:
+                index[tid] = [i, [], 0]
+            index[tid][1].append(read.reference_start)
+            index[tid][2] = max(index[tid][2], read_end(read) - read.reference_start)
+        return index
+
+    def _overlapping(self, tid, start, stop):
+        if tid not in self._index:
+            return []
+        offset, starts, max_span = self._index[tid]
+        lo = bisect_left(starts, start - max_span)
+        hi = bisect_left(starts, stop)
+        return [read for read in self.reads[offset + lo:offset + hi] if read_end(read) > start]
+
+    def fetch(self, contig=None, start=None, stop=None):
+        """Iterate over copies of the reads overlapping contig:start-stop (or all reads),
+           in coordinate order. Copies are returned so that tagging reads in one pass
+           doesn't affect the next"""
+        if contig is None:
+            reads = self.reads
+        else:
+            if contig not in self._tids:
+                raise ValueError("invalid contig `%s`" % contig)
+            if start is None:
+                start = 0
+            if stop is None:
+                stop = float('inf')
+            if start < 0:
+                raise ValueError('start out of range (%i)' % start)
+            reads = self._overlapping(self._tids[contig], start, stop)
+
+        self.fetch_calls += 1
+        self.reads_fetched += len(reads)
+        for read in reads:
+            yield copy.copy(read)
+
+    def pair_mates(self):
+        """Group the alignments (including supplementary) of each read1 and read2 by
+           read name in a single pass, so that mates can be looked up without searching the region"""
+        mates = {}
+        for read in self.reads:
+            pair = mates.setdefault(read.query_name, ([], []))
+            if read.is_read1:
+                pair[0].append(read)
+            if read.is_read2:
+                pair[1].append(read)
+
+        self._mates = mates
+        return mates
+
+    def mate(self, read):
+        """Return the mate of `read`. Raises ValueError if it can't be found (as pysam.AlignmentFile.mate does).
+           Within the region this matches pysam.AlignmentFile.mate, which returns the first read with the
+           same name and the other read1/read2 flag overlapping anywhere from the mate position to the end
+           of the mate's reference (including supplementary alignments).
+           If distant_mates is set, mates falling outside the region are looked up in the input bam"""
+        if not read.is_paired:
+            raise ValueError("read %s: is unpaired" % read.query_name)
+        if read.mate_is_unmapped:
+            raise ValueError("mate %s: is unmapped" % read.query_name)
+
+        if self._mates is None:
+            self.pair_mates()
+
+        if read.query_name in self._mates:
+            start = read.next_reference_start + 1
+            for mate in self._mates[read.query_name][1 if read.is_read1 else 0]:
+                if mate.reference_id == read.next_reference_id and read_end(mate) > start:
+                    return copy.copy(mate)
+
+        if self.distant_mates:
+            mate = self._distant_mate(read)
+            if mate:
+                return mate
+
+        raise ValueError("mate not found")
+
+    def _distant_mate(self, read):
+        """Indexed lookup of the primary alignment of a mate lying outside the region windows"""
+        chrom = self.references[read.next_reference_id]
+        pos = read.next_reference_start
+        for window_chrom, start, end in self.windows:
+            if window_chrom == chrom and start <= pos < end:
+                return
+
+        mate_flag = 0x80 if read.is_read1 else 0x40
+        for mate in self._source.fetch(chrom, pos, pos + 1):
+            if mate.reference_start == pos and mate.flag & mate_flag and mate.query_name == read.query_name \
+                    and not mate.is_secondary and not mate.is_supplementary:
+                return mate
+
+    def write(self, out_file):
+        """Write the reads to a (coordinate sorted) indexed bam file"""
+        with pysam.AlignmentFile(out_file, "wb", header=self.header) as out:
+            for read in self.reads:
+                out.write(read)
+        index_bam(out_file)
+        return out_file
+
+
+def read_end(read):
+    """End of the read on the reference, as used by htslib when fetching regions"""
+    end = read.reference_end
+    if end is None:
+        end = read.reference_start + 1
+    return end
+
+
+def rm_dups(reads):
+    """Skip if read is marked as duplicate, or we see a read with the same name and starting position
+       (as will happen if we are merging close by regions) more than once. Duplicates are matched
+       on merge_bams.dup_key, as rmDups does for the bams written"""
+    seen_reads = set()
+    kept = []
+    for read in reads:
+        read_key = dup_key(read)
+        if read_key in seen_reads:
+            continue
+        seen_reads.add(read_key)
+
+        if read.is_duplicate:
+            continue
+        kept.append(read)
+
+    return kept
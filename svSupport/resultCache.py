@@ -0,0 +1,82 @@
+import os
+import json
+import errno
+import shutil
+import hashlib
+
+# Options that change what worker returns (or writes) for a variant
+result_options = ['region', 'purity', 'find_bps', 'slop', 'distant_mates', 'sex', 'sv_type', 'guess', 'counts_only', 'sample_bams']
+
+
+def file_id(path):
+    """Path, modification time and size of a file, or None if there isn't one"""
+    if not path or not os.path.isfile(path):
+        return None
+    stat = os.stat(path)
+    return [os.path.abspath(path), stat.st_mtime, stat.st_size]
+
+
+def link_or_copy(src, dest):
+    if os.path.exists(dest):
+        os.remove(dest)
+    try:
+        os.link(src, dest)
+    except OSError:
+        shutil.copyfile(src, dest)
+
+
+class ResultCache(object):
+    """Results of finished variants, saved in cache_dir as each one completes, so that a config
+       run that stops part way through can be picked up again. Each result is stored with the
+       bams the variant wrote, under a key made from its input bams and the options affecting it"""
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+
+    def clear(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def key(self, options):
+        inputs = [file_id(options.in_file), file_id(options.normal_bam),
+                  file_id(options.chromfile), file_id(options.nn_chroms)]
+        inputs += [getattr(options, option, None) for option in result_options]
+        return hashlib.sha1(json.dumps(inputs, sort_keys=True)).hexdigest()
+
+    def _paths(self, key):
+        return os.path.join(self.cache_dir, key + '.json'), os.path.join(self.cache_dir, key)
+
+    def load(self, options, out_dir):
+        """Return the saved (result, metrics, evidence) for a variant, linking the bams it wrote
+           back into out_dir. Returns None if it hasn't been run with the same inputs"""
+        result_file, bam_dir = self._paths(self.key(options))
+        try:
+            with open(result_file) as cached:
+                saved = json.load(cached)
+        except (IOError, ValueError):
+            return None
+
+        if 'evidence' not in saved or not all(os.path.isfile(os.path.join(bam_dir, f)) for f in saved['files']):
+            return None
+        for f in saved['files']:
+            link_or_copy(os.path.join(bam_dir, f), os.path.join(out_dir, f))
+
+        metrics = saved['metrics']
+        metrics['cached'] = True
+        return saved['result'], metrics, saved['evidence']
+
+    def save(self, options, result, metrics, evidence, out_dir, files):
+        """Save a variant's result and evidence, with the bams (in out_dir) that it wrote"""
+        result_file, bam_dir = self._paths(self.key(options))
+        try:
+            os.makedirs(bam_dir)
+        except OSError as err:
+            if err.errno != errno.EEXIST:
+                raise
+        for f in files:
+            link_or_copy(os.path.join(out_dir, f), os.path.join(bam_dir, f))
+
+        # Written last (and renamed into place) so that only complete entries are loaded
+        tmp = result_file + '.tmp'
+        with open(tmp, 'w') as out:
+            json.dump({'result': result, 'metrics': metrics, 'evidence': evidence, 'files': files}, out)
+        os.rename(tmp, result_file)
@@ -0,0 +1,148 @@
+import os
+import copy
+import shutil
+import time
+from multiprocessing import Pool
+from functools import partial
+
+from worker import worker, getCooridinates
+from utils import make_dirs, find_is_sd
+from bamStats import get_bam_stats
+from metrics import Metrics
+from regionPlan import plan_regions, RegionExtract, use_extract, release_extract
+
+
+def set_bam_stats(variants):
+    """Work out whole-bam statistics (slop, mapped reads) once per bam rather than once
+       per variant, going by each variant's own options. Worker processes inherit the
+       cached statistics"""
+    for i, variant in variants:
+        if variant.normal_bam:
+            for bam in variant.in_file, variant.normal_bam:
+                get_bam_stats(bam, variant.stats_cache).mapped_reads()
+        elif not variant.slop:
+            variant.slop = find_is_sd(variant.in_file, 10000, variant.stats_cache)
+
+    return variants
+
+
+def run_variants(variants, jobs, cache=None, resume=False, on_result=None):
+    """Run worker over each variant, using a pool of `jobs` processes if jobs > 1.
+       Variants whose windows overlap are run together (see plan_variants).
+       Each result is saved to `cache` (a ResultCache) as soon as the variant finishes, and if
+       resume is set, variants already saved there with the same inputs aren't run again.
+       If given, on_result(i, variant, result, metrics, evidence) is called as each variant finishes.
+       Results are returned in the same order as `variants`"""
+    by_index = dict(variants)
+    results = {}
+
+    def finished(i, result):
+        results[i] = result
+        if on_result is not None:
+            on_result(i, by_index[i], *result)
+
+    if cache is not None and resume:
+        for i, variant in variants:
+            cached = cache.load(variant, variant.out_dir)
+            if cached is not None:
+                finished(i, tuple(cached))
+        print("Resuming: %s of %s variants already done" % (len(results), len(variants)))
+
+    groups = plan_variants([(i, variant) for i, variant in variants if i not in results])
+    shared = [group for group in groups if len(group[0]) > 1]
+    if shared:
+        print("Sharing region fetches between %s groups of %s overlapping variants" % (len(shared), sum(len(group[0]) for group in shared)))
+
+    if jobs > 1 and len(groups) > 1:
+        print("Processing %s variants using %s processes" % (sum(len(group[0]) for group in groups), jobs))
+        pool = Pool(min(jobs, len(groups)))
+        try:
+            for group_result in pool.imap_unordered(partial(run_group, cache=cache), groups):
+                for i, result, metrics, evidence in group_result:
+                    finished(i, (result, metrics, evidence))
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for group in groups:
+            for i, result, metrics, evidence in run_group(group, cache):
+                finished(i, (result, metrics, evidence))
+
+    return [(i, variant) + results[i] for i, variant in variants]
+
+
+def plan_variants(variants):
+    """Group variants whose breakpoint windows overlap in the same bam, so that each group's windows
+       are fetched from the bam once. Returns a list of (variants, bam, merged intervals).
+       Variants with a normal bam (counted by depth, without fetching windows) are left on their own"""
+    jobs = []
+    for i, variant in variants:
+        windows = []
+        if not variant.normal_bam:
+            try:
+                chrom1, bp1, chrom2, bp2 = getCooridinates(variant.region)
+                windows = [(chrom, max(0, bp - variant.slop), bp + variant.slop) for chrom, bp in [(chrom1, bp1), (chrom2, bp2)]]
+            except (ValueError, NameError):
+                pass
+        jobs.append((i, variant.in_file, windows))
+
+    by_index = dict(variants)
+    return [([(i, by_index[i]) for i in keys], bam, intervals) for keys, bam, intervals in plan_regions(jobs)]
+
+
+def run_group(group, cache=None):
+    """Run worker on a group of variants. If there are several, their windows are fetched once
+       into a RegionExtract that each of them reads from.
+       Returns (row, result, metrics, evidence) for each variant"""
+    variants, bam, intervals = group
+    if len(variants) == 1:
+        return [(variants[0][0],) + run_variant(variants[0], cache)]
+
+    group_metrics = Metrics()
+    with group_metrics.stage('shared_regions'):
+        extract = RegionExtract(bam, intervals)
+    group_metrics.add('shared_regions', fetch_calls=extract.fetch_calls, reads_fetched=extract.reads_fetched)
+
+    use_extract(extract)
+    try:
+        results = [(job[0],) + run_variant(job, cache) for job in variants]
+    finally:
+        release_extract(extract)
+
+    # The shared fetch is recorded against the first variant of the group
+    metrics = results[0][2]
+    metrics['stages']['shared_regions'] = group_metrics.stages['shared_regions']
+    metrics['seconds'] += group_metrics.stages['shared_regions']['seconds']
+    return results
+
+
+def run_variant(job, cache=None):
+    """Run worker on a single variant in its own scratch directory, then move
+       the bam files it leaves behind into the shared out_dir, saving the result
+       to `cache` if one is given. In counts only mode it's run without one.
+       Returns the worker result, and the metrics and evidence recorded for the variant"""
+    i, variant = job
+    options = copy.copy(variant)
+    out_dir = options.out_dir
+
+    start = time.time()
+    if options.counts_only:
+        # Nothing is written in counts only mode, so there's no scratch directory to make
+        result = worker(options)
+        files = []
+    else:
+        options.out_dir = os.path.join(out_dir, 'tmp_' + str(i))
+        make_dirs(options.out_dir)
+        try:
+            result = worker(options)
+            files = os.listdir(options.out_dir)
+            for f in files:
+                os.rename(os.path.join(options.out_dir, f), os.path.join(out_dir, f))
+        finally:
+            shutil.rmtree(options.out_dir, ignore_errors=True)
+
+    metrics = options.metrics.as_dict()
+    metrics['wall_seconds'] = time.time() - start
+    if cache is not None:
+        cache.save(variant, result, metrics, options.evidence, out_dir, files)
+    return result, metrics, options.evidence
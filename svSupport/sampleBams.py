@@ -0,0 +1,87 @@
+import os
+import glob
+from itertools import chain
+
+import pysam
+from merge_bams import sort_key, rm_position_dups, unsorted_header, sort_bam, merge_sorted, samtools_merge, rm_bams
+
+_sample_dir = None
+_writers = {}
+
+
+def set_sample_dir(out_dir):
+    """Set the directory the sample bams of variants run from now on are written to"""
+    global _sample_dir
+    _sample_dir = out_dir
+
+
+def sample_writer(kind, header):
+    """The (unsorted) bam this process appends the `kind` evidence of every variant it runs to.
+       Each process writes its own, so that no two processes write to the same file, and variants
+       from bams with different references (@SQ lines) are written to different files, so that
+       each read's reference ID means the same as in the bam it came from"""
+    pid = os.getpid()
+    key = (kind, pid, header_references(header))
+    if key not in _writers:
+        if _sample_dir is None:
+            raise ValueError("No directory set for the sample bams (see set_sample_dir)")
+        if not any(writer_key[1] == pid for writer_key in _writers):
+            # Pool processes don't return from their last variant, so close the bams as they exit
+            from multiprocessing.util import Finalize
+            Finalize(None, close_writers, exitpriority=10)
+        n = sum(writer_key[:2] == (kind, pid) for writer_key in _writers)
+        out_file = os.path.join(_sample_dir, 'evidence_%s_%s_%s.bam' % (kind, pid, n))
+        _writers[key] = pysam.AlignmentFile(out_file, "wb", header=unsorted_header(header))
+    return _writers[key]
+
+
+def header_references(header):
+    """The (name, length) of each reference of a header (AlignmentHeader or dict)"""
+    if isinstance(header, dict):
+        return tuple((line['SN'], line['LN']) for line in header.get('SQ', []))
+    return tuple(zip(header.references, header.lengths))
+
+
+def write_evidence(variant_id, kind, header, reads):
+    """Append a variant's reads (a list of lists of reads, e.g. one for each breakpoint) to the
+       sample's `kind` bam, each tagged with the variant's ID in 'VI'. As for the bams of a single
+       variant, duplicates, and reads with the same name and start, are only written once.
+       Returns the number of reads written"""
+    out = sample_writer(kind, header)
+    written = 0
+    for read in rm_position_dups(sorted(chain(*reads), key=sort_key)):
+        read.set_tag('VI', variant_id, value_type='Z')
+        out.write(read)
+        written += 1
+    return written
+
+
+def close_writers():
+    """Close the sample bams opened by this process. Those inherited from a parent are left
+       for the parent to close"""
+    pid = os.getpid()
+    for key in _writers.keys():
+        if key[1] == pid:
+            _writers.pop(key).close()
+
+
+def sort_sample_bam(kind, name, out_dir):
+    """Sort the `kind` evidence written by each process into '<name>.bam' in out_dir, and index it.
+       Reads are kept on their references by name (see merge_sorted). Returns None if no evidence was written"""
+    bams = sorted(glob.glob(os.path.join(out_dir, 'evidence_%s_*.bam' % kind)))
+    if not bams:
+        return
+    out_file = os.path.join(out_dir, name + '.bam')
+    print("Sorting %s evidence into '%s'" % (kind, out_file))
+    if len(bams) == 1:
+        sort_bam(out_dir, bams[0], out_file=out_file, presorted=False)
+    else:
+        s_bams = [sort_bam(out_dir, bam, index=False, presorted=False) for bam in bams]
+        try:
+            merge_sorted(out_file, s_bams, rm_dups=False)
+        except ValueError as err:
+            print("Can't merge in one pass: %s" % err)
+            samtools_merge(out_file, out_dir, s_bams)
+        rm_bams(s_bams)
+    rm_bams(bams)
+    return out_file
@@ -0,0 +1,133 @@
+import os
+import sys
+import copy
+import json
+import time
+import traceback
+import SocketServer
+
+from worker import worker
+from utils import make_dirs
+from bamPool import close_bams
+from api import result_fields
+
+# Request keys that don't share the name of the option they set
+request_options = {'bam': 'in_file', 'locus': 'region'}
+
+# Options that can't be changed by a request, as they're fixed when the server starts
+server_options = ['serve', 'socket', 'config', 'jobs', 'threads', 'test', 'resume', 'rescore', 'stream_out', 'sample_bams']
+
+
+class VariantServer(object):
+    """Answers variant queries in a single long running process, so that bam handles (and their
+       indexes), bam statistics and chromosome lists are loaded once and reused by every query.
+       Each query is a dict of options (e.g. bam, region, purity, sex) that override the options
+       the server was started with, and is answered with the fields returned by worker"""
+
+    def __init__(self, options):
+        self.options = options
+        self.queries = 0
+        self._bams = {}
+
+    def variant_options(self, request):
+        variant = copy.copy(self.options)
+        for key, value in request.items():
+            if key == 'id':
+                continue
+            option = request_options.get(key, key)
+            if option in server_options or not hasattr(self.options, option):
+                raise ValueError("Unknown option '%s'" % key)
+            setattr(variant, option, value)
+        if not variant.in_file or not variant.region:
+            raise ValueError("A bam and region are needed")
+        return variant
+
+    def check_bams(self, variant):
+        """Drop the open bam handles if any bam changed on disk since it was last used"""
+        for bam in variant.in_file, variant.normal_bam:
+            if not bam:
+                continue
+            bam = os.path.abspath(bam)
+            if not os.path.isfile(bam):
+                raise ValueError("Can't find bam %s" % bam)
+            stat = os.stat(bam)
+            key = stat.st_mtime, stat.st_size
+            if self._bams.get(bam, key) != key:
+                print("%s has changed. Reopening bams" % bam)
+                close_bams()
+            self._bams[bam] = key
+
+    def query(self, request):
+        response = {'id': request.get('id')}
+        start = time.time()
+        try:
+            variant = self.variant_options(request)
+            self.check_bams(variant)
+            make_dirs(variant.out_dir)
+            result = worker(variant)
+        except ValueError as err:
+            response['error'] = str(err)
+            return response
+        except Exception as err:
+            # Report the failure rather than stopping the server
+            traceback.print_exc()
+            response['error'] = "%s: %s" % (type(err).__name__, err)
+            return response
+
+        self.queries += 1
+        response.update(zip(result_fields, result))
+        response['seconds'] = time.time() - start
+        return response
+
+    def answer(self, line):
+        """Answer a line holding a json request with a line holding the json response"""
+        try:
+            request = json.loads(line)
+        except ValueError as err:
+            return json.dumps({'id': None, 'error': "Can't parse request: %s" % err}) + '\n'
+        if not isinstance(request, dict):
+            return json.dumps({'id': None, 'error': "Requests should be json objects"}) + '\n'
+        return json.dumps(self.query(request)) + '\n'
+
+    def serve_lines(self, lines, out):
+        """Answer each (non empty) line read from `lines` on `out`, until there are no more"""
+        for line in iter(lines.readline, ''):
+            if not line.strip():
+                continue
+            out.write(self.answer(line))
+            out.flush()
+
+
+class _Handler(SocketServer.StreamRequestHandler):
+
+    def handle(self):
+        self.server.variant_server.serve_lines(self.rfile, self.wfile)
+
+
+def serve(options):
+    """Answer json lines queries from stdin on stdout, or from connections to a unix socket
+       if options.socket is set. Worker's messages go to stderr, leaving stdout for responses"""
+    out = sys.stdout
+    sys.stdout = sys.stderr
+    variant_server = VariantServer(options)
+    try:
+        if options.socket:
+            if os.path.exists(options.socket):
+                os.remove(options.socket)
+            # Connections are handled one at a time, in this thread, so they all share its bam handles
+            socket_server = SocketServer.UnixStreamServer(options.socket, _Handler)
+            socket_server.variant_server = variant_server
+            print("Listening on %s" % options.socket)
+            try:
+                socket_server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                socket_server.server_close()
+                os.remove(options.socket)
+        else:
+            variant_server.serve_lines(sys.stdin, out)
+        print("Answered %s queries" % variant_server.queries)
+    finally:
+        close_bams()
+        sys.stdout = out
@@ -1,22 +1,35 @@
 #!/usr/bin/env python
 from __future__ import division
 import sys
+import json
 
-from parseConfig import parse_config
 from utils import make_dirs, cleanup
 from getArgs import get_args
 from worker import worker
+from bamPool import set_threads, close_bams
+from merge_bams import set_sort_options
 
 
 def main():
     options, args = get_args()
     make_dirs(options.out_dir)
+    set_threads(options.threads)
+    set_sort_options(options.sort_threads, options.sort_memory)
 
     if options.config:
-        cleanup(options.out_dir)
+        # Only config runs need pandas, so single variants don't pay for importing it
+        from parseConfig import parse_config
+        if not options.rescore:
+            cleanup(options.out_dir)
         parse_config(options)
         sys.exit()
 
+    elif options.serve:
+        # Imported here as single variant runs don't need it
+        from server import serve
+        serve(options)
+        return
+
     elif options.test:
         print()
         print("* Running in test mode...")
@@ -31,9 +44,13 @@ def main():
     if options.in_file and options.region:
         try:
             worker(options)
+            if options.debug:
+                print(json.dumps(options.metrics.as_dict(), indent=1))
         except IOError as err:
             sys.stderr.write("IOError " + str(err) + "\n")
             return
+        finally:
+            close_bams()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,34 @@
+import pysam
+
+header = {'HD': {'VN': '1.0', 'SO': 'coordinate'}, 'SQ': [{'SN': 'X', 'LN': 100000}, {'SN': 'Y', 'LN': 100000}]}
+
+
+def make_read(name, start, cigar='10M', tid=0, reverse=False, duplicate=False, mapq=60, sa=None, read_group=None, unmapped=False):
+    """A read for the tests to write to a bam (with `header`) or pass around directly.
+       Its sequence is as long as the cigar's query length. Without a cigar it has no sequence"""
+    read = pysam.AlignedSegment()
+    read.query_name = name
+    read.reference_id = tid
+    read.reference_start = start
+    read.mapping_quality = mapq
+    read.is_reverse = reverse
+    read.is_duplicate = duplicate
+    read.is_unmapped = unmapped
+    if cigar:
+        read.cigarstring = cigar
+        read.query_sequence = 'A' * read.infer_query_length()
+    if sa:
+        read.set_tag('SA', sa, value_type='Z')
+    if read_group:
+        read.set_tag('RG', read_group, value_type='Z')
+    return read
+
+
+def write_bam(bam, reads, bam_header=header, index=False):
+    """Write reads to bam in the order given, indexing it if index is set"""
+    with pysam.AlignmentFile(bam, 'wb', header=bam_header) as out:
+        for read in reads:
+            out.write(read)
+    if index:
+        pysam.index(bam)
+    return bam
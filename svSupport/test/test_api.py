@@ -0,0 +1,129 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+
+import pysam
+
+from svSupport import api
+from svSupport.api import evaluate_variant, evaluate_batch
+from svSupport.test import make_read
+
+repo = os.path.join(os.path.dirname(__file__), '..', '..')
+bam = os.path.join(repo, 'data', 'R3_del.bam')
+region = 'X:3135326-3139096'
+options = {'find_bps': True, 'slop': 500, 'chromfile': os.path.join(repo, 'chrom_lengths.txt'),
+           'nn_chroms': os.path.join(repo, 'non_native_chroms.txt')}
+
+
+class EvaluateVariant(unittest.TestCase):
+
+    def setUp(self):
+        self.out_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.out_dir)
+
+    def test_result(self):
+        stdout = sys.stdout
+        sys.stdout = captured = StringIO()
+        try:
+            result = evaluate_variant(pysam.AlignmentFile(bam), region, **options)
+        finally:
+            sys.stdout = stdout
+        self.assertEqual(captured.getvalue(), '')
+        self.assertEqual((result.bp1, result.bp2, result.type, result.configuration), (3135326, 3139096, 'DEL', '5to3'))
+        self.assertEqual((result.split_reads, result.disc_reads, result.allele_frequency), (15, 8, 0.45))
+        self.assertEqual((result.evidence['support'], result.evidence['oppose']), (23, 28))
+
+    def test_out_dir(self):
+        evaluate_variant(bam, region, out_dir=self.out_dir, **options)
+        self.assertIn('X_3135326_X_3139096_supporting.s.bam', os.listdir(self.out_dir))
+
+    def test_no_dir_for_counts(self):
+        """Nothing is written in counts only mode, so no directory (temporary or not) is made"""
+        made = []
+
+        def mkdtemp(*args, **kwargs):
+            made.append(mkdtemp_)
+            return mkdtemp_(*args, **kwargs)
+
+        mkdtemp_ = api.tempfile.mkdtemp
+        api.tempfile.mkdtemp = mkdtemp
+        cwd = os.getcwd()
+        os.chdir(self.out_dir)
+        try:
+            evaluate_variant(bam, region, **options)
+            evaluate_batch([{'bam': bam, 'region': region}] * 2, **options)
+        finally:
+            os.chdir(cwd)
+            api.tempfile.mkdtemp = mkdtemp_
+        self.assertEqual(made, [])
+        self.assertEqual(os.listdir(self.out_dir), [])
+
+    def test_unknown_option(self):
+        self.assertRaises(TypeError, evaluate_variant, bam, region, no_such_option=True)
+
+
+class EvaluateBatch(unittest.TestCase):
+
+    def test_matches_single(self):
+        variants = [{'bam': bam, 'region': region}, {'bam': bam, 'region': region, 'purity': 0.5}]
+        results = evaluate_batch(variants, **options)
+        single = evaluate_variant(bam, region, **options)
+        self.assertEqual(results[0][:9], single[:9])
+        self.assertEqual(results[1].allele_frequency, 0.9)
+
+
+def proper_pair(k, start, tlen):
+    reads = []
+    for flag, position, mate_position, template_length in (99, start, start + tlen - 100, tlen), (147, start + tlen - 100, start, -tlen):
+        read = make_read('pair_%s' % k, position, '100M')
+        read.flag = flag
+        read.next_reference_id = 0
+        read.next_reference_start = mate_position
+        read.template_length = template_length
+        reads.append(read)
+    return reads
+
+
+class BatchSlop(unittest.TestCase):
+    """Variants without a slop of their own should have it worked out from their bam, whatever the others in the batch use"""
+
+    @classmethod
+    def setUpClass(cls):
+        # The bundled bams are too small to sample insert sizes from, so 10000 proper pairs are added on 2L
+        cls.tmp = tempfile.mkdtemp()
+        cls.bam = os.path.join(cls.tmp, 'R3_del_pairs.bam')
+        pairs = []
+        for k in range(10000):
+            pairs += proper_pair(k, 1000 + 10 * k, 200 + 3 * (k % 200))
+        with pysam.AlignmentFile(bam) as samfile, pysam.AlignmentFile(cls.bam, 'wb', template=samfile) as out:
+            for read in sorted(pairs, key=lambda read: read.reference_start):
+                out.write(read)
+            for read in samfile.fetch(until_eof=True):
+                out.write(read)
+        pysam.index(cls.bam)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp)
+
+    def test_mixed_slop(self):
+        batch_options = dict(options, slop=None)
+        found_slop = evaluate_variant(self.bam, region, **batch_options)
+        narrow = evaluate_variant(self.bam, region, **dict(batch_options, slop=300))
+        self.assertNotEqual(narrow[:9], found_slop[:9])
+
+        results = evaluate_batch([{'bam': self.bam, 'region': region}, {'bam': self.bam, 'region': region, 'slop': 300}],
+                                 **batch_options)
+        self.assertEqual([result[:9] for result in results], [found_slop[:9], narrow[:9]])
+        results = evaluate_batch([{'bam': self.bam, 'region': region, 'slop': 300}, {'bam': self.bam, 'region': region}],
+                                 **batch_options)
+        self.assertEqual([result[:9] for result in results], [narrow[:9], found_slop[:9]])
+
+
+if __name__ == '__main__':
+    unittest.main()
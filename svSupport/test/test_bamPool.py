@@ -0,0 +1,60 @@
+import os
+import threading
+import unittest
+
+import pysam
+
+from svSupport import bamPool
+from svSupport.bamPool import open_bam, close_bams, set_threads
+
+bam = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'R3_del.bam')
+
+
+class BamPool(unittest.TestCase):
+    """Handles should be reused within a thread of a process, and never shared outside it"""
+
+    def tearDown(self):
+        close_bams()
+        set_threads(1)
+
+    def test_reused(self):
+        samfile = open_bam(bam)
+        self.assertIs(open_bam(os.path.abspath(bam)), samfile)
+        self.assertEqual(list(bamPool._handles), [(os.path.abspath(bam), os.getpid(), threading.current_thread().ident)])
+
+    def test_reopened_once_closed(self):
+        samfile = open_bam(bam)
+        samfile.close()
+        reopened = open_bam(bam)
+        self.assertIsNot(reopened, samfile)
+        self.assertTrue(reopened.is_open)
+
+    def test_per_thread(self):
+        samfile = open_bam(bam)
+        opened = []
+        thread = threading.Thread(target=lambda: opened.append(open_bam(bam)))
+        thread.start()
+        thread.join()
+        self.assertIsNot(opened[0], samfile)
+        self.assertEqual(len(bamPool._handles), 2)
+
+    def test_threads(self):
+        set_threads(2)
+        samfile = open_bam(bam)
+        self.assertEqual(len(list(samfile.fetch('X', 3135000, 3135100))),
+                         len(list(pysam.AlignmentFile(bam).fetch('X', 3135000, 3135100))))
+
+    def test_close_bams(self):
+        samfile = open_bam(bam)
+        # A handle inherited from a parent process (here, one with another pid) is dropped, but left open
+        inherited = pysam.AlignmentFile(bam)
+        bamPool._handles[(os.path.abspath(bam), -1, None)] = inherited
+        close_bams()
+        self.assertEqual(bamPool._handles, {})
+        self.assertFalse(samfile.is_open)
+        self.assertTrue(inherited.is_open)
+        inherited.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
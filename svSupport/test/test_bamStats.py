@@ -0,0 +1,86 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from svSupport import bamStats
+from svSupport.bamStats import BamStats, get_bam_stats
+
+bam = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'R3_del.bam')
+
+
+class Sidecar(unittest.TestCase):
+    """Statistics saved next to a bam should only be reused while the bam is unchanged"""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.bam = os.path.join(self.tmp, 'sample.bam')
+        shutil.copyfile(bam, self.bam)
+        shutil.copyfile(bam + '.bai', self.bam + '.bai')
+        self.sidecar = self.bam + '.svstats.json'
+        self.mapped = BamStats(self.bam).mapped_reads()
+
+    def tearDown(self):
+        bamStats._bam_stats.clear()
+        shutil.rmtree(self.tmp)
+
+    def edit_sidecar(self, **changes):
+        with open(self.sidecar) as sidecar:
+            stats = json.load(sidecar)
+        stats.update(changes)
+        with open(self.sidecar, 'w') as sidecar:
+            json.dump(stats, sidecar)
+
+    def test_saved_and_reused(self):
+        self.assertEqual(BamStats(self.bam, persist=True).mapped_reads(), self.mapped)
+        self.assertTrue(os.path.isfile(self.sidecar))
+        # Later runs take the statistics from the sidecar, without reading the bam
+        self.edit_sidecar(mapped={'X': 1})
+        self.assertEqual(BamStats(self.bam, persist=True).mapped_reads(), {'X': 1})
+
+    def test_bam_touched(self):
+        BamStats(self.bam, persist=True).mapped_reads()
+        self.edit_sidecar(mapped={'X': 1})
+        stat = os.stat(self.bam)
+        os.utime(self.bam, (stat.st_atime, stat.st_mtime + 10))
+        self.assertEqual(BamStats(self.bam, persist=True).mapped_reads(), self.mapped)
+        # The stale sidecar is replaced
+        with open(self.sidecar) as sidecar:
+            self.assertEqual(json.load(sidecar)['mapped'], self.mapped)
+
+    def test_bam_size_changed(self):
+        BamStats(self.bam, persist=True).mapped_reads()
+        with open(self.sidecar) as sidecar:
+            path, mtime, size = json.load(sidecar)['key']
+        self.edit_sidecar(key=[path, mtime, size + 1], mapped={'X': 1})
+        self.assertEqual(BamStats(self.bam, persist=True).mapped_reads(), self.mapped)
+
+    def test_corrupt_sidecar(self):
+        with open(self.sidecar, 'w') as sidecar:
+            sidecar.write('{"key": [')
+        stats = BamStats(self.bam, persist=True)
+        self.assertEqual(stats.mapped_reads(), self.mapped)
+        with open(self.sidecar) as sidecar:
+            self.assertEqual(json.load(sidecar)['key'], list(stats.key))
+
+    def test_cache_off(self):
+        BamStats(self.bam).mapped_reads()
+        self.assertFalse(os.path.isfile(self.sidecar))
+        # An existing sidecar is left alone, and not read
+        BamStats(self.bam, persist=True).mapped_reads()
+        self.edit_sidecar(mapped={'X': 1})
+        self.assertEqual(BamStats(self.bam).mapped_reads(), self.mapped)
+        with open(self.sidecar) as sidecar:
+            self.assertEqual(json.load(sidecar)['mapped'], {'X': 1})
+
+    def test_shared_per_bam(self):
+        stats = get_bam_stats(self.bam)
+        self.assertIs(get_bam_stats(self.bam), stats)
+        self.assertFalse(stats.persist)
+        self.assertIs(get_bam_stats(self.bam, persist=True), stats)
+        self.assertTrue(stats.persist)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import unittest
+from optparse import Values
+
+from svSupport.cigarOps import classify_cigar
+from svSupport.getReads import filterContamination, getClipped, leftClipped, rightClipped
+from svSupport.test import make_read
+
+bp = 1000
+options = Values({'debug': False})
+
+
+def cigar_read(cigar, start=bp - 50, reverse=False):
+    return make_read('read_' + str(cigar), start, cigar, reverse=reverse, unmapped=not cigar)
+
+
+class ClassifyCigar(unittest.TestCase):
+    """Test the clipping summary worked out from cigartuples"""
+
+    def test_unclipped(self):
+        self.assertEqual(classify_cigar(cigar_read('100M')), (0, 0, False, 100))
+
+    def test_left_clipped(self):
+        self.assertEqual(classify_cigar(cigar_read('10S90M')), (10, 0, False, 90))
+
+    def test_right_clipped(self):
+        self.assertEqual(classify_cigar(cigar_read('90M10S')), (0, 10, False, 90))
+
+    def test_hard_and_soft_clips_are_summed(self):
+        self.assertEqual(classify_cigar(cigar_read('5H3S90M2S')), (8, 2, True, 90))
+
+    def test_indels_between_clips(self):
+        """Reads clipped at both ends are double clipped whatever lies between the clips"""
+        self.assertEqual(classify_cigar(cigar_read('5S40M2I50M5S')), (5, 5, True, 90))
+
+    def test_aligned_span_includes_deletions(self):
+        self.assertEqual(classify_cigar(cigar_read('50M10D50M')).aligned_span, 110)
+
+    def test_unmapped(self):
+        self.assertEqual(classify_cigar(cigar_read(None)), (0, 0, False, 0))
+
+
+class Contamination(unittest.TestCase):
+    """Reads clipped at both ends are skipped, but only count as contamination
+       if both clips are >= 5 bps and the read is within 100 bps of the breakpoint"""
+
+    def test_unclipped_read_kept(self):
+        self.assertEqual(filterContamination(cigar_read('100M'), bp, options), (False, False))
+
+    def test_single_clipped_read_kept(self):
+        self.assertEqual(filterContamination(cigar_read('10S90M'), bp, options), (False, False))
+
+    def test_double_clipped_read_near_bp(self):
+        self.assertEqual(filterContamination(cigar_read('5S90M5S'), bp, options), (True, True))
+
+    def test_double_clipped_read_far_from_bp(self):
+        self.assertEqual(filterContamination(cigar_read('5S90M5S', start=bp - 500), bp, options), (True, False))
+
+    def test_short_clips_not_counted(self):
+        self.assertEqual(filterContamination(cigar_read('3S94M5S'), bp, options), (True, False))
+        self.assertEqual(filterContamination(cigar_read('5S94M3S'), bp, options), (True, False))
+
+
+class Clipped(unittest.TestCase):
+    """Test the breakpoint signatures given to clipped reads"""
+
+    def test_right_clipped_at_bp(self):
+        read = cigar_read('50M50S', start=bp - 50)
+        self.assertEqual(rightClipped(read, 'f', 'bp1', options), 'r_bp1')
+        self.assertEqual(leftClipped(read, 'f', 'bp1', options), None)
+
+    def test_left_clipped_at_bp(self):
+        read = cigar_read('50S50M', start=bp - 1)
+        self.assertEqual(leftClipped(read, 'r', 'bp2', options), 'bp2_r')
+        self.assertEqual(rightClipped(read, 'r', 'bp2', options), None)
+
+    def test_getClipped_counts_read_at_bp(self):
+        bp_sig, read_tags = {'r_bp1': 0}, {'read_50M50S': []}
+        read, bp_sig, split_reads, bpID, read_tags = getClipped(cigar_read('50M50S', start=bp - 50), bp, 'f', 'bp1', bp_sig, 0, options, read_tags)
+        self.assertEqual((bpID, split_reads, bp_sig['r_bp1']), ('r_bp1', 1, 1))
+        self.assertEqual(read.get_tag('SV'), 'clipped bp1 f read')
+
+    def test_getClipped_ignores_read_away_from_bp(self):
+        read, bp_sig, split_reads, bpID, read_tags = getClipped(cigar_read('50M50S', start=bp - 60), bp, 'f', 'bp1', {}, 0, options, {})
+        self.assertEqual((bpID, split_reads), (None, 0))
+
+    def test_getClipped_ignores_unclipped_read(self):
+        read, bp_sig, split_reads, bpID, read_tags = getClipped(cigar_read('100M', start=bp - 100), bp, 'f', 'bp1', {}, 0, options, {})
+        self.assertEqual((bpID, split_reads), (None, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
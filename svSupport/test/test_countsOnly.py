@@ -0,0 +1,53 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from svSupport.getArgs import get_args
+from svSupport.worker import worker
+
+repo = os.path.join(os.path.dirname(__file__), '..', '..')
+
+cases = [
+    ['-i', 'data/R3_del.bam', '-l', 'X:3135326-3139096', '-f'],
+    ['-i', 'data/R27_fim.bam', '-l', 'X:17286052-17293197', '-f'],
+    ['-i', 'data/R27_fim.bam', '-l', 'X:17294628-17311472', '-f'],
+    ['-i', 'data/del_region.bam', '-l', '3R:24856498-24856996', '-f'],
+    ['-i', 'data/R3_del.bam', '-l', 'X:3135326-3139096'],
+]
+
+
+class CountsOnly(unittest.TestCase):
+    """Counting without writing bams should give the same results as the default mode"""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        os.chdir(repo)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmp)
+
+    def run_case(self, args, out_dir):
+        options, _ = get_args(args + ['-s', '500', '-o', out_dir])
+        os.makedirs(out_dir)
+        result = worker(options)
+        written = sum(stage['reads_written'] for stage in options.metrics.stages.values())
+        return (result, options.evidence), written
+
+    def test_same_counts(self):
+        for n, args in enumerate(cases):
+            default, default_written = self.run_case(args, os.path.join(self.tmp, 'default_%s' % n))
+            counts_dir = os.path.join(self.tmp, 'counts_%s' % n)
+            counts, counts_written = self.run_case(args + ['--counts_only'], counts_dir)
+            self.assertEqual(counts, default, args)
+            # Nothing is written, so no reads should be counted as written
+            self.assertTrue(default_written)
+            self.assertEqual(counts_written, 0, args)
+            self.assertTrue(os.listdir(os.path.join(self.tmp, 'default_%s' % n)))
+            self.assertEqual(os.listdir(counts_dir), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import os
+import shutil
+import tempfile
+import unittest
+from multiprocessing import Pool
+from optparse import Values
+
+from svSupport.depthOps import region_depth, split_region, use_depth_pool
+from svSupport.test import make_read, write_bam
+
+cigars = ['100M', '100M', '10S90M', '5S90M5S', '90M10S', '50M10D50M', '100M', '3H94M3S']
+
+
+def make_bam(bam_file):
+    reads = [make_read('read_%s' % i, 1000 + i * 7, cigars[i % len(cigars)], mapq=0 if i % 5 == 0 else 60)
+             for i in range(2000)]
+    write_bam(bam_file, reads, index=True)
+
+
+class RegionDepth(unittest.TestCase):
+    """Reads with low mapq are skipped, and reads clipped at both ends counted as contamination.
+       Counting a region in chunks (and in other processes) should give the same counts as counting it in one go"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp()
+        cls.bam = os.path.join(cls.tmp, 'depth.bam')
+        make_bam(cls.bam)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp)
+
+    def depth(self, jobs=1, chunk=None, bp1=2000, bp2=14000):
+        options = Values({'debug': False, 'stats_cache': False, 'depth_jobs': jobs, 'depth_chunk': chunk})
+        return region_depth(self.bam, 'X', bp1, bp2, options)
+
+    def test_split_region(self):
+        self.assertEqual(split_region(0, 100, None), [(0, 100)])
+        self.assertEqual(split_region(0, 100, 100), [(0, 100)])
+        self.assertEqual(split_region(0, 100, 40), [(0, 40), (40, 80), (80, 100)])
+
+    def test_counts(self):
+        count, contamination_count, read_length = self.depth()
+        self.assertEqual((count, contamination_count), (1038, 345))
+        self.assertAlmostEqual(read_length, 100)
+
+    def test_chunked_counts_match(self):
+        expected = self.depth()
+        for jobs, chunk in [(1, 1000), (2, None), (3, 1000), (4, 333)]:
+            self.assertEqual(self.depth(jobs, chunk), expected, (jobs, chunk))
+
+    def test_not_in_pool_workers(self):
+        options = Values({'depth_jobs': 2})
+        self.assertTrue(use_depth_pool(options))
+        self.assertFalse(use_depth_pool(Values({'depth_jobs': 1})))
+        pool = Pool(1)
+        try:
+            self.assertFalse(pool.apply(use_depth_pool, (options,)))
+        finally:
+            pool.close()
+            pool.join()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from collections import defaultdict
+from optparse import Values
+
+import pysam
+
+from svSupport.findBreakpoints import find_breakpoints
+from svSupport.getReads import getClipped
+from svSupport.regionReads import RegionReads
+from svSupport.trackReads import TrackReads
+from svSupport.test import make_read, write_bam
+
+repo = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+
+# Bam, chromosome and breakpoints of the bundled variants
+variants = [
+    ('data/R3_del.bam', 'X', [3135326, 3139096]),
+    ('data/R27_fim.bam', 'X', [17286052, 17293197, 17294628, 17311472]),
+    ('data/del_region.bam', '3R', [24856498, 24856996]),
+    ('svSupport/test/data/test.bam', '3L', [9892365, 9894889]),
+]
+
+options = Values({'debug': False})
+
+
+def scan_each_position(regions, chrom, chrom2, bp, bp_number, options, cn):
+    """find_breakpoints as it was before the single pass sweep: the reads around
+       each position in the window are fetched, and duplicates removed, separately"""
+    bp_guess = {}
+    sv_type_guess = {}
+    read_tags = defaultdict(list)
+    window_size = 2000 if cn else 10
+
+    for i in range(bp - window_size, bp + window_size):
+        split_reads = 0
+        readSig = defaultdict(int)
+        duplicates = defaultdict(int)
+
+        for read in regions.fetch(chrom, i - 5, i + 5):
+            if not read.infer_read_length():
+                continue
+            dupObj = TrackReads(read, read, chrom, chrom2, duplicates)
+            duplicates, is_dup = dupObj.check_for_clipped_dup_no_mate()
+            if is_dup:
+                continue
+            direction = 'r' if read.is_reverse else 'f'
+            read, readSig, split_reads, bpID, read_tags = getClipped(read, i, direction, bp_number, readSig, split_reads, options, read_tags)
+
+        bp_guess[i] = split_reads
+        sv_type_guess[i] = readSig
+
+    bp_g = max(bp_guess, key=bp_guess.get)
+    svtype = sv_type_guess[bp_g]
+
+    if cn and bp_guess[bp_g] > 3:
+        bp = bp_g
+    elif not cn and bp_guess[bp_g] > bp_guess[bp] and bp_g != bp:
+        bp = bp_g
+
+    return bp, svtype
+
+
+def synthetic_reads(bp):
+    """Split reads around bp, including duplicates (same start, end and supplementary position)
+       clipped on either side, reads clipped at the edges of the window and a read without a CIGAR"""
+    return [
+        # Right clipped at bp + 3: two of the four are duplicates
+        make_read('right_1', bp + 3 - 90, '90M10S', sa='X,8001,+,90S10M,60,0;'),
+        make_read('right_dup', bp + 3 - 90, '90M10S', reverse=True, sa='X,8001,+,90S10M,60,0;'),
+        make_read('right_2', bp + 3 - 85, '85M15S', sa='X,8001,+,85S15M,60,0;'),
+        make_read('right_3', bp + 3 - 80, '80M20S', sa='X,8101,+,80S20M,60,0;'),
+        # Left clipped at bp + 1, with a read of the same span clipped on the right counted as its duplicate
+        make_read('left_1', bp, '10S90M', sa='X,2001,-,10M90S,60,0;'),
+        make_read('left_2', bp, '20S90M', sa='X,2021,-,20M90S,60,0;'),
+        make_read('left_dup', bp, '90M10S', sa='X,2001,-,90S10M,60,0;'),
+        make_read('left_3', bp, '15S90M', sa='X,2051,-,15M90S,60,0;'),
+        make_read('left_no_sa', bp, '30S70M'),
+        make_read('left_no_sa_2', bp, '30S70M'),
+        # At (and just outside) the edges of the window
+        make_read('edge_low', bp - 10 - 90, '90M10S', sa='X,9001,+,90S10M,60,0;'),
+        make_read('edge_low_out', bp - 11 - 90, '90M10S', sa='X,9001,+,90S10M,60,0;'),
+        make_read('edge_high', bp + 9 - 90, '90M10S', sa='X,9101,+,90S10M,60,0;'),
+        make_read('edge_high_out', bp + 10 - 90, '90M10S', sa='X,9201,+,90S10M,60,0;'),
+        make_read('no_cigar', bp - 2, None),
+        make_read('spanning', bp - 50, '100M'),
+    ]
+
+
+class FindBreakpoints(unittest.TestCase):
+    """The single pass sweep should find the same breakpoints (and signatures) as scanning each position"""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.stdout = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+
+    def tearDown(self):
+        sys.stdout.close()
+        sys.stdout = self.stdout
+        shutil.rmtree(self.tmp)
+
+    def compare(self, regions, chrom, bp, cn=False):
+        expected = scan_each_position(regions, chrom, chrom, bp, 'bp1', options, cn)
+        found = find_breakpoints(regions, chrom, chrom, bp, 'bp1', options, cn)
+        self.assertEqual((found[0], dict(found[1])), (expected[0], dict(expected[1])), (chrom, bp, cn))
+        return found
+
+    def test_bundled_bams(self):
+        for bam, chrom, bps in variants:
+            samfile = pysam.AlignmentFile(os.path.join(repo, bam))
+            regions = RegionReads(samfile, [(chrom, max(0, bp - 2500), bp + 2500) for bp in bps])
+            for bp in bps:
+                for offset in -12, -8, -3, 0, 2, 7, 11:
+                    self.compare(regions, chrom, bp + offset)
+            samfile.close()
+
+    def test_breakpoint_moved(self):
+        samfile = pysam.AlignmentFile(os.path.join(repo, 'data', 'R3_del.bam'))
+        regions = RegionReads(samfile, [('X', 3134826, 3135826)])
+        bp, svtype = self.compare(regions, 'X', 3135320)
+        self.assertEqual(bp, 3135326)
+        # Scanning 2000 bps either side, as for CNVs
+        self.compare(regions, 'X', 3135326, cn=True)
+        samfile.close()
+
+    def test_duplicates(self):
+        bp = 5000
+        bam = write_bam(os.path.join(self.tmp, 'split.bam'),
+                        sorted(synthetic_reads(bp), key=lambda read: read.reference_start), index=True)
+        samfile = pysam.AlignmentFile(bam)
+        regions = RegionReads(samfile, [('X', 0, 10000)])
+
+        # left_dup shares the span and supplementary position of left_1, so only five reads count at bp + 1
+        self.assertEqual(self.compare(regions, 'X', bp + 1), (bp + 1, {'bp1_r': 5}))
+        # right_dup is a duplicate of right_1, so three count at bp + 3: fewer than at bp + 1
+        self.assertEqual(self.compare(regions, 'X', bp + 3), (bp + 1, {'bp1_r': 5}))
+        for position in range(bp - 15, bp + 15):
+            self.compare(regions, 'X', position)
+        self.compare(regions, 'X', bp, cn=True)
+        samfile.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,168 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+import pysam
+
+from svSupport.merge_bams import merge_bams, merge_sorted, sort_key, rm_position_dups
+from svSupport.regionReads import rm_dups
+from svSupport.parseConfig import merge_sample_bams
+from svSupport.worker import rmDups
+from svSupport.test import header, make_read, write_bam
+
+
+def read_keys(bam):
+    with pysam.AlignmentFile(bam) as samfile:
+        return [(read.query_name, read.reference_start, read.is_duplicate) for read in samfile.fetch(until_eof=True)]
+
+
+class RmDups(unittest.TestCase):
+    """rmDups should drop the same reads as keeping every (reference, start, name) seen in the file would"""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def rm_dups(self, reads):
+        bam = write_bam(os.path.join(self.tmp, 'dirty.bam'), reads)
+        deduped, written = rmDups(bam, 'clean.bam', self.tmp)
+        with pysam.AlignmentFile(deduped) as samfile:
+            kept = [(read.query_name, read.reference_start) for read in samfile.fetch()]
+        self.assertEqual(written, len(kept))
+        return kept
+
+    def test_duplicates_removed(self):
+        reads = [make_read('a', 100), make_read('b', 100), make_read('a', 100),
+                 make_read('c', 100, duplicate=True), make_read('c', 100),
+                 make_read('a', 150), make_read('b', 200), make_read('b', 200)]
+        self.assertEqual(self.rm_dups(reads), [('a', 100), ('b', 100), ('a', 150), ('b', 200)])
+
+    def test_same_start_other_reference(self):
+        """Mates starting at the same position on different references aren't duplicates, for
+           rmDups or for the reads held by RegionReads"""
+        header_xy = dict(header, SQ=[{'SN': 'X', 'LN': 100000}, {'SN': 'Y', 'LN': 100000}])
+        reads = [make_read('a', 100), make_read('b', 100), make_read('a', 100), make_read('c', 150),
+                 make_read('a', 100, tid=1), make_read('b', 100, tid=1, duplicate=True), make_read('c', 150, tid=1)]
+        expected = [(0, 100, 'a'), (0, 100, 'b'), (0, 150, 'c'), (1, 100, 'a'), (1, 150, 'c')]
+
+        bam = write_bam(os.path.join(self.tmp, 'dirty.bam'), reads, header_xy)
+        deduped, written = rmDups(bam, 'clean.bam', self.tmp)
+        with pysam.AlignmentFile(deduped) as samfile:
+            self.assertEqual([(read.reference_id, read.reference_start, read.query_name) for read in samfile.fetch()], expected)
+        for kept in rm_dups(reads), list(rm_position_dups(reads)):
+            self.assertEqual([(read.reference_id, read.reference_start, read.query_name) for read in kept], expected)
+
+    def test_unsorted(self):
+        with self.assertRaises(ValueError):
+            self.rm_dups([make_read('a', 200), make_read('b', 100)])
+
+
+class MergeSorted(unittest.TestCase):
+    """Merging sorted bams in one pass should keep every read group and program, and drop the
+       same reads across files as rmDups does on the merged bam"""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.stdout = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+
+    def tearDown(self):
+        sys.stdout.close()
+        sys.stdout = self.stdout
+        shutil.rmtree(self.tmp)
+
+    def test_different_headers(self):
+        header_a = dict(header, RG=[{'ID': 'a', 'SM': 'A373R3'}],
+                        PG=[{'ID': 'bwa', 'PN': 'bwa', 'VN': '0.7.17'}])
+        header_b = dict(header, RG=[{'ID': 'a', 'SM': 'A373R3'}, {'ID': 'b', 'SM': 'A373R3'}],
+                        PG=[{'ID': 'bwa', 'PN': 'bwa', 'VN': '0.7.17'}, {'ID': 'samtools', 'PN': 'samtools'}])
+        bams = [write_bam(os.path.join(self.tmp, 'a.bam'), [make_read('a', 100, read_group='a')], header_a),
+                write_bam(os.path.join(self.tmp, 'b.bam'), [make_read('b', 50, read_group='b')], header_b)]
+        merged = merge_sorted(os.path.join(self.tmp, 'merged.bam'), bams)
+
+        with pysam.AlignmentFile(merged) as samfile:
+            merged_header = samfile.header.to_dict()
+            self.assertEqual([line['ID'] for line in merged_header['RG']], ['a', 'b'])
+            self.assertEqual([line['ID'] for line in merged_header['PG']], ['bwa', 'samtools'])
+            self.assertEqual([(read.query_name, read.get_tag('RG')) for read in samfile.fetch()], [('b', 'b'), ('a', 'a')])
+
+    def test_different_references(self):
+        """Reads should stay on the reference they were on, whatever its ID in the merged header"""
+        header_xy = dict(header, SQ=[{'SN': 'X', 'LN': 100000}, {'SN': 'Y', 'LN': 50000}])
+        header_y2l = dict(header, SQ=[{'SN': 'Y', 'LN': 50000}, {'SN': '2L', 'LN': 80000}])
+        mate_on_2l = make_read('c', 10, tid=0)
+        mate_on_2l.next_reference_id = 1
+        mate_on_2l.next_reference_start = 5
+        bams = [write_bam(os.path.join(self.tmp, 'xy.bam'), [make_read('a', 100), make_read('b', 50, tid=1)], header_xy),
+                write_bam(os.path.join(self.tmp, 'y2l.bam'), [mate_on_2l, make_read('c', 5, tid=1)], header_y2l)]
+        merged = merge_sorted(os.path.join(self.tmp, 'merged.bam'), bams)
+
+        with pysam.AlignmentFile(merged) as samfile:
+            self.assertEqual(samfile.references, ('X', 'Y', '2L'))
+            reads = list(samfile.fetch(until_eof=True))
+            self.assertEqual([(read.query_name, read.reference_name, read.reference_start) for read in reads],
+                             [('a', 'X', 100), ('c', 'Y', 10), ('b', 'Y', 50), ('c', '2L', 5)])
+            self.assertEqual(reads[1].next_reference_name, '2L')
+            self.assertEqual(list(samfile.fetch('Y')), reads[1:3])
+
+    def test_references_in_another_order(self):
+        header_xy = dict(header, SQ=[{'SN': 'X', 'LN': 100000}, {'SN': 'Y', 'LN': 50000}])
+        header_yx = dict(header, SQ=[{'SN': 'Y', 'LN': 50000}, {'SN': 'X', 'LN': 100000}])
+        bams = [write_bam(os.path.join(self.tmp, 'xy.bam'), [make_read('a', 100), make_read('b', 50, tid=1)], header_xy),
+                write_bam(os.path.join(self.tmp, 'yx.bam'), [make_read('c', 10), make_read('d', 20, tid=1)], header_yx)]
+        self.assertRaises(ValueError, merge_sorted, os.path.join(self.tmp, 'merged.bam'), bams)
+        self.assertFalse(os.path.exists(os.path.join(self.tmp, 'merged.bam')))
+
+        # merge_bams falls back to samtools merge, which maps references by name
+        merged = merge_bams(os.path.join(self.tmp, 'merged.bam'), self.tmp, bams)
+        with pysam.AlignmentFile(merged) as samfile:
+            self.assertEqual([(read.query_name, read.reference_name, read.reference_start) for read in samfile.fetch()],
+                             [('d', 'X', 20), ('a', 'X', 100), ('c', 'Y', 10), ('b', 'Y', 50)])
+        self.assertEqual(sorted(os.listdir(self.tmp)), ['merged.s.bam', 'merged.s.bam.bai'])
+
+    def test_reference_lengths_differ(self):
+        short_x = dict(header, SQ=[{'SN': 'X', 'LN': 5000}])
+        bams = [write_bam(os.path.join(self.tmp, 'x.bam'), [make_read('a', 100)]),
+                write_bam(os.path.join(self.tmp, 'short_x.bam'), [make_read('b', 100)], short_x)]
+        self.assertRaises(ValueError, merge_sorted, os.path.join(self.tmp, 'merged.bam'), bams)
+
+    def test_duplicates_across_files(self):
+        first = [make_read('a', 100), make_read('c', 100, duplicate=True), make_read('b', 150),
+                 make_read('e', 200), make_read('e', 200)]
+        second = [make_read('a', 100), make_read('c', 100), make_read('b', 150, duplicate=True),
+                  make_read('d', 150), make_read('d', 150, duplicate=True), make_read('e', 200, duplicate=True)]
+        bams = [write_bam(os.path.join(self.tmp, 'first.bam'), first),
+                write_bam(os.path.join(self.tmp, 'second.bam'), second)]
+
+        merged = merge_sorted(os.path.join(self.tmp, 'merged.bam'), bams)
+        self.assertEqual(read_keys(merged), [('a', 100, False), ('b', 150, False), ('d', 150, False), ('e', 200, False)])
+
+        # The same as merging everything, then removing duplicates from the merged bam
+        dirty = merge_sorted(os.path.join(self.tmp, 'dirty.bam'), bams, rm_dups=False)
+        self.assertEqual(len(read_keys(dirty)), len(first) + len(second))
+        deduped, written = rmDups(dirty, 'clean.bam', self.tmp)
+        self.assertEqual(read_keys(deduped), read_keys(merged))
+
+    def test_unsorted_input_falls_back(self):
+        """An input whose header says it's coordinate sorted when it isn't is sorted before merging"""
+        sorted_bam = write_bam(os.path.join(self.tmp, 'sorted.bam'), [make_read('a', 100), make_read('b', 300)])
+        unsorted_bam = write_bam(os.path.join(self.tmp, 'unsorted.bam'),
+                                 [make_read('d', 400), make_read('a', 100), make_read('c', 200, duplicate=True),
+                                  make_read('c', 50)])
+        merged = merge_sample_bams([sorted_bam, unsorted_bam], 'sample', self.tmp)
+
+        self.assertEqual(merged, os.path.join(self.tmp, 'sample.bam'))
+        self.assertEqual(sorted(os.listdir(self.tmp)), ['sample.bam', 'sample.bam.bai'])
+        with pysam.AlignmentFile(merged) as samfile:
+            reads = list(samfile.fetch())
+        self.assertEqual([(read.query_name, read.reference_start) for read in reads],
+                         [('c', 50), ('a', 100), ('b', 300), ('d', 400)])
+        self.assertEqual([sort_key(read) for read in reads], sorted(sort_key(read) for read in reads))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,175 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+
+from svSupport import parseConfig
+from svSupport.getArgs import get_args
+from svSupport.parseConfig import parse_config
+
+repo = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+data = os.path.join(repo, 'data')
+
+columns = ['event', 'sample', 'genotype', 'type', 'chromosome1', 'bp1', 'chromosome2', 'bp2', 'position', 'bam',
+           'normal_bam', 'tumour_purity', 'guess', 'sex', 'notes', 'status', 'log2(cnv)', 'configuration',
+           'split_reads', 'disc_reads', 'allele_frequency']
+
+# event, type, chromosome, bp1, bp2, bam, normal bam, purity, sex and notes of each config row
+variants = [
+    (1, 'DEL', 'X', 3135326, 3139096, 'R3_del.bam', '', 0.8, 'XY', '-'),
+    (2, 'DEL', 'X', 17286052, 17293197, 'R27_fim.bam', '', 1, 'XY', 'some note'),
+    (3, 'DEL', '3R', 24856498, 24856996, 'del_region.bam', '', 0.9, 'XX', '-'),
+    (4, 'DEL', 'X', 3135326, 3139096, 'R3_del.bam', 'R59_N_del.bam', 0.8, 'XY', '-'),
+]
+
+
+def write_config(config, rows=variants):
+    with open(config, 'w') as out:
+        out.write('\t'.join(columns) + '\n')
+        for event, sv_type, chrom, bp1, bp2, bam, normal_bam, purity, sex, notes in rows:
+            row = [event, 'A373R3', 'somatic_tumour', sv_type, chrom, bp1, chrom, bp2, '%s:%s-%s' % (chrom, bp1, bp2),
+                   os.path.join(data, bam), os.path.join(data, normal_bam) if normal_bam else '', purity,
+                   'T' if not normal_bam else '', sex, notes, '-', -1.2, '-', 0, 0, 0]
+            out.write('\t'.join(map(str, row)) + '\n')
+    return config
+
+
+class ParseConfig(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.config = write_config(os.path.join(self.tmp, 'A373R3_config.txt'))
+        self.out_file = os.path.join(self.tmp, 'A373R3_svSupport.txt')
+        self.stdout = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+
+    def tearDown(self):
+        sys.stdout.close()
+        sys.stdout = self.stdout
+        shutil.rmtree(self.tmp)
+
+    def run_config(self, *args):
+        out_dir = os.path.join(self.tmp, 'bams')
+        if not os.path.isdir(out_dir):
+            os.makedirs(out_dir)
+        options, _ = get_args(['-c', self.config, '-o', out_dir, '-v', self.out_file, '-s', '500',
+                               '--chromosomes', os.path.join(repo, 'chrom_lengths.txt'),
+                               '--non_native_chromosomes', os.path.join(repo, 'non_native_chroms.txt')] + list(args))
+        parse_config(options)
+        with open(self.out_file) as out:
+            return out.read()
+
+
+class Rescore(ParseConfig):
+    """Re-scoring from the evidence table should give what a full run does, and refuse evidence it can't use"""
+
+    def test_same_as_full_run(self):
+        full = self.run_config()
+        self.assertEqual(len(full.splitlines()), len(variants) + 1)
+        os.remove(self.out_file)
+        self.assertEqual(self.run_config('--rescore'), full)
+
+        # With a new purity, the same as a full run with that purity
+        rows = [row[:7] + (0.5,) + row[8:] for row in variants]
+        write_config(self.config, rows)
+        rescored = self.run_config('--rescore')
+        self.assertNotEqual(rescored, full)
+        self.assertEqual(self.run_config(), rescored)
+
+    def test_changed_bam(self):
+        self.run_config()
+        write_config(self.config, [variants[0][:5] + ('R27_fim.bam',) + variants[0][6:]] + variants[1:])
+        self.assertRaises(ValueError, self.run_config, '--rescore')
+        write_config(self.config, variants[:3] + [variants[3][:6] + ('',) + variants[3][7:]])
+        self.assertRaises(ValueError, self.run_config, '--rescore')
+
+    def test_changed_region(self):
+        self.run_config()
+        write_config(self.config, [variants[0][:3] + (3135320, 3139100) + variants[0][5:]] + variants[1:])
+        self.assertRaises(ValueError, self.run_config, '--rescore')
+
+    def test_other_version(self):
+        self.run_config()
+        evidence_file = os.path.join(self.tmp, 'A373R3_svSupport_evidence.txt')
+        with open(evidence_file) as table:
+            lines = table.readlines()
+        # A table from a version without the notes column
+        lines[0] = lines[0].replace('\tnotes', '')
+        with open(evidence_file, 'w') as table:
+            table.writelines(lines)
+        self.assertRaises(ValueError, self.run_config, '--rescore')
+
+
+class StreamOut(ParseConfig):
+    """Variants streamed to the output as they finish should be those written once all have finished"""
+
+    def test_matches_sorted_output(self):
+        expected = self.run_config()
+        streamed = self.run_config('--stream_out', '--jobs', '2')
+        self.assertEqual(streamed, expected)
+
+        # Keep the file as it stands after the last variant is streamed, before it's sorted and rewritten
+        merge_all = parseConfig.mergeAll
+        snapshot = []
+
+        def read_stream(options, sample):
+            with open(self.out_file) as out:
+                snapshot.append(out.read())
+            merge_all(options, sample)
+
+        parseConfig.mergeAll = read_stream
+        try:
+            self.run_config('--stream_out', '--jobs', '2')
+        finally:
+            parseConfig.mergeAll = merge_all
+        header, rows = snapshot[0].splitlines()[0], snapshot[0].splitlines()[1:]
+        self.assertEqual(header, expected.splitlines()[0])
+        self.assertEqual(sorted(rows), sorted(expected.splitlines()[1:]))
+
+
+class Resume(ParseConfig):
+    """Results are only saved for runs that can be resumed, and only until the run finishes"""
+
+    def run_interrupted(self, *args):
+        """Run every variant, then stop before the bams are merged"""
+        def interrupt(options, sample):
+            raise KeyboardInterrupt
+
+        merge_all = parseConfig.mergeAll
+        parseConfig.mergeAll = interrupt
+        try:
+            self.assertRaises(KeyboardInterrupt, self.run_config, *args)
+        finally:
+            parseConfig.mergeAll = merge_all
+
+    def cached(self):
+        with open(os.path.join(self.tmp, 'A373R3_svSupport_metrics.jsonl')) as metrics:
+            return [json.loads(line).get('cached', False) for line in metrics][:-1]
+
+    def test_not_saved_without_resume(self):
+        self.run_interrupted()
+        self.assertNotIn('variant_cache', os.listdir(os.path.join(self.tmp, 'bams')))
+        self.run_interrupted('--counts_only')
+        self.assertNotIn('variant_cache', os.listdir(os.path.join(self.tmp, 'bams')))
+        self.run_interrupted('--sample_bams', '--resume')
+        self.assertNotIn('variant_cache', os.listdir(os.path.join(self.tmp, 'bams')))
+
+    def test_resumed(self):
+        expected = self.run_config()
+
+        self.run_interrupted('--resume')
+        self.assertEqual(len(os.listdir(os.path.join(self.tmp, 'bams', 'variant_cache'))), 2 * len(variants))
+        self.assertEqual(self.run_config('--resume'), expected)
+        self.assertEqual(self.cached(), [True] * len(variants))
+        # Once finished, the saved results (and their links to the bams) are removed
+        self.assertNotIn('variant_cache', os.listdir(os.path.join(self.tmp, 'bams')))
+
+        self.run_config('--resume')
+        self.assertEqual(self.cached(), [False] * len(variants))
+        self.assertNotIn('variant_cache', os.listdir(os.path.join(self.tmp, 'bams')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+from optparse import Values
+
+from svSupport.readEvidence import ReadEvidence
+from svSupport.filterReads import supporting_add, supporting_remove
+from svSupport.test import make_read
+
+options = Values({'debug': False})
+
+
+class Registry(unittest.TestCase):
+    """Evidence should be recorded per read name, with each piece of evidence counted"""
+
+    def test_add_and_remove(self):
+        evidence = ReadEvidence()
+        evidence.add(make_read('a', 100), 'r_bp1')
+        evidence.add(make_read('a', 100), 'bp2_r')
+        evidence.add(make_read('b', 100), 'bp1_opposing')
+        self.assertIn('a', evidence)
+        self.assertNotIn('c', evidence)
+        self.assertEqual(len(evidence), 2)
+        self.assertEqual(sorted(evidence), ['a', 'b'])
+        self.assertEqual(evidence.evidence('a'), ['r_bp1', 'bp2_r'])
+        self.assertEqual(evidence.evidence('c'), [])
+
+        evidence.remove('a')
+        self.assertNotIn('a', evidence)
+        self.assertEqual(len(evidence), 1)
+        self.assertRaises(KeyError, evidence.remove, 'a')
+
+    def test_evidence_count(self):
+        evidence = ReadEvidence()
+        self.assertEqual(evidence.evidence_count(), 0)
+        evidence.add(make_read('a', 100), 'r_bp1')
+        evidence.add(make_read('a', 100), 'bp2_r')
+        evidence.add(make_read('b', 100), 'r_bp1')
+        self.assertEqual(evidence.evidence_count(), 3)
+        evidence.remove('a')
+        self.assertEqual(evidence.evidence_count(), 1)
+
+    def test_copy(self):
+        evidence = ReadEvidence()
+        evidence.add(make_read('a', 100), 'r_bp1')
+        copied = evidence.copy()
+        copied.add(make_read('a', 100), 'bp2_r')
+        copied.add(make_read('b', 100), 'r_bp1')
+        copied.remove('a')
+        # Neither the registry nor the evidence lists are shared with the copy
+        self.assertEqual(evidence.evidence('a'), ['r_bp1'])
+        self.assertNotIn('b', evidence)
+        self.assertEqual(ReadEvidence({'c': ('bp1_r',)}).evidence('c'), ['bp1_r'])
+
+
+class Supporting(unittest.TestCase):
+    """supporting_add records a read once, with the first reason it was found for, as the list of names it replaced did"""
+
+    def test_added_once(self):
+        su = ReadEvidence()
+        self.assertIs(supporting_add(make_read('a', 100), su, options, 'clipped read supporting breakpoint'), su)
+        supporting_add(make_read('a', 100), su, options, 'discordant read pair supporting DEL')
+        supporting_add(make_read('b', 100), su, options, 'discordant read pair supporting DEL')
+        self.assertEqual(len(su), 2)
+        self.assertEqual(su.evidence_count(), 2)
+        self.assertEqual(su.evidence('a'), ['clipped read supporting breakpoint'])
+
+    def test_remove(self):
+        su = ReadEvidence()
+        supporting_add(make_read('a', 100), su, options, 'clipped read supporting breakpoint')
+        self.assertIs(supporting_remove(make_read('b', 100), su, options, 'not supporting'), su)
+        self.assertEqual(len(su), 1)
+        supporting_remove(make_read('a', 100), su, options, 'not supporting')
+        self.assertNotIn('a', su)
+        # Added again once removed
+        supporting_add(make_read('a', 100), su, options, 'discordant read pair supporting DEL')
+        self.assertEqual(su.evidence('a'), ['discordant read pair supporting DEL'])
+
+
+if __name__ == '__main__':
+    unittest.main()
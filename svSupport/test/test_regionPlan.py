@@ -0,0 +1,41 @@
+import os
+import unittest
+
+import pysam
+
+from svSupport.regionPlan import plan_regions, RegionExtract
+
+bam = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'R3_del.bam')
+
+
+class PlanRegions(unittest.TestCase):
+
+    def test_overlapping_windows_grouped(self):
+        jobs = [(1, bam, [('X', 100, 200), ('X', 1000, 1100)]),
+                (2, bam, [('X', 5000, 5100), ('X', 6000, 6100)]),
+                (3, bam, [('X', 150, 250), ('2L', 0, 100)]),
+                (4, bam, [('X', 1050, 1150), ('X', 1200, 1300)])]
+        plan = plan_regions(jobs)
+        self.assertEqual([keys for keys, _, _ in plan], [[1, 3, 4], [2]])
+        self.assertEqual(plan[0][2], [('2L', 0, 100), ('X', 100, 250), ('X', 1000, 1150), ('X', 1200, 1300)])
+
+    def test_separate_bams(self):
+        plan = plan_regions([(1, bam, [('X', 100, 200)]), (2, 'other.bam', [('X', 100, 200)])])
+        self.assertEqual([keys for keys, _, _ in plan], [[1], [2]])
+
+
+class Extract(unittest.TestCase):
+    """Windows served from an extract should match fetching them from the bam"""
+
+    def test_fetch_matches_bam(self):
+        extract = RegionExtract(bam, [('X', 3134000, 3140000)])
+        samfile = pysam.AlignmentFile(bam)
+        for start, end in [(3134826, 3135826), (3135000, 3135001), (3138596, 3139596), (3134000, 3140000)]:
+            self.assertTrue(extract.covers([('X', start, end)]))
+            expected = [read.to_string() for read in samfile.fetch('X', start, end)]
+            self.assertEqual([read.to_string() for read in extract.fetch('X', start, end)], expected)
+        self.assertFalse(extract.covers([('X', 3133000, 3135000)]))
+
+
+if __name__ == '__main__':
+    unittest.main()
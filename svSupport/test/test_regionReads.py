@@ -0,0 +1,138 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import pysam
+
+from svSupport.regionReads import RegionReads, rm_dups
+from svSupport.test import make_read, write_bam
+
+bam = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'R3_del.bam')
+
+def names(reads):
+    return [(read.query_name, read.reference_start) for read in reads]
+
+
+class Fetch(unittest.TestCase):
+    """Reads held in memory should be fetched as they would be from the bam, once each"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp()
+        reads = [make_read('a', 100), make_read('long', 102, '5M2000N5M'), make_read('span', 105),
+                 make_read('b', 110), make_read('b', 110), make_read('dup', 110, duplicate=True),
+                 make_read('c', 120), make_read('d', 200), make_read('e', 150, tid=1)]
+        cls.bam = write_bam(os.path.join(cls.tmp, 'windows.bam'), reads, index=True)
+        cls.samfile = pysam.AlignmentFile(cls.bam)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.samfile.close()
+        shutil.rmtree(cls.tmp)
+
+    def test_half_open_end(self):
+        regions = RegionReads(self.samfile, [('X', 0, 1000)])
+        # 'a' ends at 110 and 'c' starts at 120, so neither overlaps 110-120
+        self.assertEqual(names(regions.fetch('X', 110, 120)), [('long', 102), ('span', 105), ('b', 110)])
+        for start, end in [(110, 120), (109, 110), (119, 121), (2000, 2200), (0, 100), (0, 101)]:
+            self.assertEqual(names(regions.fetch('X', start, end)), names(rm_dups(self.samfile.fetch('X', start, end))))
+
+    def test_overlapping_windows(self):
+        regions = RegionReads(self.samfile, [('X', 0, 115), ('X', 105, 300)])
+        self.assertEqual(names(regions.fetch()), [('a', 100), ('long', 102), ('span', 105), ('b', 110), ('c', 120), ('d', 200)])
+        # Reads in both windows are fetched twice, but kept once
+        self.assertEqual(regions.source_reads, 14)
+
+    def test_adjacent_windows(self):
+        regions = RegionReads(self.samfile, [('X', 0, 110), ('X', 110, 150), ('Y', 0, 1000)])
+        self.assertEqual(names(regions.fetch('X')), [('a', 100), ('long', 102), ('span', 105), ('b', 110), ('c', 120)])
+        self.assertEqual(names(regions.fetch('Y', 150, 151)), [('e', 150)])
+        self.assertEqual(names(regions.fetch('X', 200, 300)), [('long', 102)])
+        self.assertEqual(names(regions.fetch('X', 2200, 2300)), [])
+        self.assertRaises(ValueError, list, regions.fetch('Z', 0, 10))
+
+    def test_fetch_returns_copies(self):
+        regions = RegionReads(self.samfile, [('X', 0, 1000)])
+        for read in regions.fetch('X', 100, 120):
+            read.set_tag('SV', 'tagged', value_type='Z')
+            read.query_name = 'changed'
+            read.reference_start += 50
+        refetched = list(regions.fetch('X', 100, 120))
+        self.assertEqual(names(refetched), [('a', 100), ('long', 102), ('span', 105), ('b', 110)])
+        self.assertFalse(any(read.has_tag('SV') for read in refetched))
+
+    def test_matches_bam(self):
+        samfile = pysam.AlignmentFile(bam)
+        regions = RegionReads(samfile, [('X', 3134826, 3135826), ('X', 3135500, 3136500), ('X', 3138596, 3139596)])
+        for start, end in [(3135316, 3135336), (3135000, 3135001), (3135820, 3135830), (3138596, 3139596)]:
+            expected = [read.to_string() for read in rm_dups(samfile.fetch('X', start, end))]
+            self.assertEqual([read.to_string() for read in regions.fetch('X', start, end)], expected)
+
+
+class Mate(unittest.TestCase):
+    """mate should find the same read as pysam.AlignmentFile.mate does in the regions bam"""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.samfile = pysam.AlignmentFile(bam)
+
+    def tearDown(self):
+        self.samfile.close()
+        shutil.rmtree(self.tmp)
+
+    def mate(self, samfile, read):
+        try:
+            return samfile.mate(read).to_string()
+        except ValueError:
+            return None
+
+    def test_matches_pysam(self):
+        # The windows hold every read in the bam
+        regions = RegionReads(self.samfile, [('X', 3130000, 3140000), ('X', 3139000, 3150000)])
+        regions_bam = pysam.AlignmentFile(regions.write(os.path.join(self.tmp, 'regions.bam')))
+        held = set(read.to_string() for read in regions.fetch())
+
+        # pysam's mate is slow (it searches to the end of the reference), so only the reads around the breakpoints are checked
+        reads = list(self.samfile.fetch('X', 3135000, 3135600)) + list(self.samfile.fetch('X', 3139000, 3139700))
+        self.assertTrue([read for read in reads if read.reference_start == read.next_reference_start])
+
+        found = 0
+        for read in reads:
+            expected = self.mate(regions_bam, read)
+            self.assertEqual(self.mate(regions, read), expected, read.query_name)
+            # Mates held in the regions are the same as those pysam finds in the input bam
+            in_bam = self.mate(self.samfile, read)
+            if in_bam in held:
+                self.assertEqual(expected, in_bam, read.query_name)
+            found += expected is not None
+        self.assertTrue(found)
+        regions_bam.close()
+
+    def test_same_start(self):
+        """Mates sharing a start share a (name, start), so only the first of the pair is kept (as
+           rmDups did for the regions bam), and the mate of the one kept isn't found"""
+        regions = RegionReads(self.samfile, [('X', 3133000, 3134000)])
+        pair = [read for read in self.samfile.fetch('X', 3133410, 3133411)
+                if read.query_name == 'DB9GZKS1:371:HF2JVBCXX:2:1102:3533:78469']
+        self.assertEqual(len(pair), 2)
+        self.assertEqual(pair[0].reference_start, pair[0].next_reference_start)
+        self.assertEqual(self.mate(self.samfile, pair[1]), pair[0].to_string())
+
+        kept = [read for read in regions.fetch('X', 3133410, 3133411) if read.query_name == pair[0].query_name]
+        self.assertEqual([read.to_string() for read in kept], [pair[0].to_string()])
+        self.assertEqual(self.mate(regions, pair[1]), pair[0].to_string())
+        self.assertEqual(self.mate(self.samfile, pair[0]), pair[1].to_string())
+        self.assertIsNone(self.mate(regions, pair[0]))
+
+    def test_mate_outside_windows(self):
+        regions = RegionReads(self.samfile, [('X', 3135000, 3135500)])
+        read = next(read for read in regions.fetch() if not read.is_supplementary and read.next_reference_start > 3136000)
+        self.assertIsNone(self.mate(regions, read))
+
+        distant = RegionReads(self.samfile, [('X', 3135000, 3135500)], distant_mates=True)
+        self.assertEqual(self.mate(distant, read), self.mate(self.samfile, read))
+
+
+if __name__ == '__main__':
+    unittest.main()
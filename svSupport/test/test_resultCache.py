@@ -0,0 +1,60 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from optparse import Values
+
+from svSupport.resultCache import ResultCache
+
+
+class Cache(unittest.TestCase):
+    """Saved results should be reused only while the variant's inputs are unchanged"""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.out_dir = os.path.join(self.tmp, 'out')
+        os.makedirs(self.out_dir)
+        self.bam = os.path.join(self.tmp, 'in.bam')
+        with open(self.bam, 'w') as bam:
+            bam.write('bam')
+        self.cache = ResultCache(os.path.join(self.out_dir, 'variant_cache'))
+        self.options = Values({'in_file': self.bam, 'normal_bam': None, 'chromfile': None, 'nn_chroms': None,
+                               'region': 'X:100-200', 'purity': 1, 'find_bps': True, 'slop': 500})
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def save(self):
+        with open(os.path.join(self.out_dir, 'X_100_X_200_supporting.s.bam'), 'w') as out:
+            out.write('reads')
+        self.cache.save(self.options, [100, 200, 0.5], {'seconds': 1}, {'kind': 'reads'}, self.out_dir, ['X_100_X_200_supporting.s.bam'])
+        os.remove(os.path.join(self.out_dir, 'X_100_X_200_supporting.s.bam'))
+
+    def test_reused(self):
+        self.save()
+        result, metrics, evidence = self.cache.load(self.options, self.out_dir)
+        self.assertEqual(result, [100, 200, 0.5])
+        self.assertTrue(metrics['cached'])
+        self.assertTrue(os.path.isfile(os.path.join(self.out_dir, 'X_100_X_200_supporting.s.bam')))
+
+    def test_changed_options(self):
+        self.save()
+        self.options.slop = 600
+        self.assertIsNone(self.cache.load(self.options, self.out_dir))
+
+    def test_changed_bam(self):
+        self.save()
+        time.sleep(0.01)
+        with open(self.bam, 'w') as bam:
+            bam.write('new bam')
+        self.assertIsNone(self.cache.load(self.options, self.out_dir))
+
+    def test_cleared(self):
+        self.save()
+        self.cache.clear()
+        self.assertIsNone(self.cache.load(self.options, self.out_dir))
+
+
+if __name__ == '__main__':
+    unittest.main()
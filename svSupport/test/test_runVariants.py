@@ -0,0 +1,61 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+from svSupport.getArgs import get_args
+from svSupport.runVariants import run_variants
+
+repo = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+data = os.path.join(repo, 'data')
+
+# Config rows (deliberately out of order) and the variant of each
+cases = [
+    (7, ['-i', os.path.join(data, 'R27_fim.bam'), '-l', 'X:17294628-17311472', '-f']),
+    (2, ['-i', os.path.join(data, 'R3_del.bam'), '-l', 'X:3135326-3139096', '-f']),
+    (5, ['-i', os.path.join(data, 'del_region.bam'), '-l', '3R:24856498-24856996', '-f']),
+    (0, ['-i', os.path.join(data, 'R3_del.bam'), '-n', os.path.join(data, 'R59_N_del.bam'), '-l', 'X:3135326-3139096']),
+    (3, ['-i', os.path.join(data, 'R27_fim.bam'), '-l', 'X:17286052-17293197', '-f']),
+]
+
+
+class RunVariants(unittest.TestCase):
+    """Results should come back in the order the variants were given, whatever the number of jobs"""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.stdout = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+
+    def tearDown(self):
+        sys.stdout.close()
+        sys.stdout = self.stdout
+        shutil.rmtree(self.tmp)
+
+    def run_jobs(self, jobs):
+        out_dir = os.path.join(self.tmp, 'jobs_%s' % jobs)
+        os.makedirs(out_dir)
+        variants = []
+        for i, args in cases:
+            variant, _ = get_args(args + ['-s', '500', '-o', out_dir, '--sex', 'XY',
+                                          '--chromosomes', os.path.join(repo, 'chrom_lengths.txt'),
+                                          '--non_native_chromosomes', os.path.join(repo, 'non_native_chroms.txt')])
+            variants.append((i, variant))
+        return run_variants(variants, jobs), sorted(os.listdir(out_dir))
+
+    def test_order_and_jobs(self):
+        serial, serial_files = self.run_jobs(1)
+        parallel, parallel_files = self.run_jobs(3)
+
+        self.assertEqual([row[0] for row in serial], [i for i, args in cases])
+        self.assertEqual([row[0] for row in parallel], [i for i, args in cases])
+        self.assertEqual([row[1].region for row in parallel], [args[args.index('-l') + 1] for i, args in cases])
+        for (i, variant, result, metrics, evidence), row in zip(serial, parallel):
+            self.assertEqual((result, evidence), (row[2], row[4]), variant.region)
+        self.assertEqual(parallel_files, serial_files)
+        self.assertTrue(serial_files)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+import os
+import sys
+import shutil
+import tempfile
+import subprocess
+import unittest
+
+import pysam
+
+from svSupport import sampleBams
+from svSupport.api import evaluate_variant, evaluate_batch
+from svSupport.getArgs import get_args
+from svSupport.worker import worker
+from svSupport.merge_bams import sort_key, rm_position_dups
+
+repo = os.path.join(os.path.dirname(__file__), '..', '..')
+bam = os.path.join(repo, 'data', 'R3_del.bam')
+
+
+class SampleBams(unittest.TestCase):
+    """The evidence of every variant should end up in one sorted bam, tagged with its variant"""
+
+    def setUp(self):
+        self.out_dir = tempfile.mkdtemp()
+        sampleBams.set_sample_dir(self.out_dir)
+        self.samfile = pysam.AlignmentFile(bam)
+
+    def tearDown(self):
+        self.samfile.close()
+        shutil.rmtree(self.out_dir)
+
+    def test_write_and_sort(self):
+        bp1 = list(self.samfile.fetch('X', 3135300, 3135350))
+        bp2 = list(self.samfile.fetch('X', 3139080, 3139100))
+        kept1 = list(rm_position_dups(bp1))
+        kept2 = list(rm_position_dups(bp2))
+        # Reads at bp2 come first, and the reads at bp1 are given twice
+        written = sampleBams.write_evidence('X_1_X_2', 'supporting', self.samfile.header, [bp2, bp1, bp1])
+        self.assertEqual(written, len(kept1) + len(kept2))
+        sampleBams.write_evidence('X_3_X_4', 'supporting', self.samfile.header, [bp1])
+        sampleBams.close_writers()
+
+        out_file = sampleBams.sort_sample_bam('supporting', 'A_supporting', self.out_dir)
+        self.assertEqual(sorted(os.listdir(self.out_dir)), ['A_supporting.bam', 'A_supporting.bam.bai'])
+        with pysam.AlignmentFile(out_file) as sample:
+            reads = list(sample.fetch(until_eof=True))
+        self.assertEqual(len(reads), 2 * len(kept1) + len(kept2))
+        self.assertEqual([sort_key(read) for read in reads], sorted(sort_key(read) for read in reads))
+        self.assertEqual(sorted(read.query_name for read in reads if read.get_tag('VI') == 'X_3_X_4'),
+                         sorted(read.query_name for read in kept1))
+
+    def test_different_references(self):
+        """Variants from bams with other @SQ lines should keep their reads on the same references"""
+        bp1 = list(self.samfile.fetch('X', 3135300, 3135350))
+        x_length = self.samfile.get_reference_length('X')
+        only_x = {'HD': {'VN': '1.5', 'SO': 'coordinate'}, 'SQ': [{'SN': 'X', 'LN': x_length}]}
+        y_first = {'HD': {'VN': '1.5', 'SO': 'coordinate'}, 'SQ': [{'SN': 'Y', 'LN': 3667352}, {'SN': 'X', 'LN': x_length}]}
+        expected = {}
+        for kind, header in ('supporting', only_x), ('opposing', y_first):
+            sampleBams.write_evidence('X_1_X_2', kind, self.samfile.header, [bp1])
+            other = pysam.AlignmentHeader.from_dict(header)
+            reads = [pysam.AlignedSegment.from_dict(read.to_dict(), other) for read in bp1[:5]]
+            sampleBams.write_evidence('X_3_X_4', kind, other, [reads])
+            kept = list(rm_position_dups(bp1)) + list(rm_position_dups(reads))
+            expected[kind] = sorted((read.query_name, 'X', read.reference_start) for read in kept)
+        sampleBams.close_writers()
+        self.assertEqual(len(os.listdir(self.out_dir)), 4)
+
+        for kind in expected:
+            out_file = sampleBams.sort_sample_bam(kind, 'A_' + kind, self.out_dir)
+            with pysam.AlignmentFile(out_file) as sample:
+                reads = list(sample.fetch(until_eof=True))
+                self.assertEqual(sorted((read.query_name, read.reference_name, read.reference_start) for read in reads),
+                                 expected[kind], kind)
+                self.assertEqual(len(list(sample.fetch('X', 3135300, 3135350))), len(reads))
+
+    def test_nothing_written(self):
+        self.assertIsNone(sampleBams.sort_sample_bam('opposing', 'A_opposing', self.out_dir))
+
+    def run_variant(self, sample_bams=False):
+        out_dir = tempfile.mkdtemp(dir=self.out_dir)
+        options, _ = get_args(['-i', bam, '-l', 'X:3135326-3139096', '-f', '-s', '500', '-o', out_dir,
+                               '--chromosomes', os.path.join(repo, 'chrom_lengths.txt'),
+                               '--non_native_chromosomes', os.path.join(repo, 'non_native_chroms.txt')])
+        # As parse_config sets it for each variant of a config
+        options.sample_bams = sample_bams
+        with open(os.devnull, 'w') as devnull:
+            stdout, sys.stdout = sys.stdout, devnull
+            try:
+                worker(options)
+            finally:
+                sys.stdout = stdout
+        return dict((stage, record['reads_written']) for stage, record in options.metrics.stages.items())
+
+    def test_metrics(self):
+        """Reads kept in memory for the sample bams are counted as written, as they are to the variant's bams"""
+        default = self.run_variant()
+        written = self.run_variant(sample_bams=True)
+        sampleBams.close_writers()
+        for stage in 'get_regions', 'get_reads', 'filter_reads':
+            self.assertEqual(written[stage], default[stage], stage)
+        self.assertTrue(written['get_reads'])
+
+
+class SingleVariant(unittest.TestCase):
+    """Sample bams are only written by config runs, so asking for them elsewhere should fail clearly"""
+
+    def test_cli(self):
+        out_dir = tempfile.mkdtemp()
+        try:
+            cli = subprocess.Popen([sys.executable, os.path.join(repo, 'svSupport', 'svSupport.py'), '-i', bam,
+                                    '-l', 'X:3135326-3139096', '-f', '-s', '500', '-o', out_dir, '--sample_bams'],
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            stdout, stderr = cli.communicate()
+            self.assertEqual(cli.returncode, 2)
+            self.assertIn('--sample_bams can only be used with --config', stderr)
+            self.assertEqual(os.listdir(out_dir), [])
+        finally:
+            shutil.rmtree(out_dir)
+
+    def test_api(self):
+        self.assertRaises(ValueError, evaluate_variant, bam, 'X:3135326-3139096', sample_bams=True)
+        self.assertRaises(ValueError, evaluate_batch, [{'bam': bam, 'region': 'X:3135326-3139096'}], sample_bams=True)
+        self.assertRaises(ValueError, evaluate_batch, [{'bam': bam, 'region': 'X:3135326-3139096', 'sample_bams': True}])
+
+
+if __name__ == '__main__':
+    unittest.main()
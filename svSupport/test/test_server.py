@@ -0,0 +1,49 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+
+from svSupport.getArgs import get_args
+from svSupport.server import VariantServer
+
+data = os.path.join(os.path.dirname(__file__), '..', '..', 'data')
+
+
+class Server(unittest.TestCase):
+    """Queries should be answered with worker's results, one json line per request line"""
+
+    def setUp(self):
+        self.out_dir = tempfile.mkdtemp()
+        options, _ = get_args(['-o', self.out_dir, '-s', '500',
+                               '--chromosomes', os.path.join(data, '..', 'chrom_lengths.txt'),
+                               '--non_native_chromosomes', os.path.join(data, '..', 'non_native_chroms.txt')])
+        self.server = VariantServer(options)
+
+    def tearDown(self):
+        shutil.rmtree(self.out_dir)
+
+    def test_queries(self):
+        query = {'bam': os.path.join(data, 'R3_del.bam'), 'region': 'X:3135326-3139096', 'find_bps': True}
+        lines = [json.dumps(dict(query, id=1)), '', json.dumps(dict(query, id=2, purity=0.5)), 'not json']
+        out = StringIO()
+        self.server.serve_lines(StringIO('\n'.join(lines) + '\n'), out)
+
+        responses = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([response['id'] for response in responses], [1, 2, None])
+        self.assertEqual((responses[0]['bp1'], responses[0]['bp2'], responses[0]['type']), (3135326, 3139096, 'DEL'))
+        self.assertEqual((responses[0]['split_reads'], responses[0]['disc_reads']), (15, 8))
+        self.assertEqual(responses[0]['allele_frequency'], 0.45)
+        self.assertEqual(responses[1]['allele_frequency'], 0.9)
+        self.assertIn('error', responses[2])
+        self.assertEqual(self.server.queries, 2)
+
+    def test_bad_options(self):
+        response = self.server.query({'id': 'a', 'bam': os.path.join(data, 'R3_del.bam'), 'region': 'X:1-100', 'jobs': 4})
+        self.assertEqual(response, {'id': 'a', 'error': "Unknown option 'jobs'"})
+        self.assertIn('error', self.server.query({'region': 'X:1-100'}))
+
+
+if __name__ == '__main__':
+    unittest.main()
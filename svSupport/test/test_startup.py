@@ -0,0 +1,21 @@
+import os
+import subprocess
+import sys
+import unittest
+
+package = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+class Startup(unittest.TestCase):
+    """Single variant runs shouldn't load the modules only needed for config runs"""
+
+    def test_cli_import(self):
+        code = "import sys; sys.path.insert(0, %r); import svSupport; print(' '.join(sorted(sys.modules)))" % package
+        modules = subprocess.check_output([sys.executable, '-c', code]).split()
+        self.assertIn('worker', modules)
+        for module in ['pandas', 'parseConfig', 'multiprocessing']:
+            self.assertNotIn(module, modules)
+
+
+if __name__ == '__main__':
+    unittest.main()
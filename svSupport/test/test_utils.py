@@ -0,0 +1,46 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from svSupport.utils import get_chroms
+
+repo = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+
+
+class GetChroms(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_reread_when_changed(self):
+        chromfile = os.path.join(self.tmp, 'chroms.txt')
+        with open(chromfile, 'w') as out:
+            out.write('X\t23542271\n2L\n')
+        self.assertEqual(get_chroms(chromfile), {'X': '23542271', '2L': 1})
+        with open(chromfile, 'a') as out:
+            out.write('3R\t32079331\n')
+        self.assertEqual(get_chroms(chromfile), {'X': '23542271', '2L': 1, '3R': '32079331'})
+
+    def test_missing_file(self):
+        self.assertRaises(IOError, get_chroms, os.path.join(self.tmp, 'missing.txt'))
+
+    def test_missing_file_cli(self):
+        """A missing --chromosomes file is reported without a traceback"""
+        cli = subprocess.Popen([sys.executable, os.path.join(repo, 'svSupport', 'svSupport.py'),
+                                '-i', os.path.join(repo, 'data', 'R3_del.bam'), '-l', 'X:3135326-3139096',
+                                '-o', self.tmp, '--chromosomes', os.path.join(self.tmp, 'missing.txt')],
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        stdout, stderr = cli.communicate()
+        self.assertEqual(cli.returncode, 0)
+        self.assertNotIn('Traceback', stderr)
+        self.assertIn('missing.txt', stderr)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,8 @@
 import os
-import math
-from itertools import islice
 import pysam
+from bamStats import get_bam_stats, filterfn
+
+_chroms = {}
 
 
 def make_dirs(out_dir):
@@ -10,16 +11,21 @@ def make_dirs(out_dir):
 
 
 def get_chroms(chromfile):
-    """Read a file specifying native chromosomes"""
-    chroms = {}
+    """Read a file specifying native chromosomes. Each file is read once per process
+       (for as long as it's unchanged), and a copy of its chromosomes returned"""
     with open(chromfile) as c:
-        for line in c:
-            try:
-                chrom, length = line.strip().split()
-                chroms[chrom] = length
-            except ValueError:
-                chroms[line.strip()] = 1
-    return chroms
+        stat = os.fstat(c.fileno())
+        key = (os.path.abspath(chromfile), stat.st_mtime, stat.st_size)
+        if key not in _chroms:
+            chroms = {}
+            for line in c:
+                try:
+                    chrom, length = line.strip().split()
+                    chroms[chrom] = length
+                except ValueError:
+                    chroms[line.strip()] = 1
+            _chroms[key] = chroms
+    return dict(_chroms[key])
 
 
 def cleanup(out_dir):
@@ -49,20 +55,11 @@ def print_options(bam_in, ratio, chrom, bp1, bp2, find_bps, debug, test, out_dir
     print("--------")
 
 
-def filterfn(read):
-    """"Filter reads to ensure only properly paired, high quality reads are counted"""
-    return (read.is_proper_pair and read.is_paired and read.tlen > 0 and not read.is_supplementary and not read.is_duplicate and not read.is_unmapped and not read.mate_is_unmapped)
-
-
-def find_is_sd(bam_file, samplesize):
+def find_is_sd(bam_file, samplesize, persist=False):
     """"Get empirical insert size distribution and return mean + 5 * SD"""
-    bam = pysam.Samfile(bam_file, 'rb')
-    l = islice((read.tlen for read in bam if filterfn(read)), samplesize)
-    l = list(l)
-    assert len(l) == samplesize
-    mean = float(sum(l)) / len(l)
-    sdev = math.sqrt(float(sum([(x - mean) ** 2 for x in l])) / (len(l) - 1))
-    slop = int(mean + 5 * sdev)
+    sample = get_bam_stats(bam_file, persist).sample(samplesize)
+    assert sample['n'] == samplesize
+    slop = int(sample['mean'] + 5 * sample['sd'])
     print('Using slop equal to 5 standard deviations from insert size mean: {:.0f}'.format(slop))
     return slop
 
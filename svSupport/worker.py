@@ -1,7 +1,7 @@
 import re
 import json
+from collections import OrderedDict
 
-from collections import defaultdict
 from utils import *
 from classifyEvent import classify_sv, classify_cnv
 from getReads import get_reads
@@ -9,6 +9,12 @@ from depthOps import get_depth
 from findBreakpoints import find_breakpoints
 from calculate_allele_freq import AlleleFrequency
 from filterReads import filter_reads
+from regionReads import RegionReads
+from readEvidence import ReadEvidence
+from bamPool import open_bam
+from regionPlan import shared_extract
+from sampleBams import write_evidence
+from metrics import Metrics
 
 from merge_bams import *
 
@@ -42,6 +48,9 @@ def worker(options):
     find_bps = options.find_bps
 
     chrom1, bp1, chrom2, bp2 = getCooridinates(options.region)
+    options.metrics = metrics = Metrics()
+    # The writer of each bam written for the variant (see merge_bams.bam_writer)
+    options.writers = {}
 
     if debug:
         print_options(bam_in, normal, chrom1, bp1, bp2, find_bps, debug, options.test, out_dir)
@@ -59,32 +68,37 @@ def worker(options):
         nn_chroms = get_chroms(options.nn_chroms)
 
     if normal:
-        n_reads, t_reads, adj_ratio, notes = get_depth(bam_in, normal, chrom1, bp1, bp2, chroms, notes, options, chrom_dict)
-        af = AlleleFrequency(n_reads, t_reads, purity, chrom1, options.sex)
-        old_af, allele_frequency, adj_ratio, rd_ratio = af.read_depth_af()
-        cnv_type = classify_cnv(chrom1, adj_ratio, options.sex)
-
-        if notes: print(notes)
+        with metrics.stage('get_depth'):
+            n_reads, t_reads, adj_ratio, notes = get_depth(bam_in, normal, chrom1, bp1, bp2, chroms, notes, options, chrom_dict)
+        options.evidence = depth_evidence(chrom1, bp1, bp2, n_reads, t_reads, notes)
 
-        return bp1, bp2, old_af, allele_frequency, cnv_type, rd_ratio, notes, None, None
+        return score_evidence(options.evidence, purity, options.sex)
 
-    bp_regions, options.slop = get_regions(bam_in, chrom1, bp1, chrom2, bp2, out_dir, options, chrom_dict)
+    with metrics.stage('get_regions'):
+        bp_regions, options.slop = get_regions(bam_in, chrom1, bp1, chrom2, bp2, out_dir, options, chrom_dict)
+    # Windows served from a shared extract weren't fetched from the bam by this variant,
+    # and in counts only mode the regions bam isn't written
+    metrics.add('get_regions', fetch_calls=0 if bp_regions.shared else len(bp_regions.windows),
+                reads_fetched=0 if bp_regions.shared else bp_regions.source_reads,
+                reads_written=0 if options.counts_only else len(bp_regions))
 
+    bp1_split_sig, bp2_split_sig = {}, {}
     if options.find_bps:
-        bp1, bp1_split_sig = find_breakpoints(bp_regions, chrom1, chrom2, bp1, 'bp1', options, cn=False)
-        bp2, bp2_split_sig = find_breakpoints(bp_regions, chrom2, chrom2, bp2, 'bp2', options, cn=False)
+        with metrics.stage('find_breakpoints', bp_regions):
+            bp1, bp1_split_sig = find_breakpoints(bp_regions, chrom1, chrom2, bp1, 'bp1', options, cn=False)
+            bp2, bp2_split_sig = find_breakpoints(bp_regions, chrom2, chrom2, bp2, 'bp2', options, cn=False)
 
     seen_reads = []
-    supporting = []
-    opposing = []
+    supporting = ReadEvidence()
+    opposing = ReadEvidence()
     bp1_disc_sig, bp2_disc_sig = False, False
     bp1_integration, bp2_integration = False, False
     alien_integrant1, te_tagged1 = {}, {}
     if chrom1 in chroms:
-        bp1_clipped_bam, bp1_disc_bam, bp1_opposing_reads, alien_integrant1, te_tagged1, bp1_disc_sig, seen_reads, supporting, opposing, contaminated_reads, bp1_read_tags = get_reads(bp_regions, 'bp1', chrom1, chrom2, bp1, bp2, options, seen_reads, chroms, supporting, opposing)
+        with metrics.stage('get_reads', bp_regions):
+            bp1_clipped_bam, bp1_disc_bam, bp1_opposing_reads, alien_integrant1, te_tagged1, bp1_disc_sig, seen_reads, supporting, opposing, contaminated_reads, bp1_read_tags = get_reads(bp_regions, 'bp1', chrom1, chrom2, bp1, bp2, options, seen_reads, chroms, supporting, opposing)
+        metrics.add('get_reads', reads_written=reads_written([bp1_clipped_bam, bp1_disc_bam, bp1_opposing_reads], options))
     else:
-        supporting = []
-        opposing = []
         contaminated_reads = 0
         bp1_integration = True
         if options.nn_chroms and chrom1 not in nn_chroms:
@@ -95,12 +109,14 @@ def worker(options):
         n = ''.join(['contamination at bp1=', str(contaminated_reads)])
         notes.append(n)
 
-    s1 = list(supporting)
-    o1 = list(opposing)
+    s1 = supporting.copy()
+    o1 = opposing.copy()
     alien_integrant2, te_tagged2 = {}, {}
 
     if chrom2 in chroms:
-        bp2_clipped_bam, bp2_disc_bam, bp2_opposing_reads, alien_integrant2, te_tagged2, bp2_disc_sig, seen_reads, supporting, opposing, contaminated_reads, bp2_read_tags = get_reads(bp_regions, 'bp2', chrom2, chrom1, bp2, bp1, options, seen_reads, chroms, supporting, opposing)
+        with metrics.stage('get_reads', bp_regions):
+            bp2_clipped_bam, bp2_disc_bam, bp2_opposing_reads, alien_integrant2, te_tagged2, bp2_disc_sig, seen_reads, supporting, opposing, contaminated_reads, bp2_read_tags = get_reads(bp_regions, 'bp2', chrom2, chrom1, bp2, bp1, options, seen_reads, chroms, supporting, opposing)
+        metrics.add('get_reads', reads_written=reads_written([bp2_clipped_bam, bp2_disc_bam, bp2_opposing_reads], options))
     else:
         supporting = s1
         opposing = o1
@@ -160,24 +176,27 @@ def worker(options):
                 sv_type, configuration = '-', '-'
                 notes.append("missing bp sig")
 
-        print("Supporting reads before filtering: %s " % len(set(supporting)))
+        print("Supporting reads before filtering: %s " % len(supporting))
 
         read_tags = merge_two_dicts(bp1_read_tags, bp2_read_tags)
         print("Breakpoint signature : %s %s" % (bp1_sig, bp2_sig))
-        clean_disc_bam, supporting, disc_support, split_support = filter_reads(bp_regions, bp1, bp2, chrom1, chrom2, sv_type, options, supporting, opposing, bp1_sig, bp2_sig, read_tags)
+        with metrics.stage('filter_reads', bp_regions):
+            clean_disc_bam, supporting, disc_support, split_support = filter_reads(bp_regions, bp1, bp2, chrom1, chrom2, sv_type, options, supporting, opposing, bp1_sig, bp2_sig, read_tags)
+        metrics.add('filter_reads', reads_written=reads_written([clean_disc_bam], options))
 
         split_support = len(split_support)
         disc_support = len(disc_support)
 
-        rm_bams([bp1_disc_bam, bp2_disc_bam, bp1_clipped_bam, bp2_clipped_bam])
+        if not options.counts_only and not options.sample_bams:
+            rm_bams([bp1_disc_bam, bp2_disc_bam, bp1_clipped_bam, bp2_clipped_bam])
 
     else:
         disc_support = 0
-        split_support = len(supporting)
+        split_support = supporting.evidence_count()
 
     print("Variant is supported by %s split reads and %s discordant read pairs" % (split_support, disc_support))
     total_support = split_support + disc_support
-    total_oppose = len(set(opposing))
+    total_oppose = len(opposing)
     print("* Found %s reads in support of variant" % total_support)
     print("* Found %s reads opposing variant" % total_oppose)
 
@@ -187,28 +206,40 @@ def worker(options):
         n = ''.join(['low read support=', str(total_support)])
         notes.append(n)
 
-    af = AlleleFrequency(total_oppose, total_support, purity, chrom1, options.sex)
-    old_af, allele_frequency = af.read_support_af()
-
-    svID = '_'.join(map(str, [chrom1, bp1, chrom2, bp2]))
-    suout = os.path.join(out_dir, svID + '_supporting_dirty.bam')
-    opout = os.path.join(out_dir, svID + '_opposing.bam')
-
     if classify:
-        susorted = merge_bams(suout, out_dir, [clean_disc_bam])
-        merge_bams(opout, out_dir, [bp1_opposing_reads, bp2_opposing_reads])
+        su_bams, op_bams = [clean_disc_bam], [bp1_opposing_reads, bp2_opposing_reads]
     elif bp1_integration:
-        susorted = merge_bams(suout, out_dir, [bp2_clipped_bam, bp2_disc_bam])
-        merge_bams(opout, out_dir, [bp2_opposing_reads])
+        su_bams, op_bams = [bp2_clipped_bam, bp2_disc_bam], [bp2_opposing_reads]
     elif bp2_integration:
-        susorted = merge_bams(suout, out_dir, [bp1_clipped_bam, bp1_disc_bam])
-        merge_bams(opout, out_dir, [bp1_opposing_reads])
+        su_bams, op_bams = [bp1_clipped_bam, bp1_disc_bam], [bp1_opposing_reads]
     else:
-        susorted = merge_bams(suout, out_dir, [bp1_clipped_bam, bp2_clipped_bam, bp1_disc_bam, bp2_disc_bam])
-        merge_bams(opout, out_dir, [bp1_opposing_reads, bp2_opposing_reads])
+        su_bams, op_bams = [bp1_clipped_bam, bp2_clipped_bam, bp1_disc_bam, bp2_disc_bam], [bp1_opposing_reads, bp2_opposing_reads]
 
-    snodups = os.path.join(svID + '_supporting.s.bam')
-    rmDups(susorted, snodups, out_dir)
+    svID = '_'.join(map(str, [chrom1, bp1, chrom2, bp2]))
+
+    # In counts only mode nothing was written, so there are no evidence bams to merge. When
+    # writing sample bams the reads were kept in memory, and are added to the sample's bams
+    if options.sample_bams and not options.counts_only:
+        with metrics.stage('sample_bams'):
+            written = write_evidence(svID, 'supporting', bp_regions.header, [options.writers[bam].reads for bam in su_bams])
+            written += write_evidence(svID, 'opposing', bp_regions.header, [options.writers[bam].reads for bam in op_bams])
+        metrics.add('sample_bams', reads_written=written)
+
+    elif not options.counts_only:
+        suout = os.path.join(out_dir, svID + '_supporting_dirty.bam')
+        opout = os.path.join(out_dir, svID + '_opposing.bam')
+
+        # Merging keeps every read, so writes as many as were written to the bams merged
+        with metrics.stage('merge_bams'):
+            susorted = merge_bams(suout, out_dir, su_bams, index=False)
+            opsorted = merge_bams(opout, out_dir, op_bams)
+        metrics.add('merge_bams', reads_written=reads_written(su_bams + op_bams, options))
+
+        snodups = os.path.join(svID + '_supporting.s.bam')
+        metrics.add('rmDups', fetch_calls=1, reads_fetched=reads_written(su_bams, options))
+        with metrics.stage('rmDups'):
+            snodups, written = rmDups(susorted, snodups, out_dir)
+        metrics.add('rmDups', reads_written=written)
 
     alien1, te1 = assessIntegration(alien_integrant1, te_tagged1, 'bp1')
     alien2, te2 = assessIntegration(alien_integrant2, te_tagged2, 'bp2')
@@ -216,9 +247,47 @@ def worker(options):
     for integrant in alien1, te1, alien2, te2:
         add_note(notes, integrant)
 
+    options.evidence = read_evidence(chrom1, bp1, bp2, total_support, total_oppose, split_support, disc_support, sv_type, configuration, notes)
+
+    return score_evidence(options.evidence, purity, options.sex)
+
+
+def depth_evidence(chrom, bp1, bp2, normal_reads, tumour_reads, notes):
+    """The counts a CNV's allele frequency is worked out from (normal reads corrected
+       for the ratio of mapped reads in the tumour and normal bams)"""
+    return OrderedDict([('kind', 'depth'), ('chrom', chrom), ('bp1', bp1), ('bp2', bp2),
+                        ('normal_reads', normal_reads), ('tumour_reads', tumour_reads), ('notes', notes)])
+
+
+def read_evidence(chrom, bp1, bp2, support, oppose, split_reads, disc_reads, sv_type, configuration, notes):
+    """The counts an SV's allele frequency is worked out from, with its classification and notes"""
+    return OrderedDict([('kind', 'reads'), ('chrom', chrom), ('bp1', bp1), ('bp2', bp2),
+                        ('support', support), ('oppose', oppose), ('split_reads', split_reads), ('disc_reads', disc_reads),
+                        ('sv_type', sv_type), ('configuration', configuration), ('notes', notes)])
+
+
+def score_evidence(evidence, purity, sex):
+    """Work out the allele frequency (and for CNVs the type) of a variant from the evidence counted for it.
+       Nothing here depends on the bams, so variants can be re-scored for a new purity or sex.
+       Returns the same values as worker"""
+    notes = list(evidence['notes'])
+    chrom, bp1, bp2 = evidence['chrom'], evidence['bp1'], evidence['bp2']
+
+    if evidence['kind'] == 'depth':
+        af = AlleleFrequency(evidence['normal_reads'], evidence['tumour_reads'], float(purity), chrom, sex)
+        old_af, allele_frequency, adj_ratio, rd_ratio = af.read_depth_af()
+        cnv_type = classify_cnv(chrom, adj_ratio, sex)
+
+        if notes: print(notes)
+
+        return bp1, bp2, old_af, allele_frequency, cnv_type, rd_ratio, notes, None, None
+
+    af = AlleleFrequency(evidence['oppose'], evidence['support'], float(purity), chrom, sex)
+    old_af, allele_frequency = af.read_support_af()
+
     if notes: print(notes)
 
-    return bp1, bp2, old_af, allele_frequency, sv_type, configuration, notes, split_support, disc_support
+    return bp1, bp2, old_af, allele_frequency, evidence['sv_type'], evidence['configuration'], notes, evidence['split_reads'], evidence['disc_reads']
 
 
 def add_note(notes, s):
@@ -251,14 +320,16 @@ def assessIntegration(alien, te, bp_number):
 
 
 def get_regions(bam_in, chrom1, bp1, chrom2, bp2, out_dir, options, chrom_dict):
+    """Read the windows surrounding both breakpoints into memory, and write them
+       out once as the '_regions.s.bam' for this variant"""
     if not options.slop:
-        slop = find_is_sd(bam_in, 10000)
+        slop = find_is_sd(bam_in, 10000, options.stats_cache)
     else:
         slop = options.slop
 
-    downsample = False
-    samfile = pysam.Samfile(bam_in, "rb")
+    samfile = open_bam(bam_in)
     overlapping_windows = False
+    windows = []
 
     if chrom1 == chrom2 and bp2 - slop <= bp1 + slop:
         overlapping_windows = True
@@ -270,61 +341,29 @@ def get_regions(bam_in, chrom1, bp1, chrom2, bp2, out_dir, options, chrom_dict):
     else:
         bp1_window_start, bp1_window_end = check_windows(bp1, chrom1, slop, samfile, chrom_dict)
 
-    bp1_bam = os.path.join(out_dir, "bp1_region" + ".bam")
     if chrom1 not in chrom_dict:
         print("%s not in %s. Will not look for breakpoints in this region" % (chrom1, chrom_dict.keys()))
-        downsample = True
-        r_count = 0
-
-    with pysam.AlignmentFile(bp1_bam, "wb", template=samfile) as bp1_region:
-        if downsample:
-            bp1_region = None
-        else:
-            for read in samfile.fetch(chrom1, bp1_window_start, bp1_window_end):
-                if downsample:
-                    r_count += 1
-                    if r_count > 100: break
-                bp1_region.write(read)
-
-    downsample = False
+    else:
+        windows.append((chrom1, bp1_window_start, bp1_window_end))
 
     if overlapping_windows:
-        bps_bam = os.path.join(out_dir, "bp_regs" + ".bam")
-        regions = merge_bams(bps_bam, out_dir, [bp1_bam])
         bpID = '_'.join(map(str, [chrom1, bp1_window_start, chrom1, bp1_window_end]))
-        dups_rem = rmDups(regions, bpID + "_regions.bam", out_dir)
-        sorted_bam = sort_bam(out_dir, dups_rem)
-        rm_bams([dups_rem])
-        return sorted_bam, slop
     else:
         if chrom2 not in chrom_dict:
             print("%s not in %s. Will not look for breakpoints in this region" % (chrom2, chrom_dict.keys()))
-            downsample = True
-            r_count = 0
-
-        bp2_bam = os.path.join(out_dir, "bp2_region" + ".bam")
 
         bp2_window_start, bp2_window_end = check_windows(bp2, chrom2, slop, samfile, chrom_dict)
 
-        with pysam.AlignmentFile(bp2_bam, "wb", template=samfile) as bp2_region:
-            if downsample:
-                bp2_region = None
-            else:
-                for read in samfile.fetch(chrom2, bp2_window_start, bp2_window_end):
-                    if downsample:
-                        r_count += 1
-                        if r_count > 100: break
-                    bp2_region.write(read)
-
-        bps_bam = os.path.join(out_dir, "bp_regs" + ".bam")
-        regions = merge_bams(bps_bam, out_dir, [bp1_bam, bp2_bam])
+        if chrom2 in chrom_dict:
+            windows.append((chrom2, bp2_window_start, bp2_window_end))
 
         bpID = '_'.join(map(str, [chrom1, bp1_window_start, chrom2, bp2_window_end]))
-        dups_rem = rmDups(regions, bpID + "_regions.bam", out_dir)
-        sorted_bam = sort_bam(out_dir, dups_rem)
-        rm_bams([dups_rem])
 
-    return sorted_bam, slop
+    regions = RegionReads(samfile, windows, options.distant_mates, shared_extract(bam_in, windows))
+    if not options.counts_only:
+        regions.write(os.path.join(out_dir, bpID + "_regions.s.bam"))
+
+    return regions, slop
 
 
 def check_windows(bp, chrom, slop, samfile, chrom_dict):
@@ -350,23 +389,24 @@ def check_windows(bp, chrom, slop, samfile, chrom_dict):
 
 def rmDups(bamfile, outfile, out_dir):
     """Skip if read is marked as duplicate, or we see a read with the same name and starting position
-       (as will happen if we are merging close by regions) more than once"""
+       (as will happen if we are merging close by regions) more than once (see merge_bams.dup_key).
+       bamfile must be coordinate sorted, so that only the names at the current position need
+       remembering. Raises ValueError if it isn't. Returns the bam written and the number of reads in it"""
 
-    samfile = pysam.Samfile(bamfile, "rb")
     dups_rem = os.path.join(out_dir, outfile)
-    seen_reads = defaultdict(int)
 
-    with pysam.AlignmentFile(dups_rem, "wb", template=samfile) as out:
-        for read in samfile.fetch():
-            read_key = '_'.join([read.query_name, str(read.reference_start)])
-            seen_reads[read_key] += 1
-
-            if seen_reads[read_key] > 1 or read.is_duplicate:
-                continue
-
-            out.write(read)
+    try:
+        with pysam.AlignmentFile(bamfile, "rb") as samfile, pysam.AlignmentFile(dups_rem, "wb", template=samfile) as out:
+            reads = (read for key, file_index, n, read in sorted_reads(bamfile, samfile, 0))
+            written = 0
+            for read in rm_position_dups(reads):
+                out.write(read)
+                written += 1
+    except ValueError:
+        rm_bams([dups_rem])
+        raise
 
     rm_bams([bamfile])
     index_bam(dups_rem)
 
-    return dups_rem
\ No newline at end of file
+    return dups_rem, written
\ No newline at end of file